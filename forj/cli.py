@@ -1,24 +1,91 @@
-from os import chdir
+import os
 
 import click
 
-from .config import commands as config_commands
-from .docker import commands as docker_commands
-from .helm import commands as helm_commands
-from .python import commands as python_commands
-from .util import find_project_root
-from .version import commands as version_commands
+from . import trace
+from .config import root_env_var
+from .util import LazyGroup, find_project_root
 
 
-@click.group()
+class _Forj(LazyGroup):
+    """The top level group: times every run, and records it in the project's stats"""
+
+    def parse_args(self, ctx, args):
+        ctx.meta["forj.args"] = list(args)
+        return super().parse_args(ctx, args)
+
+    def command_name(self, ctx):
+        """Like "forj docker build": the (sub)commands named on the command line, options aside"""
+        words, cmd = ["forj"], self
+        for arg in ctx.meta.get("forj.args", ()):
+            if not isinstance(cmd, click.Group):
+                break
+            sub = None if arg.startswith("-") else cmd.get_command(ctx, arg)
+            if sub:
+                words.append(arg)
+                cmd = sub
+        return " ".join(words)
+
+    def invoke(self, ctx):
+        status = 1
+        try:
+            result = super().invoke(ctx)
+            status = 0
+            return result
+        except SystemExit as ex:
+            status = ex.code if isinstance(ex.code, int) else int(ex.code is not None)
+            raise
+        except (click.exceptions.Exit, click.ClickException) as ex:
+            status = ex.exit_code
+            raise
+        finally:
+            tracer = trace.finish(status=status)
+            if tracer and ctx.meta.get("forj.in_project"):
+                from .stats.stats import record  # pylint: disable=import-outside-toplevel
+
+                try:
+                    record(tracer, status)
+                except OSError as ex:
+                    click.secho(f"Warning: couldn't record stats: {ex}", fg="yellow", err=True)
+
+
+@click.group(
+    cls=_Forj,
+    # Subcommands get imported on demand so e.g. `forj version get` doesn't pay for the docker SDK
+    lazy_subcommands={
+        "config": ("forj.config.commands:commands", "Configure forj for your project"),
+        "docker": ("forj.docker.commands:commands", "Build, test, and manage your docker artifacts"),
+        "helm": ("forj.helm.commands:commands", "Various commands for helm charts."),
+        "python": ("forj.python.commands:commands", "Interact with your python repo"),
+        "run": ("forj.pipeline.commands:commands", "Run a pipeline of forj commands defined in .forjproject"),
+        "serve": ("forj.serve.commands:commands", "Run a background server that keeps forj warm for the CLI"),
+        "stats": ("forj.stats.commands:commands", "Report how long forj commands and their phases have been taking"),
+        "version": ("forj.version.commands:commands", "Manage your project's version"),
+    },
+)
+@click.option(
+    "--trace",
+    "trace_path",
+    type=click.Path(dir_okay=False),
+    envvar=trace.trace_env_var,
+    default=None,
+    help="Write a Chrome trace (for Perfetto) of where the time went to this file, and summarize it on exit",
+)
 @click.pass_context
-def main(ctx):
+def main(ctx, trace_path):
     """forj build tool
 
     Dig around and ask subcommands for help with `forj <command> --help`
     """
+    # Always timed, for `forj stats`; relative to where we were run from, not the project root
+    trace.start(os.path.abspath(trace_path) if trace_path else None, ctx.command.command_name(ctx))
     try:
-        chdir(find_project_root())
+        with trace.span("project root", "config"):
+            root = find_project_root()
+        os.chdir(root)
+        # So any forj we run (scripts, hooks, ...) in the project doesn't have to go looking again
+        os.environ[root_env_var] = str(root)
+        ctx.meta["forj.in_project"] = True
     except FileNotFoundError:
         # Don't warn users about their initfile if they're trying to configure it rn
         if ctx.invoked_subcommand != "config":
@@ -26,10 +93,3 @@ def main(ctx):
                 "Warning: can't find project initfile. (Have you run `forj config init` in your project root?)",
                 fg="yellow",
             )
-
-
-main.add_command(config_commands)
-main.add_command(docker_commands)
-main.add_command(python_commands)
-main.add_command(helm_commands)
-main.add_command(version_commands)
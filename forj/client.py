@@ -0,0 +1,106 @@
+"""The `forj` entry point: hand the command to a running `forj serve` if there is one
+
+A fresh forj process spends most of its time importing things and finding its feet. When `forj
+serve` is running, the command line, working directory and environment are sent over its Unix
+socket instead, and the output streamed back. If nothing's listening, forj just runs in-process.
+
+This module is imported on every invocation, so it sticks to the standard library.
+"""
+
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+# Set to anything to always run in-process
+no_daemon_env_var = "FORJ_NO_DAEMON"
+
+# Commands that need our terminal, or are about the server itself
+_IN_PROCESS = (["serve"], ["config"], ["docker", "shell"])
+# Options that make any command one to run in-process: watch modes run until stopped, and would
+# hold the server (which runs one command at a time) for as long
+_IN_PROCESS_OPTIONS = ("--watch",)
+
+
+def socket_path() -> Path:
+    """Where `forj serve` listens: under $XDG_RUNTIME_DIR if there is one, else the user cache dir"""
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "forj" / "serve.sock"
+    return Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "forj" / "serve.sock"
+
+
+def _wants_daemon(argv: List[str]) -> bool:
+    if os.getenv(no_daemon_env_var) or "_FORJ_COMPLETE" in os.environ:
+        return False
+    words = [arg for arg in argv if not arg.startswith("-")]
+    in_process = any(words[i : i + len(cmd)] == cmd for cmd in _IN_PROCESS for i in range(len(words)))
+    in_process = in_process or any(arg in _IN_PROCESS_OPTIONS for arg in argv)
+    return bool(words) and not in_process
+
+
+def send(request: dict, path: Optional[Path] = None) -> Optional[int]:
+    """Send a request to the server and relay what comes back; None if there's no server
+
+    Returns the command's exit status.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path or socket_path()))
+    except OSError:
+        sock.close()
+        return None
+
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode() + b"\n")
+        stream.flush()
+        for line in stream:
+            frame = json.loads(line)
+            if "exit" in frame:
+                return frame["exit"]
+            out = sys.stdout if "out" in frame else sys.stderr
+            out.write(frame.get("out", frame.get("err", "")))
+            out.flush()
+    # Too late to fall back: the command may well have done things already
+    sys.stderr.write("forj: lost the connection to `forj serve` before the command finished\n")
+    return 1
+
+
+def run(argv: List[str], path: Optional[Path] = None) -> Optional[int]:
+    """Run a forj command line on the server; None if there's no server"""
+    return send(
+        {
+            "argv": argv,
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+            "tty": sys.stdout.isatty(),
+        },
+        path,
+    )
+
+
+def main():
+    argv = sys.argv[1:]
+    if _wants_daemon(argv):
+        try:
+            status = run(argv)
+        except KeyboardInterrupt:
+            # Hanging up is what stops the command on the server's side
+            sys.exit(130)
+        if status is not None:
+            sys.exit(status)
+
+    from forj.cli import main as cli_main  # pylint: disable=import-outside-toplevel
+
+    cli_main()
+
+
+__all__ = (
+    "main",
+    "no_daemon_env_var",
+    "run",
+    "send",
+    "socket_path",
+)
@@ -1,2 +1,11 @@
 from .commands import commands
-from .config import Project, Static, get_config, find_project_config
+from .config import (
+    Project,
+    Static,
+    configfile_name,
+    get_config,
+    find_project_config,
+    forget_resolutions,
+    root_env_var,
+    state_dir_name,
+)
@@ -3,7 +3,7 @@ from pathlib import Path
 import click
 import json
 
-from .config import Project, configfile_name
+from .config import Project, configfile_name, forget_resolutions
 
 
 @click.group(name="config")
@@ -54,6 +54,8 @@ def init(path, project_name, chart_dir, docker_image_path):
         docker_path=docker_image_path,
     )
     f.dump(path / configfile_name)
+    # Directories that used to resolve to an enclosing project may now belong to this one
+    forget_resolutions()
 
 # The args here should be the same as above, except nothing required
 @commands.command()
@@ -1,16 +1,110 @@
 import json
 import os
-from dataclasses import asdict, dataclass
+import tempfile
+from dataclasses import MISSING, asdict, dataclass, field, fields
 from pathlib import Path
 
+from forj import trace
+
 configfile_name = Path(".forjproject")
+# forj's own per-project state (logs, caches, ...) lives here, next to the configfile
+state_dir_name = Path(".forj")
+# Set to skip looking for the project root; `forj` exports it so the forj processes it runs don't look again.
+# Only trusted from inside that root: it leaks into whatever else those processes run, too
+root_env_var = "FORJ_PROJECT_ROOT"
+
+# How many starting directories the resolution cache remembers
+_RESOLUTION_CACHE_SIZE = 64
+# Parsed configfiles, from the resolution cache or read while resolving
+_resolved = {}
+
+
+def _resolution_cache_path():
+    # forj.util imports this module, so it has to wait
+    from forj.util import user_cache_dir  # pylint: disable=import-outside-toplevel
+
+    return user_cache_dir() / "project-roots.json"
+
+
+def _read_resolutions():
+    try:
+        return json.loads(_resolution_cache_path().read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _stat_key(path):
+    st = path.stat()
+    return [st.st_mtime_ns, st.st_ino, st.st_size]
+
+
+def _cached_resolution(start):
+    """The configfile found from `start` last time, if the configfile hasn't changed since"""
+    entry = _read_resolutions().get(str(start))
+    if not entry:
+        return None
+    path = Path(entry["config"])
+    try:
+        if _stat_key(path) != entry["stat"]:
+            return None
+    except OSError:
+        return None
+    _resolved[path] = entry["data"]
+    return path
+
+
+def _remember_resolution(start, path, data):
+    try:
+        entries = _read_resolutions()
+        entries.pop(str(start), None)
+        entries[str(start)] = {"config": str(path), "stat": _stat_key(path), "data": data}
+        entries = dict(list(entries.items())[-_RESOLUTION_CACHE_SIZE:])
+        cache_path = _resolution_cache_path()
+        with tempfile.NamedTemporaryFile("wt", dir=cache_path.parent, delete=False) as f:
+            json.dump(entries, f)
+        os.replace(f.name, cache_path)
+    except OSError:
+        # Only a cache; a read-only home shouldn't stop anybody
+        pass
+
+
+def forget_resolutions():
+    """Drop the resolution cache, e.g. when a new project is initialized under an existing one"""
+    _resolved.clear()
+    try:
+        _resolution_cache_path().unlink()
+    except FileNotFoundError:
+        pass
 
 
 def find_project_config():
-    cur_dir = Path().resolve()
-    for p in (cur_dir, *cur_dir.parents):
+    """The configfile of the project we're in: `$FORJ_PROJECT_ROOT`'s, or the nearest one up from here
+
+    `$FORJ_PROJECT_ROOT` only counts when we're in that directory or under it. Otherwise it's been
+    inherited from a forj that's not ours (say, a script it ran went off to another project).
+
+    Lookups are cached per starting directory and trusted for as long as the configfile's mtime and
+    inode are unchanged, so repeated runs skip both the walk up the tree and parsing the file. A new
+    configfile appearing closer than the cached one goes unnoticed (`forj config init` clears the cache).
+    """
+    cwd = Path(os.getcwd())
+    override = os.getenv(root_env_var)
+    if override and not (cwd == Path(override).absolute() or Path(override).absolute() in cwd.parents):
+        override = None
+    start = Path(override).absolute() if override else cwd
+    cached = _cached_resolution(start)
+    if cached:
+        return cached
+
+    for p in (start,) if override else (start, *start.parents):
         if (p / configfile_name).is_file():
-            return p / configfile_name
+            path = p / configfile_name
+            with open(path, "r") as f:
+                _resolved[path] = json.load(f)
+            _remember_resolution(start, path, _resolved[path])
+            return path
+    if override:
+        raise FileNotFoundError(f"Can't find project configfile in {root_env_var} ({override})")
     raise FileNotFoundError("Can't find project configfile")
 
 
@@ -27,6 +121,10 @@ class Project:
     docker_path: str
     # Python module sources path
     python_module_path: str
+    # `forj run` pipelines: {pipeline: {step: {"run": "forj args", "needs": [steps], "inputs": [globs], "env": [vars]}}}
+    pipelines: dict = field(default_factory=dict)
+    # Docker layer cache: {"from": [refs, see `forj docker build --cache-from`], "to": "inline"}
+    docker_cache: dict = field(default_factory=dict)
 
     def dump(self, path):
         with open(path, "w") as f:
@@ -46,8 +144,9 @@ class Project:
 
     @classmethod
     def get_missing(cls, keys: {str}):
-        """Return which dataclass fields are missing from a set of keys"""
-        return set(cls.__dataclass_fields__.keys()) - set(keys)
+        """Return which required dataclass fields are missing from a set of keys"""
+        required = {f.name for f in fields(cls) if f.default is MISSING and f.default_factory is MISSING}
+        return required - set(keys)
 
 
 @dataclass
@@ -65,7 +164,9 @@ def get_config():
     global _project
     if not _project:
         try:
-            _project = Project.load(find_project_config())
+            with trace.span("project config", "config"):
+                path = find_project_config()
+                _project = Project(**_resolved[path]) if path in _resolved else Project.load(path)
         except TypeError:
             raise TypeError("Unable to load project config. Maybe you need to `forj config init` or `for config upgrade`?")
     return _project, _static
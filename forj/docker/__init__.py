@@ -1,2 +1,2 @@
 from .commands import commands
-from .docker import build, shell, test
+from .docker import build, run_script, shell, test
@@ -0,0 +1,141 @@
+"""Streaming consumer for docker build output
+
+The docker SDK's high-level `images.build` holds on to the whole log and only hands it back once the
+build is over. This follows the low-level API's JSON stream instead: it echoes output as it arrives,
+writes all of it to a file, keeps only a bounded tail in memory, and times each Dockerfile step.
+"""
+
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import click
+
+_STEP_RE = re.compile(r"^Step (\d+/\d+) : (.*)$")
+_BUILT_RE = re.compile(r"(?:^Successfully built |sha256:)([0-9a-f]+)$")
+
+
+@dataclass
+class Step:
+    """One Dockerfile instruction as it went by in the build output"""
+
+    number: str
+    instruction: str
+    started: float = field(default_factory=time.monotonic)
+    finished: Optional[float] = None
+    cached: bool = False
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+
+class BuildLog:
+    """Follow a docker build's decoded JSON stream
+
+    Use as a context manager and `feed` it each chunk from `APIClient.build(..., decode=True)`.
+    Afterwards, `error` is set if the build failed and `tail` holds the last `tail_lines` lines.
+    """
+
+    def __init__(self, log_path: Path, tail_lines: int = 200, prefix: str = "", echo: bool = True):
+        self.log_path = Path(log_path)
+        self.tail = deque(maxlen=tail_lines)
+        self.prefix = prefix
+        self.echo = echo
+        self.steps = []
+        self.error = None
+        self.image_id = None
+        self._partial = ""
+        self._log_file = None
+
+    def __enter__(self):
+        self._log_file = open(self.log_path, "wt", encoding="utf-8")
+        return self
+
+    def __exit__(self, *exc_info):
+        self._flush_partial()
+        if self.steps and self.steps[-1].finished is None:
+            self.steps[-1].finished = time.monotonic()
+        self._log_file.close()
+
+    def feed(self, chunk: dict):
+        if "error" in chunk:
+            self.error = chunk["error"].strip()
+            self._line(self.error, fg="red")
+        elif "stream" in chunk:
+            # Stream chunks don't necessarily end on line boundaries
+            text = self._partial + chunk["stream"]
+            *lines, self._partial = text.split("\n")
+            for line in lines:
+                self._line(line)
+        elif "status" in chunk and "progress" not in chunk:
+            # Pull progress bars would drown everything else out, but status lines are useful
+            self._line(" ".join(filter(None, (chunk.get("id"), chunk["status"]))))
+        if "aux" in chunk and "ID" in chunk["aux"]:
+            self.image_id = chunk["aux"]["ID"]
+
+    def _flush_partial(self):
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+
+    def _line(self, line: str, fg: Optional[str] = None):
+        line = line.rstrip("\r")
+        self._log_file.write(line + "\n")
+        self.tail.append(line)
+
+        step = _STEP_RE.match(line)
+        if step:
+            now = time.monotonic()
+            if self.steps and self.steps[-1].finished is None:
+                self.steps[-1].finished = now
+            self.steps.append(Step(step.group(1), step.group(2), started=now))
+        elif line.strip() == "---> Using cache" and self.steps:
+            self.steps[-1].cached = True
+        else:
+            built = _BUILT_RE.search(line.strip())
+            if built and not self.image_id:
+                self.image_id = built.group(1)
+
+        if self.echo:
+            click.secho(f"{self.prefix}{line}", fg=fg)
+
+    def print_failure(self):
+        click.secho(f"{self.prefix}Build failure:", fg="red")
+        click.echo(f"{self.prefix}{self.error}")
+        click.secho(f"{self.prefix}Last {len(self.tail)} lines of output:", fg="red")
+        for line in self.tail:
+            click.echo(f"{self.prefix}  {line}")
+        click.secho(f"{self.prefix}Full log: {self.log_path}", fg="red")
+
+    @property
+    def cache_summary(self) -> str:
+        """Like "3/4 cached (75%)", or "" if no steps went by"""
+        if not self.steps:
+            return ""
+        hits = sum(step.cached for step in self.steps)
+        return f"{hits}/{len(self.steps)} cached ({hits * 100 // len(self.steps)}%)"
+
+    def print_summary(self):
+        if not self.steps:
+            return
+        click.secho(
+            f"{self.prefix}Build steps ({self.cache_summary}, full log: {self.log_path}):",
+            fg="bright_magenta",
+        )
+        width = max(len(step.number) for step in self.steps)
+        for step in self.steps:
+            cache = "hit " if step.cached else "miss"
+            click.secho(
+                f"{self.prefix}  {step.number:>{width}}  {step.duration:7.1f}s  {cache}  {step.instruction}",
+                fg="magenta",
+            )
+
+
+__all__ = (
+    "BuildLog",
+    "Step",
+)
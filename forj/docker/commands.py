@@ -1,10 +1,18 @@
 import click
-import docker
 
 from .docker import shell as docker_shell
-from .docker import test as docker_test
+from .context import dockerfile_targets
+from .layers import parse_size
 from .impl import build as build_impl
+from .impl import build_many as build_many_impl
+from .impl import context_report as context_report_impl
+from .impl import down as down_impl
+from .impl import up as up_impl
 from .impl import get_docker_image
+from .impl import inspect_layers as inspect_layers_impl
+from .impl import push as push_impl
+from .impl import test as test_impl
+from .impl import test_watch as test_watch_impl
 
 
 @click.group(name="docker")
@@ -15,14 +23,54 @@ def commands():
 @commands.command()
 @click.option(
     "--target",
+    "targets",
     type=str,
-    default="dev",
-    help='A Dockerfile target to build (Default: "dev")',
+    multiple=True,
+    default=["dev"],
+    help='A Dockerfile target to build; repeat to build several at once (Default: "dev")',
+)
+@click.option(
+    "--all-targets",
+    is_flag=True,
+    help="Build every named stage (`FROM ... AS name`) in the Dockerfile",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="How many targets to build at once (Default: up to 4)",
+)
+@click.option(
+    "--force-build",
+    is_flag=True,
+    help="Build even if the local image is up to date with the build context",
+)
+@click.option(
+    "--cache-from",
+    type=str,
+    multiple=True,
+    help='Import layer cache from this image; "auto" for earlier pushes of the target, a bare tag for a tag '
+    "of its image; repeat for several (Default: docker_cache.from in .forjproject)",
 )
-def build(target):
+@click.option(
+    "--cache-to",
+    type=click.Choice(["inline"]),
+    default=None,
+    help="Embed layer cache metadata in the image, so pushing it makes it a cache source (Default: docker_cache.to)",
+)
+def build(targets, all_targets, jobs, force_build, cache_from, cache_to):
     """Build a docker container"""
     # TODO we should reevaluate this on scale-out since multi-stage builds are not universal
-    build_impl(target)
+    if all_targets:
+        targets = dockerfile_targets()
+        if not targets:
+            raise click.UsageError("The Dockerfile has no named (`FROM ... AS name`) stages")
+    targets = list(dict.fromkeys(targets))
+    if len(targets) == 1:
+        build_impl(targets[0], force=force_build, cache_from=cache_from, cache_to=cache_to)
+    else:
+        build_many_impl(targets, force=force_build, jobs=jobs, cache_from=cache_from, cache_to=cache_to)
 
 
 @commands.command(
@@ -55,30 +103,115 @@ def shell(target, cmd):
     default="dev",
     help='A Dockerfile target to build (Default: "dev")',
 )
-def push(target: str):
-    """Push a docker image built from a particular TARGET"""
-    image, tag = get_docker_image(target)
-    docker_client = docker.from_env()
-
-    click.secho("docker push", fg="bright_magenta")
-    click.secho(f"  image: {image}:{tag}", fg="magenta")
+@click.option(
+    "--tag",
+    "tags",
+    type=str,
+    multiple=True,
+    help="Another tag to push the image as; repeat for several (the version tag is always pushed)",
+)
+@click.option(
+    "--content-tag",
+    is_flag=True,
+    help="Also push a tag derived from the build context fingerprint (ctx-<hash>)",
+)
+@click.option("--latest", is_flag=True, help='Also push the "latest" tag')
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.IntRange(min=1),
+    default=None,
+    help="How many extra tags to push at once (Default: up to 4)",
+)
+def push(target: str, tags, content_tag: bool, latest: bool, jobs):
+    """Push a docker image built from a particular TARGET
 
-    docker_client.images.push(image, tag)
+    The version tag goes first and uploads the layers; any other tags follow side by side and
+    only need their manifests pushed.
+    """
+    push_impl(target, list(tags), content_tag=content_tag, latest=latest, jobs=jobs)
 
 
 @commands.command()
 @click.argument("mark_expr", type=str, default="not integration")
 @click.option("--target", type=str, default="dev")
-def test(mark_expr: str, target: str):
+@click.option(
+    "--force-build",
+    is_flag=True,
+    help="Build even if the local image is up to date with the build context",
+)
+@click.option(
+    "--shards",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Split the tests over this many containers running at once (Default: 1)",
+)
+@click.option(
+    "--junitxml",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="With --shards, where to write the merged JUnit report (Default: .forj/test-results.xml)",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Rerun the affected tests whenever python files change, in a warm container, until Ctrl-C",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    help="Skip the tests if they already passed on this exact image, mark expression and env file (Default: on)",
+)
+@click.option(
+    "--failed-first",
+    is_flag=True,
+    help="Run the tests that failed last time first, then the rest (pytest --ff)",
+)
+@click.option(
+    "--last-failed",
+    is_flag=True,
+    help="Only run the tests that failed last time, or all of them if none did (pytest --lf)",
+)
+def test(
+    mark_expr: str,
+    target: str,
+    force_build: bool,
+    shards: int,
+    junitxml: str,
+    watch: bool,
+    cache: bool,
+    failed_first: bool,
+    last_failed: bool,
+):
     """Run scripts/run-tests.sh in a built container
 
     MARK_EXPR is whatever that means in context of run-tests.sh
 
-    This command automatically builds your container for you if it hasn't been already
+    This command automatically builds your container for you if it's out of date
+
+    With --shards, test IDs are collected once and balanced across containers using the
+    durations of earlier runs. run-tests.sh must pass any arguments after MARK_EXPR on to pytest.
+
+    With --watch, changed test files and those importing changed modules are rerun on each change
+    (all of them if a conftest.py changes). This also needs run-tests.sh to pass arguments on.
+
+    Results are remembered in .forj/: a run identical to one that passed (same image ID, MARK_EXPR
+    and env file) is skipped unless you pass --no-cache.
+
+    pytest's cache is kept in .forj/pytest-cache rather than the throwaway container, which is what
+    --failed-first and --last-failed go on (they also need run-tests.sh to pass arguments on).
     """
+    args = ["--ff"] * failed_first + ["--lf"] * last_failed
+    if shards > 1 and (watch or args):
+        raise click.UsageError("--shards doesn't go with --watch, --failed-first or --last-failed")
+    if watch:
+        test_watch_impl(target, mark_expr, force=force_build, args=args)
+        return
     # Make sure this has been built
-    image = build_impl(target)
-    docker_test(image, mark_expr)
+    image = build_impl(target, force=force_build)
+    status = test_impl(image, mark_expr, shards=shards, junitxml=junitxml, cache=cache, args=args)
+    if status:
+        raise SystemExit(status)
 
 
 @commands.command()
@@ -87,3 +220,108 @@ def get_image(target: str):
     """Spit out the computed name for a docker image"""
     image_name = ":".join(get_docker_image(target))
     click.echo(image_name)
+
+
+@commands.command()
+@click.option(
+    "--depth",
+    type=int,
+    default=1,
+    help="How many path components to group sizes by (Default: 1)",
+)
+@click.option(
+    "--limit",
+    "-n",
+    type=int,
+    default=20,
+    help="How many paths to list (Default: 20)",
+)
+def context_report(depth: int, limit: int):
+    """List the largest paths going into the docker build context"""
+    context_report_impl(depth, limit)
+
+
+@commands.command()
+@click.option(
+    "--target",
+    type=str,
+    default="dev",
+    help='A Dockerfile target whose image to inspect (Default: "dev")',
+)
+@click.option(
+    "--against",
+    type=str,
+    default=None,
+    help="A tag (or image) to compare sizes with (Default: the newest earlier version tag there is locally)",
+)
+@click.option("--max-size", type=str, default=None, help="Fail if the image is bigger than this, like 800MiB")
+@click.option(
+    "--max-growth",
+    type=float,
+    default=None,
+    help="Fail if the image grew by more than this many percent since the one compared with (or there's none)",
+)
+@click.option("--max-waste", type=str, default=None, help="Fail if more than this much space is wasted, like 50MiB")
+@click.option(
+    "--top",
+    "-n",
+    type=int,
+    default=5,
+    help="How many cases of wasted space to list (Default: 5)",
+)
+def inspect_layers(target: str, against: str, max_size: str, max_growth: float, max_waste: str, top: int):
+    """Report each image layer's size and instruction, and flag wasted space
+
+    Wasted space is files a layer adds that a later one deletes or replaces (they're still pulled),
+    and package manager caches left in the image. The image's size is compared with an earlier
+    version's, and with --max-size, --max-growth or --max-waste this exits 1 when over the limit.
+    """
+    limits = {}
+    for name, value in (("--max-size", max_size), ("--max-waste", max_waste)):
+        try:
+            limits[name] = parse_size(value) if value else None
+        except ValueError as ex:
+            raise click.BadParameter(str(ex), param_hint=name)
+    status = inspect_layers_impl(
+        target,
+        against=against,
+        max_size=limits["--max-size"],
+        max_growth=max_growth,
+        max_waste=limits["--max-waste"],
+        top=top,
+    )
+    if status:
+        raise SystemExit(status)
+
+
+@commands.command()
+@click.option(
+    "--target",
+    type=str,
+    default="dev",
+    help='A Dockerfile target to run (Default: "dev")',
+)
+@click.option(
+    "--force-build",
+    is_flag=True,
+    help="Build even if the local image is up to date with the build context",
+)
+def up(target: str, force_build: bool):
+    """Start a long-lived container for `shell`, `test` and lint to exec into
+
+    While it's up, those commands skip `docker run` and exec into it instead. It's recreated
+    automatically whenever the image is rebuilt. Stop it with `forj docker down`.
+    """
+    up_impl(target, force=force_build)
+
+
+@commands.command()
+@click.option(
+    "--target",
+    type=str,
+    default=None,
+    help="Only remove the container for this Dockerfile target (Default: all of them)",
+)
+def down(target: str):
+    """Remove the containers started by `forj docker up`"""
+    down_impl(target)
@@ -0,0 +1,316 @@
+"""Docker build context helpers
+
+Knows which files docker would send to the daemon (per `.dockerignore`) and can fingerprint them,
+so we can tell whether an existing image is already built from exactly this context. It can also
+stream the context to the daemon as a gzipped tar, without staging it in a temp file first.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import re
+import stat
+import tarfile
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Iterator, Mapping, Optional, Tuple
+
+from forj.config import state_dir_name
+
+DOCKERFILE = "Dockerfile"
+DOCKERIGNORE = ".dockerignore"
+# Image label recording the build context fingerprint an image was built from
+FINGERPRINT_LABEL = "forj.fingerprint"
+
+_CHUNK_SIZE = 1 << 20
+
+
+def _translate(pattern: str) -> str:
+    """Turn a single .dockerignore pattern into a regex
+
+    Follows go's `filepath.Match` plus docker's `**` extension. A pattern that matches a directory
+    also matches everything beneath it.
+    """
+    i, n, out = 0, len(pattern), []
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern[i : i + 2] == "**":
+                i += 2
+                if pattern[i : i + 1] == "/":
+                    # `**/` matches zero or more directories
+                    i += 1
+                    out.append("(?:.*/)?")
+                else:
+                    out.append(".*")
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                out.append(f"[{pattern[i + 1 : end]}]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out) + "(?:/.*)?"
+
+
+def _clean(pattern: str) -> str:
+    return os.path.normpath(pattern).replace(os.sep, "/").lstrip("/")
+
+
+class DockerIgnore:
+    """A compiled .dockerignore
+
+    Patterns are relative to the context root, `!` re-includes, and the last matching pattern wins.
+    Without any `!` exceptions, all the patterns are folded into one regex.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.rules = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negate = pattern.startswith("!")
+            pattern = _clean(pattern[1:].strip() if negate else pattern)
+            if pattern == ".":
+                continue
+            self.rules.append((negate, pattern, re.compile(_translate(pattern))))
+
+        self.has_exceptions = any(negate for negate, _, _ in self.rules)
+        self._combined = None
+        if self.rules and not self.has_exceptions:
+            self._combined = re.compile("|".join(f"(?:{_translate(p)})" for _, p, _ in self.rules))
+
+    @classmethod
+    def from_file(cls, root=".", dockerfile: str = DOCKERFILE) -> "DockerIgnore":
+        """Load the .dockerignore in `root`, if any
+
+        Like the docker CLI, the Dockerfile and .dockerignore themselves are always sent. forj's own
+        state dir never is, so writing logs and caches doesn't invalidate the context.
+        """
+        path = Path(root) / DOCKERIGNORE
+        patterns = path.read_text(encoding="utf-8").splitlines() if path.is_file() else []
+        patterns.append(str(state_dir_name))
+        ignore = cls(patterns)
+        keep = [f"!{name}" for name in (_clean(dockerfile), DOCKERIGNORE) if ignore.excluded(name)]
+        return cls([*patterns, *keep]) if keep else ignore
+
+    def excluded(self, path: str) -> bool:
+        """Whether a context-relative, `/`-separated path is left out of the context"""
+        if self._combined is not None:
+            return self._combined.fullmatch(path) is not None
+        result = False
+        for negate, _pattern, regex in self.rules:
+            if regex.fullmatch(path):
+                result = not negate
+        return result
+
+    def walk(self, root=".") -> Iterator[str]:
+        """Yield the relative path of every file and directory that goes into the context
+
+        Output is sorted so it's stable across runs. Symlinks are not followed.
+        """
+        root = str(root)
+        for dirpath, dirnames, filenames in os.walk(root):
+            rel_dir = os.path.relpath(dirpath, root)
+            prefix = "" if rel_dir == "." else rel_dir.replace(os.sep, "/") + "/"
+
+            # Symlinked dirs are entries, not something to descend into
+            links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+            dirnames[:] = sorted(d for d in dirnames if d not in links)
+            if not self.has_exceptions:
+                # Nothing can be re-included under an excluded dir, so don't bother walking it
+                dirnames[:] = [d for d in dirnames if not self.excluded(prefix + d)]
+
+            for name in dirnames:
+                if not self.excluded(prefix + name):
+                    yield prefix + name
+            for name in sorted([*filenames, *links]):
+                if not self.excluded(prefix + name):
+                    yield prefix + name
+
+
+def _hash_file(path: Path) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def context_digest(root=".", dockerfile: str = DOCKERFILE) -> str:
+    """Content hash of the files in the build context
+
+    Covers each file's path, type, exec bit and contents. File mtimes and ownership are deliberately
+    ignored.
+    """
+    root = Path(root)
+    digest = hashlib.sha256()
+    for rel in DockerIgnore.from_file(root, dockerfile).walk(root):
+        path = root / rel
+        mode = path.lstat().st_mode
+        digest.update(rel.encode() + b"\0")
+        if stat.S_ISLNK(mode):
+            digest.update(b"l" + os.readlink(path).encode())
+        elif stat.S_ISDIR(mode):
+            digest.update(b"d")
+        else:
+            digest.update(b"x" if mode & 0o111 else b"f")
+            digest.update(_hash_file(path))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def fingerprint(
+    root=".",
+    dockerfile: str = DOCKERFILE,
+    target: Optional[str] = None,
+    buildargs: Optional[Mapping[str, str]] = None,
+    digest: Optional[str] = None,
+) -> str:
+    """Content hash of everything that determines a build's result
+
+    That's the context (see `context_digest`; pass `digest` if you already have it), the Dockerfile,
+    the target and the build args.
+    """
+    root = Path(root)
+    result = hashlib.sha256()
+    result.update(
+        json.dumps(
+            {"dockerfile": dockerfile, "target": target, "buildargs": dict(buildargs or {})},
+            sort_keys=True,
+        ).encode()
+    )
+    # The Dockerfile may live outside the context, so hash it explicitly
+    result.update(_hash_file(root / dockerfile))
+    result.update((digest or context_digest(root, dockerfile)).encode())
+    return result.hexdigest()
+
+
+_TARGET_RE = re.compile(r"^\s*FROM\s+(?:--\S+\s+)*\S+\s+AS\s+(\S+)\s*$", re.IGNORECASE | re.MULTILINE)
+_FROM_RE = re.compile(r"^\s*FROM\s+(?:--\S+\s+)*\S+(?:\s+AS\s+(\S+))?\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def dockerfile_targets(root=".", dockerfile: str = DOCKERFILE) -> [str]:
+    """The named stages (`FROM ... AS name`) of a Dockerfile, in order"""
+    text = (Path(root) / dockerfile).read_text(encoding="utf-8")
+    return list(dict.fromkeys(_TARGET_RE.findall(text)))
+
+
+def default_target(root=".", dockerfile: str = DOCKERFILE) -> Optional[str]:
+    """The name of the stage a build without `--target` ends at (the last), if it's named and there's a Dockerfile"""
+    try:
+        text = (Path(root) / dockerfile).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    stages = _FROM_RE.findall(text)
+    return stages[-1] or None if stages else None
+
+
+class _QueueWriter(io.RawIOBase):
+    """A writable that hands everything written to it over to a bounded queue"""
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        super().__init__()
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = bytes(b)
+        if self.put(data):
+            return len(data)
+        raise BrokenPipeError("Nobody is reading the build context anymore")
+
+    def put(self, item) -> bool:
+        """Queue up `item` once there's room; False if the reader gave up first"""
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+def stream_context(root=".", dockerfile: str = DOCKERFILE, compresslevel: int = 1) -> Iterator[bytes]:
+    """Yield the build context as a gzipped tar, for `APIClient.build(custom_context=True)`
+
+    Walking, tarring and compressing happen on a worker thread while the caller uploads what's
+    already done, so nothing is staged on disk and only a few chunks are ever held in memory.
+    """
+    ignore = DockerIgnore.from_file(root, dockerfile)
+    chunks = queue.Queue(maxsize=16)
+    cancelled = threading.Event()
+
+    def produce():
+        writer = _QueueWriter(chunks, cancelled)
+        try:
+            with io.BufferedWriter(writer, _CHUNK_SIZE) as raw, gzip.GzipFile(
+                fileobj=raw, mode="wb", compresslevel=compresslevel, mtime=0
+            ) as compressed, tarfile.open(fileobj=compressed, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for rel in ignore.walk(root):
+                    tar.add(os.path.join(root, rel), arcname=rel, recursive=False)
+        except BaseException as ex:  # pylint: disable=broad-except
+            # Like every write, these give up if the reader has: the queue may be full
+            writer.put(ex)
+        else:
+            writer.put(None)
+
+    producer = threading.Thread(target=produce, name="forj-build-context", daemon=True)
+    producer.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+    finally:
+        cancelled.set()
+        producer.join()
+
+
+def context_sizes(root=".", dockerfile: str = DOCKERFILE, depth: int = 1) -> Tuple[int, int, Counter]:
+    """Tally up what goes into the build context
+
+    Returns the total bytes, the number of files, and bytes per path truncated to `depth` components.
+    """
+    root = Path(root)
+    total, count, sizes = 0, 0, Counter()
+    for rel in DockerIgnore.from_file(root, dockerfile).walk(root):
+        st = (root / rel).lstat()
+        if stat.S_ISDIR(st.st_mode):
+            continue
+        total += st.st_size
+        count += 1
+        sizes["/".join(rel.split("/")[:depth])] += st.st_size
+    return total, count, sizes
+
+
+__all__ = (
+    "DockerIgnore",
+    "context_digest",
+    "context_sizes",
+    "default_target",
+    "dockerfile_targets",
+    "fingerprint",
+    "stream_context",
+)
@@ -8,14 +8,147 @@ So here's this gross module to do that.
 Sorry.
 """
 
+import json
 import os
+import shlex
+from dataclasses import dataclass
 from pathlib import Path
 from subprocess import CalledProcessError, run
 import sys
-from typing import Collection, Optional
+from typing import Collection, List, Optional
 
 import click
 
+from forj import trace
+from forj.util import project_state_dir, run_echoed
+
+from .context import FINGERPRINT_LABEL
+
+# Labels on warm containers (see `up`)
+WARM_IMAGE_LABEL = "forj.warm-image"
+PROJECT_LABEL = "forj.project"
+ENTRYPOINT_LABEL = "forj.entrypoint"
+
+# The environment containers run with
+ENV_FILE = ".env.example"
+
+# Where `test` mounts the project's pytest cache in containers it runs
+PYTEST_CACHE_MOUNT = "/forj-pytest-cache"
+
+
+@dataclass
+class WarmContainer:
+    """A long-lived container started by `up` that we `docker exec` into"""
+
+    id: str
+    name: str
+    project: str
+    image: str
+    fingerprint: str
+    # The image's entrypoint; `docker exec` skips it, so we prepend it ourselves
+    entrypoint: List[str]
+
+    def exec_cmd(self, interactive: bool = False, tty: bool = False, workdir=None) -> List[str]:
+        docker_cmd = ["docker", "exec"]
+        if interactive:
+            docker_cmd += ["-i"]
+        if tty:
+            docker_cmd += ["-t"]
+        if workdir:
+            docker_cmd += ["--workdir", workdir]
+        return [*docker_cmd, self.id, *self.entrypoint]
+
+
+def _inspect(obj: str, fmt: str) -> str:
+    return run(
+        ["docker", "inspect", "--format", fmt, obj], capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def _find_warm(image: str) -> Optional[WarmContainer]:
+    labels = (PROJECT_LABEL, FINGERPRINT_LABEL, ENTRYPOINT_LABEL)
+    fields = ["{{.ID}}", "{{.Names}}", *(f'{{{{.Label "{label}"}}}}' for label in labels)]
+    out = run(
+        ["docker", "ps", "--filter", f"label={WARM_IMAGE_LABEL}={image}", "--format", "\t".join(fields)],
+        capture_output=True,
+        text=True,
+        check=False,
+    ).stdout.splitlines()
+    if not out:
+        return None
+    container_id, name, project, fingerprint, entrypoint = out[0].split("\t")
+    return WarmContainer(container_id, name, project, image, fingerprint, json.loads(entrypoint or "[]"))
+
+
+@trace.traced("warm container up", "container")
+def up(image: str, name: str, project: str) -> WarmContainer:
+    """Start (or restart) a long-lived container for an image
+
+    It just sleeps, with the project mounted like `shell` does, so later commands can `exec` into it
+    instead of paying for a fresh `docker run` each time.
+    """
+    fingerprint = _inspect(image, f'{{{{ index .Config.Labels "{FINGERPRINT_LABEL}" }}}}')
+    entrypoint = _inspect(image, "{{json .Config.Entrypoint}}")
+    entrypoint = json.dumps(json.loads(entrypoint) or [], separators=(",", ":"))
+
+    run(["docker", "rm", "-f", name], capture_output=True, check=False)
+    docker_cmd = [
+        "docker",
+        "run",
+        "-d",
+        "--init",
+        "--name",
+        name,
+        "--label",
+        f"{PROJECT_LABEL}={project}",
+        "--label",
+        f"{WARM_IMAGE_LABEL}={image}",
+        "--label",
+        f"{FINGERPRINT_LABEL}={fingerprint}",
+        "--label",
+        f"{ENTRYPOINT_LABEL}={entrypoint}",
+        "-v",
+        f"{Path().resolve()}:/app",
+        "--network",
+        "host",
+        "--env-file",
+        ENV_FILE,
+        "--entrypoint",
+        "sleep",
+        image,
+        "infinity",
+    ]
+    container_id = run(docker_cmd, capture_output=True, text=True, check=True).stdout.strip()
+    return WarmContainer(container_id, name, project, image, fingerprint, json.loads(entrypoint))
+
+
+def down(project: str, image: Optional[str] = None) -> List[str]:
+    """Remove a project's warm containers (only the one for `image`, if given)"""
+    filters = ["--filter", f"label={PROJECT_LABEL}={project}"]
+    if image:
+        filters += ["--filter", f"label={WARM_IMAGE_LABEL}={image}"]
+    ids = run(
+        ["docker", "ps", "-aq", *filters], capture_output=True, text=True, check=True
+    ).stdout.split()
+    if ids:
+        run(["docker", "rm", "-f", *ids], capture_output=True, check=True)
+    return ids
+
+
+@trace.traced("find warm container", "container")
+def warm_container(image: str) -> Optional[WarmContainer]:
+    """The running warm container for an image, if someone brought one `up`
+
+    If the image has been rebuilt since, the container is recreated from the new one.
+    """
+    container = _find_warm(image)
+    if container is None:
+        return None
+    if _inspect(image, f'{{{{ index .Config.Labels "{FINGERPRINT_LABEL}" }}}}') != container.fingerprint:
+        click.secho(f"Image {image} changed; recreating warm container {container.name}", fg="yellow")
+        container = up(image, container.name, container.project)
+    return container
+
 
 def build(tag: str, target: Optional[str] = None):
     cmd = [
@@ -29,11 +162,27 @@ def build(tag: str, target: Optional[str] = None):
         cmd += [f"--target={target}"]
     cmd += ["."]
     click.secho(" ".join(cmd), fg="bright_magenta")
-    run(" ".join(cmd), shell=True, check=True)
+    run_echoed(" ".join(cmd), shell=True, check=True)
 
 
+@trace.traced("docker run shell", "container")
 def shell(image: str, cmd: Collection[str], workdir=None):
-    """Run a docker shell"""
+    """Run a docker shell
+
+    Uses the image's warm container (see `up`) if there is one.
+    """
+    warm = warm_container(image)
+    if warm:
+        docker_cmd = warm.exec_cmd(interactive=sys.stdout.isatty(), tty=sys.stdout.isatty(), workdir=workdir)
+        # The container's part is quoted (its entrypoint may have spaces in it); `cmd` is a command line
+        docker_cmd = [*map(shlex.quote, docker_cmd), *cmd]
+        try:
+            run_echoed(" ".join(docker_cmd), shell=True, check=True)
+        except CalledProcessError:
+            click.secho("Container failed to run with provided arguments:", fg="red")
+            click.secho(f'    {" ".join(cmd)}', fg="red")
+        return
+
     docker_cmd = [
         "docker",
         "run",
@@ -43,7 +192,7 @@ def shell(image: str, cmd: Collection[str], workdir=None):
         "--network",
         "host",
         "--env-file",
-        ".env.example",
+        ENV_FILE,
     ]
     if sys.stdout.isatty():
         docker_cmd += ["-it"]
@@ -52,14 +201,61 @@ def shell(image: str, cmd: Collection[str], workdir=None):
     docker_cmd += [image, *cmd]
 
     try:
-        run(" ".join(docker_cmd), shell=True, check=True)
+        run_echoed(" ".join(docker_cmd), shell=True, check=True)
     except CalledProcessError:
         click.secho("Container failed to run with provided arguments:", fg="red")
         click.secho(f'    {" ".join(cmd)}', fg="red")
 
 
-def test(image: str, mark_expr: str):
-    """Do run-tests in a docker shell"""
+@trace.traced("docker run script", "container")
+def run_script(image: str, script: str, args: Collection[str] = (), workdir=None) -> int:
+    """Run a python script in a docker shell, piping it to the container's interpreter
+
+    Arguments are passed straight through (no host shell involved). Returns the exit status.
+    Uses the image's warm container (see `up`) if there is one.
+    """
+    warm = warm_container(image)
+    if warm:
+        docker_cmd = [*warm.exec_cmd(interactive=True, workdir=workdir), "python3", "-", *args]
+        return run_echoed(docker_cmd, input=script, text=True, check=False).returncode
+
+    docker_cmd = [
+        "docker",
+        "run",
+        "--rm",
+        "-i",
+        "-v",
+        f"{Path().resolve()}:/app",
+        "--network",
+        "host",
+        "--env-file",
+        ENV_FILE,
+    ]
+    if workdir:
+        docker_cmd += ['--workdir', workdir]
+    docker_cmd += [image, "python3", "-", *args]
+
+    return run_echoed(docker_cmd, input=script, text=True, check=False).returncode
+
+
+@trace.traced("docker run tests", "container")
+def test(image: str, mark_expr: str, args: Collection[str] = ()):
+    """Do run-tests in a docker shell
+
+    Uses the image's warm container (see `up`) if there is one. `args` go after the mark
+    expression, which run-tests.sh passes on to pytest. So does a `cache_dir` pointing pytest at
+    the project's .forj/pytest-cache, so things like `--lf` have something to go on next time.
+    """
+    cache_dir = project_state_dir("pytest-cache")
+    warm = warm_container(image)
+    if warm:
+        # The whole project, .forj included, is mounted at /app
+        extra = [f"--override-ini=cache_dir=/app/{cache_dir.as_posix()}", *args]
+        cmd = [*map(shlex.quote, warm.exec_cmd()), "scripts/run-tests.sh", f'"{mark_expr}"', *map(shlex.quote, extra)]
+        run_echoed(" ".join(cmd), shell=True, check=True)
+        return
+
+    extra = [f"--override-ini=cache_dir={PYTEST_CACHE_MOUNT}", *args]
     cmd = [
         "docker",
         "run",
@@ -67,16 +263,26 @@ def test(image: str, mark_expr: str):
         "--network",
         "host",
         "--env-file",
-        ".env.example",
+        ENV_FILE,
+        "-v",
+        f"{cache_dir.resolve()}:{PYTEST_CACHE_MOUNT}",
         image,
         "scripts/run-tests.sh",
         f'"{mark_expr}"',
+        *map(shlex.quote, extra),
     ]
-    run(" ".join(cmd), shell=True, check=True)
+    run_echoed(" ".join(cmd), shell=True, check=True)
 
 
 __all__ = (
+    "ENV_FILE",
+    "PYTEST_CACHE_MOUNT",
+    "WarmContainer",
     "build",
+    "down",
+    "run_script",
     "shell",
     "test",
+    "up",
+    "warm_container",
 )
@@ -1,58 +1,734 @@
 """Implementation of commands so click is real thin"""
 
 import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from subprocess import CalledProcessError
+from typing import Collection, List, Optional, Tuple
 
 import click
-import docker
 
+from forj import trace
 from forj.config import get_config
+from forj.util import project_state_dir
 from forj.version.util import deduce as deduce_version
+from forj.watch import Watcher
+
+from .buildlog import BuildLog
+from . import results as test_results
+from .docker import ENV_FILE
+from .docker import down as docker_down
+from .docker import test as docker_test
+from .docker import up as docker_up
+from .docker import warm_container
+from .layers import find_waste, previous_tag, read_saved_image
+from .push import print_summary as print_push_summary
+from .push import push_tags
+from .shards import run_sharded
+from .context import DOCKERFILE, FINGERPRINT_LABEL, context_digest, context_sizes, default_target, stream_context
+from .context import fingerprint as context_fingerprint
+
+
+# Build arg asking BuildKit to embed layer cache metadata in the image, so it can be a `--cache-from`
+INLINE_CACHE_BUILDARG = "BUILDKIT_INLINE_CACHE"
+
+
+def target_tag(version: str, target: str) -> str:
+    """The tag of a target's image: the version for the Dockerfile's default (last) stage, the version
+    and "d" for dev, and the version and `-<target>` for any other target, so no two share a tag
+    """
+    # This is kinda hacky and bespoke but like :shrug:
+    if target == "dev":
+        return f"{version}d"
+    if target == default_target():
+        return version
+    return f"{version}-{target}"
 
 
 def get_docker_image(target: str):
     project_config, static_config = get_config()
-    version = deduce_version()
-    # This is kinda hacky and bespoke but like :shrug:
-    suffix = "d" if target == "dev" else ""
     docker_path = f"{project_config.docker_path}/" if project_config.docker_path else ""
     image = f"{static_config.DOCKER_REGISTRY}/{docker_path}{project_config.name}"
-    tag = f"{version}{suffix}"
-    return (image, tag)
+    return (image, target_tag(deduce_version(), target))
 
 
-def build(target: str):
-    image = ":".join(get_docker_image(target))
-    docker_client = docker.from_env()
+# What decides which daemon `docker.from_env()` talks to, and how
+_DOCKER_ENV_VARS = ("DOCKER_HOST", "DOCKER_CONTEXT", "DOCKER_TLS_VERIFY", "DOCKER_CERT_PATH")
 
-    click.echo(click.style("docker build", fg="bright_magenta"))
-    click.echo(click.style(f"  target: {target}", fg="magenta"))
-    click.echo(click.style(f"  image: {image}", fg="magenta"))
+# {values of _DOCKER_ENV_VARS: client}
+_docker_clients = {}
+
+
+def get_docker_client():
+    """One docker client per docker environment for the whole process, so its connection pool stays warm
+
+    `forj serve` runs each command with its client's environment: one pointed at another daemon
+    gets a client of its own rather than the one the server started with.
+    """
+    key = tuple(os.getenv(var) for var in _DOCKER_ENV_VARS)
+    if key not in _docker_clients:
+        import docker
+
+        _docker_clients[key] = docker.from_env()
+    return _docker_clients[key]
+
+
+def context_tag(fingerprint: str) -> str:
+    """The tag `push --content-tag` gives an image built from a context with this fingerprint"""
+    return f"ctx-{fingerprint[:12]}"
+
+
+def _cache_settings(cache_from=None, cache_to=None):
+    """Layer cache settings from the command line, falling back on `docker_cache` in .forjproject"""
+    project_config, _ = get_config()
+    settings = project_config.docker_cache or {}
+    cache_from = list(cache_from or settings.get("from", []))
+    cache_to = cache_to or settings.get("to")
+    if cache_to not in (None, "inline"):
+        raise ValueError(f"Unsupported layer cache export {cache_to!r}; only inline cache is supported")
+    return cache_from, cache_to
+
+
+def cache_from_images(target: str, fingerprint: str, refs: [str]) -> [str]:
+    """Resolve `--cache-from` refs to image names
+
+    "auto" stands for earlier pushes of this target: its content tag (an identical context), its
+    current version and "latest". A bare tag is a tag of the target's image; anything with a `/` or
+    `:` in it is taken as is.
+    """
+    image, tag = get_docker_image(target)
+    resolved = []
+    for ref in refs:
+        if ref == "auto":
+            resolved += [f"{image}:{context_tag(fingerprint)}", f"{image}:{tag}", f"{image}:latest"]
+        elif "/" in ref or ":" in ref:
+            resolved.append(ref)
+        else:
+            resolved.append(f"{image}:{ref}")
+    return list(dict.fromkeys(resolved))
+
+
+def _pull_cache(docker_client, images: [str], prefix: str = "") -> [str]:
+    """Make the cache images local, pulling them if need be; returns the ones we've got
+
+    The (classic) builder only takes layer cache from local images, so they're pulled first.
+    Images that don't exist (yet) are left out.
+    """
+    import docker
+
+    available = []
+    for ref in images:
+        with trace.span(f"cache pull {ref}", "cache pull") as span_args:
+            try:
+                docker_client.images.get(ref)
+                span_args["cached"] = True
+            except docker.errors.ImageNotFound:
+                span_args["cached"] = False
+                repository, tag = docker.utils.parse_repository_tag(ref)
+                try:
+                    docker_client.api.pull(repository, tag=tag or "latest")
+                except docker.errors.APIError as ex:
+                    click.echo(click.style(f"{prefix}No layer cache from {ref}: {ex.explanation or ex}", fg="yellow"))
+                    continue
+        available.append(ref)
+    if available:
+        click.echo(click.style(f"{prefix}Layer cache from: {', '.join(available)}", fg="magenta"))
+    return available
+
+
+def _local_fingerprint(docker_client, image: str):
+    """The fingerprint label of a local image, or None if there's no such image"""
+    import docker
 
-    _config, static_config = get_config()
     try:
-        docker_client.images.build(
-            path=str(Path()),
+        return docker_client.images.get(image).labels.get(FINGERPRINT_LABEL)
+    except docker.errors.ImageNotFound:
+        return None
+
+
+def _up_to_date(docker_client, target: str, image: str, fingerprint: str) -> bool:
+    """Whether the local image was built from this very context"""
+    with trace.span(f"image check {target}", "docker image cache") as span_args:
+        span_args["cached"] = _local_fingerprint(docker_client, image) == fingerprint
+    return span_args["cached"]
+
+
+def _build_log_path(target: str) -> Path:
+    return project_state_dir("logs") / f"docker-build-{target}.log"
+
+
+def _build_one(
+    docker_client, target: str, image: str, fingerprint: str, buildargs, context, prefix: str = "", cache_from=None
+):
+    """Run one build against the daemon, following its output; returns the BuildLog"""
+    log_path = _build_log_path(target)
+    started = time.monotonic()
+    uploaded = None
+    with trace.span(f"docker build {target}", "docker build"), BuildLog(log_path, prefix=prefix) as build_log:
+        for chunk in docker_client.api.build(
+            fileobj=context,
+            custom_context=True,
+            encoding="gzip",
+            dockerfile=DOCKERFILE,
             rm=True,
             network_mode="host",
             target=target,
-            buildargs={
-                "docker_registry": static_config.DOCKER_REGISTRY,
-            },
+            buildargs=buildargs,
+            cache_from=cache_from or None,
+            labels={FINGERPRINT_LABEL: fingerprint},
             tag=image,
-        )
-        click.echo(click.style("Success!", fg="green"))
-    except docker.errors.BuildError as ex:
-        click.echo(click.style("Build failure:", fg="red"))
-        click.echo(ex.msg)
-        for chunk in ex.build_log:
-            click.echo(chunk)
-        raise ex
+            decode=True,
+        ):
+            if uploaded is None:
+                # The daemon doesn't say a thing until it has the whole context
+                uploaded = time.monotonic()
+                trace.record(f"context upload {target}", "context upload", started, uploaded)
+            build_log.feed(chunk)
+    for step in build_log.steps:
+        trace.record(step.instruction, "build step", step.started, step.finished, target=target, cached=step.cached)
+
+    if not build_log.error and not build_log.image_id:
+        build_log.error = "Build finished without producing an image"
+    return build_log
+
+
+def _echo_header(target: str, image: str):
+    click.echo(click.style("docker build", fg="bright_magenta"))
+    click.echo(click.style(f"  target: {target}", fg="magenta"))
+    click.echo(click.style(f"  image: {image}", fg="magenta"))
+
+
+def build(target: str, force: bool = False, cache_from: Optional[List[str]] = None, cache_to: Optional[str] = None):
+    """Build an image for a Dockerfile target
+
+    If a local image with the same tag was built from an identical context, it's reused
+    rather than rebuilt. Pass `force` to build regardless.
+
+    Layer cache is imported from the `cache_from` images (see `cache_from_images`), and with
+    `cache_to="inline"` cache metadata is embedded in the image for later builds to import. Both
+    default to the project's `docker_cache` settings.
+    """
+    # The docker SDK is slow to import; only pay for it when we actually talk to the daemon
+    import docker
+
+    image = ":".join(get_docker_image(target))
+    docker_client = get_docker_client()
+
+    _echo_header(target, image)
+
+    _config, static_config = get_config()
+    cache_from, cache_to = _cache_settings(cache_from, cache_to)
+    buildargs = {
+        "docker_registry": static_config.DOCKER_REGISTRY,
+    }
+    if cache_to == "inline":
+        buildargs[INLINE_CACHE_BUILDARG] = "1"
+    with trace.span("context fingerprint", "context"):
+        fingerprint = context_fingerprint(target=target, buildargs=buildargs)
+
+    if not force and _up_to_date(docker_client, target, image, fingerprint):
+        click.echo(click.style(f"Up to date (context {fingerprint[:12]}); skipping build", fg="green"))
+        return image
+
+    cache_images = _pull_cache(docker_client, cache_from_images(target, fingerprint, cache_from))
+    build_log = _build_one(
+        docker_client, target, image, fingerprint, buildargs, stream_context(), cache_from=cache_images
+    )
+    if build_log.error:
+        build_log.print_failure()
+        raise docker.errors.BuildError(build_log.error, list(build_log.tail))
+
+    click.echo(click.style("Success!", fg="green"))
+    build_log.print_summary()
 
     return image
 
 
+def build_many(
+    targets: [str],
+    force: bool = False,
+    jobs: Optional[int] = None,
+    cache_from: Optional[List[str]] = None,
+    cache_to: Optional[str] = None,
+):
+    """Build several Dockerfile targets at once
+
+    The context is tarred up once and shared by every build, which run concurrently (at most
+    `jobs` at a time) with their output prefixed by target. Up to date targets are skipped, and
+    layer cache handled, just like in `build`. Every target is built, and summarised, even if
+    others fail. Returns the built image names.
+    """
+    import docker
+
+    images = {target: ":".join(get_docker_image(target)) for target in targets}
+
+    docker_client = get_docker_client()
+    _config, static_config = get_config()
+    cache_from, cache_to = _cache_settings(cache_from, cache_to)
+    buildargs = {
+        "docker_registry": static_config.DOCKER_REGISTRY,
+    }
+    if cache_to == "inline":
+        buildargs[INLINE_CACHE_BUILDARG] = "1"
+    with trace.span("context digest", "context"):
+        digest = context_digest()
+
+    pending, results = [], {}
+    for target in targets:
+        fingerprint = context_fingerprint(target=target, buildargs=buildargs, digest=digest)
+        _echo_header(target, images[target])
+        if not force and _up_to_date(docker_client, target, images[target], fingerprint):
+            results[target] = ("up to date", 0.0, None)
+        else:
+            pending.append((target, images[target], fingerprint))
+
+    if pending:
+        with tempfile.TemporaryDirectory(prefix="forj-") as tmp:
+            context_path = Path(tmp) / "context.tar.gz"
+            with trace.span("context stage", "context"), open(context_path, "wb") as f:
+                for chunk in stream_context():
+                    f.write(chunk)
+
+            def run(target, image, fingerprint):
+                started = time.monotonic()
+                prefix = f"[{target}] "
+                try:
+                    cache_images = _pull_cache(
+                        docker_client, cache_from_images(target, fingerprint, cache_from), prefix
+                    )
+                    with open(context_path, "rb") as context:
+                        build_log = _build_one(
+                            docker_client, target, image, fingerprint, buildargs, context, prefix, cache_images
+                        )
+                except Exception as ex:
+                    # e.g. the daemon going away: this target failed, the others still get reported
+                    build_log = BuildLog(_build_log_path(target), prefix=prefix, echo=False)
+                    build_log.error = f"{type(ex).__name__}: {ex}"
+                return build_log, time.monotonic() - started
+
+            with ThreadPoolExecutor(max_workers=jobs or min(len(pending), 4)) as pool:
+                futures = {args[0]: pool.submit(run, *args) for args in pending}
+
+        for target, future in futures.items():
+            build_log, seconds = future.result()
+            results[target] = ("failed" if build_log.error else "built", seconds, build_log)
+
+    failures = [results[t][2] for t in targets if results[t][0] == "failed"]
+    for build_log in failures:
+        build_log.print_failure()
+
+    click.echo(click.style("Build summary:", fg="bright_magenta"))
+    width = max(len(t) for t in targets)
+    for target in targets:
+        status, seconds, build_log = results[target]
+        cached = build_log.cache_summary if build_log else ""
+        click.echo(
+            click.style(
+                f"  {target:<{width}}  {status:<10}  {seconds:7.1f}s  {cached:<18}  {images[target]}",
+                fg="red" if status == "failed" else "green",
+            )
+        )
+
+    if failures:
+        raise docker.errors.BuildError(
+            f"{len(failures)} of {len(targets)} targets failed to build", [f.error for f in failures]
+        )
+    return [images[t] for t in targets]
+
+
+def push(target: str, tags: [str] = (), content_tag: bool = False, latest: bool = False, jobs: Optional[int] = None):
+    """Push the image built from a target under its version tag, plus any extra tags
+
+    `content_tag` adds a tag derived from the build context fingerprint (so identical contexts
+    share it), `latest` adds "latest". Raises if any tag fails to push.
+    """
+    image, tag = get_docker_image(target)
+    docker_client = get_docker_client()
+
+    all_tags = [tag, *tags]
+    if content_tag:
+        local = docker_client.images.get(f"{image}:{tag}")
+        fingerprint = local.labels.get(FINGERPRINT_LABEL) or local.id.split(":")[-1]
+        all_tags.append(context_tag(fingerprint))
+    if latest:
+        all_tags.append("latest")
+    all_tags = list(dict.fromkeys(all_tags))
+
+    click.echo(click.style("docker push", fg="bright_magenta"))
+    click.echo(click.style(f"  image: {image}", fg="magenta"))
+    click.echo(click.style(f"  tags: {', '.join(all_tags)}", fg="magenta"))
+
+    results = push_tags(docker_client, image, tag, all_tags, jobs)
+    print_push_summary(image, results)
+
+    failed = [t for t, (status, _, _) in results.items() if status != "pushed"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(results)} tags failed to push: {', '.join(failed)}")
+    return [f"{image}:{t}" for t in all_tags]
+
+
+def _warm_container_name(project: str, image: str) -> str:
+    tag = image.rsplit(":", 1)[-1]
+    return re.sub(r"[^a-zA-Z0-9_.-]", "-", f"forj-{project}-{tag}")
+
+
+def up(target: str, force: bool = False):
+    """Build a target if need be and start a warm container for it"""
+    image = build(target, force=force)
+    project_config, _ = get_config()
+
+    container = docker_up(image, _warm_container_name(project_config.name, image), project_config.name)
+
+    click.echo(click.style("docker up", fg="bright_magenta"))
+    click.echo(click.style(f"  image: {image}", fg="magenta"))
+    click.echo(click.style(f"  container: {container.name} ({container.id[:12]})", fg="magenta"))
+    return container
+
+
+def down(target: Optional[str] = None):
+    """Remove this project's warm containers, or just the one for a target"""
+    project_config, _ = get_config()
+    image = ":".join(get_docker_image(target)) if target else None
+
+    removed = docker_down(project_config.name, image)
+
+    click.echo(click.style("docker down", fg="bright_magenta"))
+    click.echo(click.style(f"  removed {len(removed)} container(s)", fg="magenta"))
+
+
+def ensure_warm(target: str, force: bool = False) -> Tuple[str, bool]:
+    """Build a target if need be, and bring up its warm container unless one is up already
+
+    Returns the image, and whether we started the container (so it can be taken down after).
+    """
+    image = build(target, force=force)
+    if warm_container(image):
+        return image, False
+    project_config, _ = get_config()
+    container = docker_up(image, _warm_container_name(project_config.name, image), project_config.name)
+    click.secho(f"Started warm container {container.name} ({container.id[:12]})", fg="magenta")
+    return image, True
+
+
+_TEST_FILE = re.compile(r"^(test_.*|.*_test)\.py$")
+
+
+def _module_names(path: Path, src_path: str) -> [str]:
+    """The dotted names a python file might be imported as, e.g. both src.pkg.mod and pkg.mod"""
+    parts = list(path.with_suffix("").parts)
+    if parts[-1] == "__init__":
+        parts.pop()
+    try:
+        path.relative_to(src_path)
+        depth = len(Path(src_path).parts)
+    except ValueError:
+        depth = 0
+    return [".".join(parts[i:]) for i in range(min(depth, len(parts) - 1) + 1)]
+
+
+def _imports(text: str, name: str) -> bool:
+    parent, _, last = name.rpartition(".")
+    pattern = rf"^\s*(from|import)\s+{re.escape(name)}\b"
+    if parent:
+        pattern += rf"|^\s*from\s+{re.escape(parent)}\s+import\s+.*\b{re.escape(last)}\b"
+    return re.search(pattern, text, re.MULTILINE) is not None
+
+
+def affected_tests(changed: Collection[Path], src_path: str, test_dirs: Collection[str]) -> Optional[List[str]]:
+    """The test files to rerun after some python files changed, or None to rerun them all
+
+    That's the changed test files, and those importing a changed module, directly or through other
+    modules. A changed conftest.py, or a change no test can be traced to, means all of them.
+    """
+    test_dirs = [Path(d) for d in test_dirs]
+
+    def is_test(path: Path) -> bool:
+        return bool(_TEST_FILE.match(path.name)) and any(d in path.parents for d in test_dirs)
+
+    tests, modules = set(), set()
+    for path in changed:
+        if path.name == "conftest.py":
+            return None
+        if is_test(path):
+            if path.is_file():
+                tests.add(path)
+        else:
+            modules.add(path)
+
+    if modules:
+        texts = {
+            path: path.read_text(encoding="utf-8", errors="replace")
+            for root in [Path(src_path), *test_dirs]
+            for path in root.rglob("*.py")
+        }
+        reached = set()
+        names = {name for path in modules for name in _module_names(path, src_path)}
+        while names:
+            importers = {
+                path
+                for path, text in texts.items()
+                if path not in reached and any(_imports(text, name) for name in names)
+            }
+            reached |= importers
+            names = {name for path in importers if not is_test(path) for name in _module_names(path, src_path)}
+        if not any(is_test(path) for path in reached):
+            return None
+        tests |= {path for path in reached if is_test(path)}
+    return sorted(str(path) for path in tests)
+
+
+def _run_watched_tests(image: str, mark_expr: str, tests: Optional[List[str]], args: Collection[str] = ()):
+    if tests is not None and not tests:
+        click.secho("No tests left to run", fg="green")
+        return
+    click.secho(f"Running {'all tests' if tests is None else ' '.join(tests)}", fg="bright_magenta")
+    try:
+        docker_test(image, mark_expr, [*args, *(tests or ())])
+        click.secho("Tests passed", fg="green")
+    except CalledProcessError as ex:
+        click.secho(f"Tests failed (exit status {ex.returncode})", fg="red")
+
+
+def test_watch(target: str, mark_expr: str, force: bool = False, debounce: float = 0.3, args: Collection[str] = ()):
+    """Run the tests, then rerun the affected ones whenever python files change, until interrupted
+
+    It all happens in the target's warm container, started if need be (and removed after). The
+    project is mounted into it, so edits don't need a rebuild; changes to what goes into the image
+    (Dockerfile, requirements) do, so restart the watch after those. `args` go to pytest each time.
+    """
+    project_config, _ = get_config()
+    src_path = project_config.python_module_path
+    test_dirs = [d for d in ("tests", "test") if Path(d).is_dir()]
+    image, started = ensure_warm(target, force=force)
+    try:
+        # Watching from before the first run, so changes made during it aren't missed
+        with Watcher([src_path, *test_dirs], debounce, include=lambda path: path.suffix == ".py") as watcher:
+            _run_watched_tests(image, mark_expr, None, args)
+            click.secho(
+                f"Watching {', '.join([src_path, *test_dirs])}{' (polling)' if watcher.polling else ''}; "
+                "Ctrl-C to stop",
+                fg="bright_magenta",
+            )
+            for changed in watcher.batches():
+                if changed is None:
+                    click.secho("Lost track of what changed; running everything", fg="yellow")
+                    _run_watched_tests(image, mark_expr, None, args)
+                    continue
+                click.secho(f"Changed: {', '.join(sorted(map(str, changed)))}", fg="magenta")
+                _run_watched_tests(image, mark_expr, affected_tests(changed, src_path, test_dirs), args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if started:
+            down(target)
+
+
+def test_sharded(image: str, mark_expr: str, shards: int, junitxml: Optional[str] = None) -> int:
+    """Run the tests split over several containers; returns the merged exit status"""
+    state_dir = project_state_dir()
+    report = Path(junitxml) if junitxml else state_dir / "test-results.xml"
+    return run_sharded(image, mark_expr, shards, state_dir, report)
+
+
+def test(
+    image: str,
+    mark_expr: str,
+    shards: int = 1,
+    junitxml: Optional[str] = None,
+    cache: bool = True,
+    args: Collection[str] = (),
+) -> int:
+    """Run the tests on an image, unless an identical run already passed; returns the exit status
+
+    See `forj.docker.results` for what makes runs identical. Runs that failed always run again, as
+    do those asked for a `junitxml` report, since skipping wouldn't write one. Extra pytest `args`
+    (not for sharded runs) go through the pytest cache, which isn't part of the key, so runs with
+    them aren't cached either.
+    """
+    image_id = get_docker_client().images.get(image).id
+    key = test_results.result_key(mark_expr, test_results.file_hash(ENV_FILE))
+    with trace.span("test results", "test cache") as span_args:
+        previous = test_results.lookup(image_id, key)
+        span_args["cached"] = bool(cache and not junitxml and not args and previous and previous["passed"])
+    if span_args["cached"]:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(previous["when"]))
+        click.secho(
+            f"Test cache hit: these tests passed on this image at {when} (in {previous['seconds']:.1f}s); "
+            "skipping them. Use --no-cache to run them anyway",
+            fg="green",
+        )
+        return 0
+    if previous and not previous["passed"]:
+        click.secho(f"These tests failed on this image last time (exit status {previous['status']})", fg="yellow")
+
+    started = time.monotonic()
+    if shards > 1:
+        status = test_sharded(image, mark_expr, shards, junitxml)
+    else:
+        try:
+            docker_test(image, mark_expr, args)
+            status = 0
+        except CalledProcessError as ex:
+            status = ex.returncode
+    if not args:
+        test_results.record(image_id, key, status, time.monotonic() - started, image=image, mark_expr=mark_expr)
+    return status
+
+
+def _human_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            break
+        size /= 1024
+    return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+
+
+def _signed_size(size: float) -> str:
+    return f"{'-' if size < 0 else '+'}{_human_size(abs(size))}"
+
+
+def _short(text: str, width: int = 90) -> str:
+    return text if len(text) <= width else text[: width - 3] + "..."
+
+
+def _local_or_pulled(docker_client, ref: str):
+    """A local image, pulled first if need be; None if there's no such image anywhere"""
+    import docker
+
+    try:
+        return docker_client.images.get(ref)
+    except docker.errors.ImageNotFound:
+        pass
+    repository, _, tag = ref.rpartition(":")
+    try:
+        with trace.span(f"pull {ref}", "docker pull"):
+            return docker_client.images.pull(repository, tag=tag)
+    except docker.errors.APIError:
+        return None
+
+
+def inspect_layers(
+    target: str,
+    against: Optional[str] = None,
+    max_size: Optional[int] = None,
+    max_growth: Optional[float] = None,
+    max_waste: Optional[int] = None,
+    top: int = 5,
+) -> int:
+    """Report an image's layers, the instructions behind them and the space they waste
+
+    The image's size is compared with `against` (a tag or full image name; by default the newest
+    earlier version tag of the same image there is locally). As a CI gate, returns 1 when the image
+    is over `max_size` bytes, grew by more than `max_growth` percent, or wastes over `max_waste`
+    bytes; 0 otherwise. A `max_growth` with nothing to compare with fails too, rather than passing
+    unchecked: CI machines rarely have earlier versions lying around, so give them `against`.
+    """
+    repository, tag = get_docker_image(target)
+    image_name = f"{repository}:{tag}"
+    docker_client = get_docker_client()
+    image = _local_or_pulled(docker_client, image_name)
+    if image is None:
+        raise click.ClickException(f"No image {image_name}, locally or in the registry; build it first")
+
+    with trace.span("read layers", "docker inspect"):
+        _config, layers = read_saved_image(image.save(chunk_size=1 << 20, named=False))
+    size = image.attrs["Size"]
+    layers_size = sum(layer.size for layer in layers) or 1
+
+    click.echo(click.style("docker inspect-layers", fg="bright_magenta"))
+    click.echo(click.style(f"  image: {image_name} ({_human_size(size)}, {len(layers)} layers)", fg="magenta"))
+    click.echo(f"  {'#':>3}  {'size':>10}  {'share':>6}  instruction")
+    for layer in layers:
+        click.echo(
+            f"  {layer.index + 1:>3}  {_human_size(layer.size):>10}  {100 * layer.size / layers_size:5.1f}%  "
+            f"{_short(layer.instruction or '?')}"
+        )
+
+    waste = find_waste(layers)
+    wasted = sum(w.size for w in waste)
+    if waste:
+        click.secho(f"Wasted space: {_human_size(wasted)} ({100 * wasted / layers_size:.1f}%)", fg="yellow")
+        for w in waste[:top]:
+            what = f"{w.kind} by layer {w.by.index + 1}" if w.by else w.kind
+            click.secho(f"  {_human_size(w.size):>10}  layer {w.layer.index + 1}: {what}", fg="yellow")
+            for path, path_size in w.examples:
+                click.echo(f"  {_human_size(path_size):>10}      /{path}")
+        if len(waste) > top:
+            click.echo(f"  ... and {len(waste) - top} more")
+    else:
+        click.secho("No wasted space found", fg="green")
+
+    previous = None
+    if against:
+        previous_name = against if ":" in against else f"{repository}:{against}"
+        previous = _local_or_pulled(docker_client, previous_name)
+        if previous is None:
+            raise click.ClickException(f"No image {previous_name} to compare with")
+    else:
+        tags = [ref.rpartition(":")[2] for img in docker_client.images.list(name=repository) for ref in img.tags]
+        earlier = previous_tag(tag, tags)
+        previous_name = f"{repository}:{earlier}" if earlier else None
+        previous = docker_client.images.get(previous_name) if previous_name else None
+
+    growth = None
+    if previous is None:
+        click.secho("No earlier version of this image to compare with", fg="magenta")
+    else:
+        before = previous.attrs["Size"]
+        growth = 100 * (size - before) / before if before else 0.0
+        click.secho(
+            f"Compared with {previous_name}: {_signed_size(size - before)} ({growth:+.1f}%), "
+            f"{len(previous.attrs['RootFS']['Layers'])} -> {len(layers)} layers",
+            fg="yellow" if size > before else "green",
+        )
+
+    failures = []
+    if max_size is not None and size > max_size:
+        failures.append(f"image is {_human_size(size)}, over the {_human_size(max_size)} limit")
+    if max_growth is not None and growth is None:
+        failures.append("no earlier image to check --max-growth against (name one with --against)")
+    elif max_growth is not None and growth > max_growth:
+        failures.append(f"image grew {growth:.1f}%, more than the {max_growth:g}% allowed")
+    if max_waste is not None and wasted > max_waste:
+        failures.append(f"{_human_size(wasted)} wasted, over the {_human_size(max_waste)} limit")
+    for failure in failures:
+        click.secho(f"FAILED: {failure}", fg="red")
+    return int(bool(failures))
+
+
+def context_report(depth: int, limit: int):
+    """Print the biggest paths that go into the build context"""
+    total, count, sizes = context_sizes(depth=depth)
+
+    click.echo(click.style("docker build context", fg="bright_magenta"))
+    click.echo(click.style(f"  {count} files, {_human_size(total)}", fg="magenta"))
+
+    for path, size in sizes.most_common(limit):
+        share = size / total * 100 if total else 0
+        click.echo(f"{_human_size(size):>12}  {share:5.1f}%  {path}")
+    if len(sizes) > limit:
+        click.echo(f"  ... and {len(sizes) - limit} more (see .dockerignore to prune them)")
+
+
 __all__ = (
+    "get_docker_client",
     "get_docker_image",
+    "target_tag",
     "build",
+    "build_many",
+    "cache_from_images",
+    "context_tag",
+    "context_report",
+    "down",
+    "affected_tests",
+    "ensure_warm",
+    "inspect_layers",
+    "push",
+    "test",
+    "test_sharded",
+    "test_watch",
+    "up",
 )
@@ -0,0 +1,250 @@
+"""Where an image's size comes from, layer by layer, and which of it is wasted
+
+Reads the tarball `docker save` produces (either the classic layout or the OCI one), lists the
+files in each layer, and lines the layers up with the Dockerfile instructions in the image's
+history. Two kinds of waste are flagged:
+
+- files a layer adds that a later layer deletes or replaces: they're still pulled, just hidden
+- package manager caches (apt lists, pip's cache, ...) that made it into the final image
+"""
+
+import io
+import json
+import posixpath
+import re
+import tarfile
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Final-image paths that are only ever package manager caches
+PACKAGE_CACHES = (
+    "var/cache/apt/",
+    "var/lib/apt/lists/",
+    "var/cache/apk/",
+    "var/cache/yum/",
+    "var/cache/dnf/",
+    "root/.cache/pip/",
+    "root/.cache/pipenv/",
+    "root/.npm/_cacache/",
+    "usr/local/share/.cache/yarn/",
+)
+_CACHE_PATTERN = re.compile(r"(^|/)\.cache/(pip|pipenv|pypoetry)/")
+
+_SHELL_FORM = re.compile(r"^(RUN )?(\|\d+ .*?)?/bin/sh -c (#\(nop\)\s*(?P<nop_command>.*)|(?P<command>.*))$", re.S)
+
+_SIZE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([KMG]?)(i?)B?$", re.I)
+
+_WHITEOUT = ".wh."
+_OPAQUE = ".wh..wh..opq"
+# Members of a saved image small enough to read whole (manifests, configs, small layers)
+_SMALL = 4 << 20
+
+
+@dataclass
+class Layer:
+    """One filesystem layer, and the instruction that made it"""
+
+    index: int
+    instruction: str = ""
+    # Regular files (and links) the layer adds or replaces: {path: size}
+    files: Dict[str, int] = field(default_factory=dict)
+    # Paths the layer deletes, and directories whose earlier contents it hides
+    deleted: List[str] = field(default_factory=list)
+    opaque: List[str] = field(default_factory=list)
+
+    @property
+    def size(self) -> int:
+        return sum(self.files.values())
+
+
+@dataclass
+class Waste:
+    """Bytes a layer carries that the final image doesn't need"""
+
+    layer: Layer
+    kind: str
+    size: int
+    # The biggest culprits, as (path, size)
+    examples: List[Tuple[str, int]]
+    # For files deleted or replaced later: the layer that did it
+    by: Optional[Layer] = None
+
+
+def _normalize(name: str) -> str:
+    name = posixpath.normpath(name).lstrip("/")
+    return "" if name == "." else name
+
+
+def read_layer(fileobj) -> Layer:
+    """List what's in one layer's tarball (read as a stream)"""
+    layer = Layer(0)
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            path = _normalize(member.name)
+            parent, name = posixpath.split(path)
+            if name == _OPAQUE:
+                layer.opaque.append(parent)
+            elif name.startswith(_WHITEOUT):
+                layer.deleted.append(posixpath.join(parent, name[len(_WHITEOUT) :]))
+            elif not member.isdir():
+                layer.files[path] = member.size
+    return layer
+
+
+class _ChunkReader(io.RawIOBase):
+    """A file object over an iterable of byte chunks, like the docker SDK's `image.save()`"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def read_saved_image(chunks: Iterable[bytes]) -> Tuple[dict, List[Layer]]:
+    """The image config and layers (oldest first, instructions filled in) from `docker save` output"""
+    tarballs: Dict[str, Layer] = {}
+    documents: Dict[str, object] = {}
+    stream = io.BufferedReader(_ChunkReader(chunks), buffer_size=1 << 20)
+    with tarfile.open(fileobj=stream, mode="r|") as saved:
+        for member in saved:
+            if not member.isfile():
+                continue
+            name = _normalize(member.name)
+            f = saved.extractfile(member)
+            if member.size <= _SMALL:
+                data = f.read()
+                try:
+                    documents[name] = json.loads(data)
+                    continue
+                except ValueError:
+                    f = io.BytesIO(data)
+            try:
+                tarballs[name] = read_layer(f)
+            except tarfile.TarError:
+                # Something else (e.g. the legacy VERSION file); we don't need it
+                pass
+
+    manifest = documents["manifest.json"][0]
+    config = documents[_normalize(manifest["Config"])]
+    layers = []
+    for index, name in enumerate(manifest["Layers"]):
+        layer = tarballs.get(_normalize(name), Layer(index))
+        layer.index = index
+        layers.append(layer)
+
+    made_layers = [entry for entry in config.get("history", []) if not entry.get("empty_layer")]
+    for layer, entry in zip(layers, made_layers):
+        layer.instruction = instruction(entry.get("created_by", ""))
+    return config, layers
+
+
+def instruction(created_by: str) -> str:
+    """The Dockerfile instruction behind a history entry's `created_by`, more or less"""
+    text = re.sub(r"\s*# buildkit$", "", created_by.strip())
+    # e.g. "/bin/sh -c #(nop)  COPY ...", "|1 environment=dev /bin/sh -c pip ...", "RUN /bin/sh -c apt ..."
+    shell = _SHELL_FORM.match(text)
+    if shell:
+        text = shell.group("nop_command") or f"RUN {shell.group('command')}"
+    return " ".join(text.split())
+
+
+def _hidden_by(path: str, layer: Layer) -> bool:
+    """Whether a later `layer` deletes or replaces `path`"""
+    if path in layer.files:
+        return True
+    for deleted in layer.deleted:
+        if path == deleted or path.startswith(deleted + "/"):
+            return True
+    return any(path.startswith(opaque + "/") for opaque in layer.opaque if opaque)
+
+
+def _is_package_cache(path: str) -> bool:
+    return path.startswith(PACKAGE_CACHES) or _CACHE_PATTERN.search(path) is not None
+
+
+def _examples(files: Dict[str, int], count: int = 3) -> List[Tuple[str, int]]:
+    return sorted(files.items(), key=lambda item: (-item[1], item[0]))[:count]
+
+
+def find_waste(layers: List[Layer]) -> List[Waste]:
+    """Files deleted or replaced by a later layer, and package caches left in the final image; biggest first"""
+    waste = []
+    for i, layer in enumerate(layers):
+        removed: Dict[int, Dict[str, int]] = {}
+        caches: Dict[str, int] = {}
+        for path, size in layer.files.items():
+            later = next((other for other in layers[i + 1 :] if _hidden_by(path, other)), None)
+            if later is not None:
+                removed.setdefault(later.index, {})[path] = size
+            elif _is_package_cache(path):
+                caches[path] = size
+        for later_index, files in removed.items():
+            size = sum(files.values())
+            if size:
+                waste.append(Waste(layer, "deleted or replaced later", size, _examples(files), by=layers[later_index]))
+        if sum(caches.values()):
+            waste.append(Waste(layer, "package manager cache", sum(caches.values()), _examples(caches)))
+    return sorted(waste, key=lambda w: -w.size)
+
+
+def parse_size(size: str) -> int:
+    """Bytes in a size like `800MiB`, `1.5G` or `500MB` (K, M and G alone are binary, KB, MB and GB decimal)"""
+    match = _SIZE_RE.match(size.strip())
+    if not match:
+        raise ValueError(f"Can't make sense of size {size!r} (try e.g. 800MiB or 1.5G)")
+    number, unit, binary = match.groups()
+    if not unit:
+        return int(float(number))
+    base = 1000 if size.strip().upper().endswith("B") and not binary else 1024
+    return int(float(number) * base ** ("KMG".index(unit.upper()) + 1))
+
+
+def version_key(tag: str) -> Tuple[int, ...]:
+    """Sorts version tags like 1.10.0d after 1.9.2d"""
+    return tuple(int(part) for part in re.findall(r"\d+", tag))
+
+
+def _non_numeric(tag: str) -> str:
+    # e.g. 1.2.3-dev.4-locald -> ..-dev.-locald
+    return re.sub(r"\d+", "", tag)
+
+
+def previous_tag(tag: str, tags: Iterable[str]) -> Optional[str]:
+    """The latest of `tags` before `tag`, among those that differ from it only in their numbers
+
+    So 1.2.3-dev.4-locald follows 1.2.3-dev.3-locald, but not 1.2.2-locald or 1.2.2 (a different target).
+    """
+    earlier = [
+        other
+        for other in tags
+        if _non_numeric(other) == _non_numeric(tag) and version_key(other) and version_key(other) < version_key(tag)
+    ]
+    return max(earlier, key=version_key, default=None)
+
+
+__all__ = (
+    "Layer",
+    "PACKAGE_CACHES",
+    "Waste",
+    "find_waste",
+    "instruction",
+    "parse_size",
+    "previous_tag",
+    "read_layer",
+    "read_saved_image",
+    "version_key",
+)
@@ -0,0 +1,137 @@
+"""Pushing an image under several tags, following the daemon's progress stream
+
+The docker SDK's `images.push` hands back the whole JSON stream as one string and never looks inside
+it, so a push that failed halfway through still "succeeds". Here the stream is followed as it
+arrives: layer progress is echoed (prefixed by tag), and an error event fails the push.
+
+The first tag uploads the layers; the other tags are pushed after it, side by side, by which time
+the registry already has every layer and only their manifests go over the wire.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+import click
+
+from forj import trace
+
+# Layer statuses that mean nothing had to be uploaded
+_EXISTING_STATUSES = ("Layer already exists", "Mounted from")
+# How often (in percent) to report a layer's upload progress
+_PROGRESS_STEP = 25
+
+
+class PushProgress:
+    """Follow one push's decoded JSON stream
+
+    `feed` it each chunk from `APIClient.push(..., stream=True, decode=True)`. Layers listed in
+    `shared` were already uploaded by a sibling tag, so their (boring) statuses aren't echoed.
+    """
+
+    def __init__(self, prefix: str = "", echo: bool = True, shared: Optional[Set[str]] = None):
+        self.prefix = prefix
+        self.echo = echo
+        self.shared = shared if shared is not None else set()
+        self.layers: Dict[str, str] = {}
+        self.error = None
+        self.digest = None
+        self._reported: Dict[str, int] = {}
+
+    @property
+    def uploaded(self) -> List[str]:
+        return [layer for layer, status in self.layers.items() if status == "Pushed"]
+
+    @property
+    def existing(self) -> List[str]:
+        return [layer for layer, status in self.layers.items() if status.startswith(_EXISTING_STATUSES)]
+
+    def feed(self, chunk: dict):
+        if "error" in chunk or "errorDetail" in chunk:
+            self.error = (chunk.get("error") or chunk["errorDetail"].get("message", "")).strip()
+            self._line(self.error, fg="red")
+        elif "id" in chunk and "status" in chunk:
+            self._layer(chunk["id"], chunk["status"], chunk.get("progressDetail") or {})
+        elif "status" in chunk:
+            self._line(chunk["status"])
+        if "aux" in chunk and "Digest" in chunk["aux"]:
+            self.digest = chunk["aux"]["Digest"]
+
+    def _layer(self, layer: str, status: str, detail: dict):
+        previous = self.layers.get(layer)
+        self.layers[layer] = status
+        if layer in self.shared:
+            return
+        if status == "Pushing":
+            total, current = detail.get("total"), detail.get("current")
+            if not total or current is None:
+                return
+            percent = min(100, current * 100 // total) // _PROGRESS_STEP * _PROGRESS_STEP
+            if percent > self._reported.get(layer, -1):
+                self._reported[layer] = percent
+                self._line(f"{layer}: Pushing {percent}% of {total} bytes")
+        elif status != previous:
+            self._line(f"{layer}: {status}")
+
+    def _line(self, line: str, fg: Optional[str] = None):
+        if self.echo:
+            click.secho(f"{self.prefix}{line}", fg=fg)
+
+
+def push_tags(docker_client, image: str, source_tag: str, tags: List[str], jobs: Optional[int] = None):
+    """Tag `image:source_tag` as each of `tags` and push them all
+
+    Returns `{tag: (status, seconds, PushProgress)}`, status being "pushed", "failed" or "skipped"
+    (when the first tag failed, there's no point trying the others).
+    """
+    tags = list(dict.fromkeys(tags))
+    for tag in tags:
+        if tag != source_tag:
+            docker_client.api.tag(f"{image}:{source_tag}", image, tag)
+
+    width = max(len(t) for t in tags)
+    shared: Set[str] = set()
+    shared_lock = threading.Lock()
+
+    def push_one(tag):
+        started = time.monotonic()
+        with shared_lock:
+            progress = PushProgress(prefix=f"[{tag:<{width}}] ", shared=set(shared))
+        with trace.span(f"docker push {tag}", "docker push"):
+            for chunk in docker_client.api.push(image, tag=tag, stream=True, decode=True):
+                progress.feed(chunk)
+        if not progress.error and not progress.digest:
+            progress.error = "Push finished without the registry reporting a digest"
+        with shared_lock:
+            shared.update(progress.layers)
+        return ("failed" if progress.error else "pushed", time.monotonic() - started, progress)
+
+    first, *rest = tags
+    results = {first: push_one(first)}
+    if results[first][0] == "failed":
+        results.update({tag: ("skipped", 0.0, None) for tag in rest})
+    elif rest:
+        with ThreadPoolExecutor(max_workers=jobs or min(len(rest), 4)) as pool:
+            for tag, result in zip(rest, pool.map(push_one, rest)):
+                results[tag] = result
+    return results
+
+
+def print_summary(image: str, results: dict):
+    click.secho("Push summary:", fg="bright_magenta")
+    width = max(len(t) for t in results)
+    for tag, (status, seconds, progress) in results.items():
+        layers = f"{len(progress.uploaded)} up, {len(progress.existing)} existing" if progress else ""
+        digest = (progress.digest or "")[:19] if progress else ""
+        click.secho(
+            f"  {tag:<{width}}  {status:<7}  {seconds:7.1f}s  {layers:<22}  {digest}  {image}:{tag}",
+            fg="green" if status == "pushed" else "red",
+        )
+
+
+__all__ = (
+    "PushProgress",
+    "print_summary",
+    "push_tags",
+)
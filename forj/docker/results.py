@@ -0,0 +1,94 @@
+"""Remembering how `forj docker test` runs went, so an identical run that passed can be skipped
+
+A run is identified by the image's ID, the mark expression and a hash of the env file: with all of
+those the same, the tests are too. Results live under the user cache dir, a file per image ID, so
+every checkout of a project shares them; only the `MAX_IMAGES` most recently tested images' are
+kept. Recording takes a lock, as other forj processes may be recording at the same time.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from forj.util import user_cache_dir
+
+MAX_IMAGES = 50
+
+
+def _results_dir() -> Path:
+    return user_cache_dir("test-results")
+
+
+def _results_path(image_id: str) -> Path:
+    # e.g. sha256:abc... -> abc....json
+    return _results_dir() / f"{image_id.split(':')[-1]}.json"
+
+
+@contextlib.contextmanager
+def _locked():
+    with open(_results_dir() / ".lock", "w") as lock:
+        # Released when the file's closed
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _load(image_id: str) -> dict:
+    try:
+        return json.loads(_results_path(image_id).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def file_hash(path: str) -> str:
+    """sha256 of a file, or "" if there's no such file"""
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return ""
+
+
+def result_key(mark_expr: str, env_hash: str) -> str:
+    """What identifies a test run on a given image"""
+    return hashlib.sha256(json.dumps([mark_expr, env_hash]).encode()).hexdigest()
+
+
+def lookup(image_id: str, key: str) -> Optional[dict]:
+    """The recorded result of a run on an image, if there is one: {"passed", "status", "seconds", "when", ...}"""
+    return _load(image_id).get(key)
+
+
+def record(image_id: str, key: str, status: int, seconds: float, **details):
+    """Remember how a run on an image went"""
+    with _locked():
+        results = _load(image_id)
+        results[key] = {
+            "passed": status == 0,
+            "status": status,
+            "seconds": round(seconds, 3),
+            "when": time.time(),
+            **details,
+        }
+        path = _results_path(image_id)
+        with tempfile.NamedTemporaryFile("wt", dir=path.parent, delete=False) as f:
+            json.dump(results, f, indent=1)
+        os.replace(f.name, path)
+
+        # Having just been written, this image's results are the newest
+        by_age = sorted(_results_dir().glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for stale in by_age[: max(0, len(by_age) - MAX_IMAGES)]:
+            stale.unlink()
+
+
+__all__ = (
+    "MAX_IMAGES",
+    "file_hash",
+    "lookup",
+    "record",
+    "result_key",
+)
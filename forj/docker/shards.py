@@ -0,0 +1,194 @@
+"""Sharded test runs: split a suite over several containers running side by side
+
+Test IDs are collected once, then dealt out to shards so each gets about the same total runtime,
+going by durations recorded on previous runs. Every shard is a separate container from the same
+image, and their JUnit reports and exit statuses are merged at the end.
+
+This relies on `scripts/run-tests.sh` passing any arguments after the mark expression on to pytest.
+Each shard's test IDs go in a file pytest reads them from (`@file`, pytest 8.2 and up) rather
+than on the command line, which a big enough suite would overflow.
+"""
+
+import heapq
+import json
+import threading
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from pathlib import Path
+from statistics import median
+from subprocess import PIPE, STDOUT, Popen, run
+from typing import Dict, List, Optional
+
+import click
+
+from forj import trace
+
+from .docker import ENV_FILE
+
+# Where shards write their JUnit reports, inside the container
+_CONTAINER_RESULTS_DIR = "/forj-test-results"
+
+
+@dataclass
+class Shard:
+    index: int
+    tests: List[str] = field(default_factory=list)
+    predicted: float = 0.0
+    seconds: float = 0.0
+    returncode: Optional[int] = None
+
+
+def _docker_run(image: str, volumes: Dict[str, str] = None) -> List[str]:
+    cmd = ["docker", "run", "--rm", "--network", "host", "--env-file", ENV_FILE]
+    for host, container in (volumes or {}).items():
+        cmd += ["-v", f"{host}:{container}"]
+    return [*cmd, image]
+
+
+def collect(image: str, mark_expr: str) -> List[str]:
+    """The IDs of the tests `run-tests.sh` would run for a mark expression"""
+    proc = run(
+        [*_docker_run(image), "scripts/run-tests.sh", mark_expr, "--collect-only", "-q"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    # pytest exits 5 when nothing matched, which is fine here
+    if proc.returncode not in (0, 5):
+        click.echo(proc.stdout + proc.stderr)
+        raise click.ClickException(f"Test collection failed (exit {proc.returncode})")
+    return [line.strip() for line in proc.stdout.splitlines() if "::" in line]
+
+
+def plan(tests: List[str], durations: Dict[str, float], shards: int) -> List[Shard]:
+    """Deal tests out to shards, longest first, always to the shard with the least work so far
+
+    Tests without a recorded duration are assumed to take the median of the ones we know.
+    """
+    default = median(durations.values()) if durations else 1.0
+    heap = [(0.0, i, Shard(i)) for i in range(min(shards, len(tests)))]
+    for test in sorted(tests, key=lambda t: (-durations.get(t, default), t)):
+        load, i, shard = heapq.heappop(heap)
+        shard.tests.append(test)
+        shard.predicted = load + durations.get(test, default)
+        heapq.heappush(heap, (shard.predicted, i, shard))
+    return sorted((shard for _, _, shard in heap), key=lambda shard: shard.index)
+
+
+def _junit_key(testcase: ET.Element):
+    return testcase.get("classname", ""), testcase.get("name", "")
+
+
+def _node_key(test_id: str):
+    """What pytest's JUnit report calls a test: dotted module path + classes, and the test name"""
+    path, *parts = test_id.split("::")
+    module = path[: -len(".py")] if path.endswith(".py") else path
+    return ".".join([module.replace("/", "."), *parts[:-1]]), parts[-1] if parts else ""
+
+
+def merge_reports(reports: List[Path], out: Path) -> ET.Element:
+    """Combine several JUnit reports into one `<testsuites>` document"""
+    merged = ET.Element("testsuites")
+    for report in reports:
+        if not report.is_file():
+            continue
+        root = ET.parse(report).getroot()
+        merged.extend(root.iter("testsuite") if root.tag == "testsuites" else [root])
+    for attr in ("tests", "failures", "errors", "skipped"):
+        merged.set(attr, str(sum(int(suite.get(attr, 0)) for suite in merged)))
+    merged.set("time", f"{sum(float(suite.get('time', 0)) for suite in merged):.3f}")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    ET.ElementTree(merged).write(out, encoding="utf-8", xml_declaration=True)
+    return merged
+
+
+def record_durations(merged: ET.Element, tests: List[str], durations_file: Path):
+    """Fold this run's per-test times into the stored durations"""
+    durations = json.loads(durations_file.read_text()) if durations_file.is_file() else {}
+    by_key = {_node_key(test): test for test in tests}
+    for testcase in merged.iter("testcase"):
+        test = by_key.get(_junit_key(testcase))
+        if test:
+            durations[test] = float(testcase.get("time", 0))
+    durations_file.write_text(json.dumps(durations, indent=1, sort_keys=True))
+
+
+def _run_shard(image: str, mark_expr: str, shard: Shard, count: int, results_dir: Path):
+    """Run one shard's tests, setting its `returncode` come what may (non-zero if it couldn't run)"""
+    prefix = f"[shard {shard.index + 1}/{count}] "
+    args_file = f"shard-{shard.index}.args"
+    started = time.monotonic()
+    try:
+        (results_dir / args_file).write_text("".join(f"{test}\n" for test in shard.tests), encoding="utf-8")
+        cmd = [
+            *_docker_run(image, {str(results_dir.resolve()): _CONTAINER_RESULTS_DIR}),
+            "scripts/run-tests.sh",
+            mark_expr,
+            f"--junitxml={_CONTAINER_RESULTS_DIR}/shard-{shard.index}.xml",
+            f"@{_CONTAINER_RESULTS_DIR}/{args_file}",
+        ]
+        with Popen(cmd, stdout=PIPE, stderr=STDOUT, text=True) as proc:
+            for line in proc.stdout:
+                click.echo(f"{prefix}{line.rstrip()}")
+        # Killed by a signal: the shell's 128 + signal, so it can't pass for success in the merged status
+        shard.returncode = proc.returncode if proc.returncode >= 0 else 128 - proc.returncode
+    except Exception as ex:  # pylint: disable=broad-except
+        click.secho(f"{prefix}Couldn't run the shard: {ex}", fg="red")
+        shard.returncode = 1
+    shard.seconds = time.monotonic() - started
+    trace.record(f"test shard {shard.index + 1}/{count}", "container", started, started + shard.seconds)
+
+
+def run_sharded(image: str, mark_expr: str, shards: int, state_dir: Path, junitxml: Path) -> int:
+    """Run the suite split over `shards` containers; returns the merged exit status"""
+    tests = collect(image, mark_expr)
+    if not tests:
+        click.secho("No tests collected", fg="yellow")
+        return 5
+
+    durations_file = state_dir / "test-durations.json"
+    durations = json.loads(durations_file.read_text()) if durations_file.is_file() else {}
+    planned = plan(tests, durations, shards)
+
+    results_dir = state_dir / "test-shards"
+    results_dir.mkdir(parents=True, exist_ok=True)
+    for stale in [*results_dir.glob("shard-*.xml"), *results_dir.glob("shard-*.args")]:
+        stale.unlink()
+
+    click.secho(f"Running {len(tests)} tests in {len(planned)} shards", fg="bright_magenta")
+    threads = [
+        threading.Thread(target=_run_shard, args=(image, mark_expr, shard, len(planned), results_dir))
+        for shard in planned
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged = merge_reports([results_dir / f"shard-{shard.index}.xml" for shard in planned], junitxml)
+    record_durations(merged, tests, durations_file)
+
+    click.secho("Shard summary:", fg="bright_magenta")
+    for shard in planned:
+        click.secho(
+            f"  shard {shard.index + 1}: {len(shard.tests):5d} tests  "
+            f"predicted {shard.predicted:7.1f}s  took {shard.seconds:7.1f}s  exit {shard.returncode}",
+            fg="green" if shard.returncode == 0 else "red",
+        )
+    click.secho(
+        f"  {merged.get('tests')} tests, {merged.get('failures')} failures, {merged.get('errors')} errors; "
+        f"report: {junitxml}",
+        fg="magenta",
+    )
+    return max(shard.returncode for shard in planned)
+
+
+__all__ = (
+    "Shard",
+    "collect",
+    "merge_reports",
+    "plan",
+    "record_durations",
+    "run_sharded",
+)
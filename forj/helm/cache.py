@@ -0,0 +1,134 @@
+"""A shared cache of chart dependency archives
+
+`helm dependency update` re-fetches every subchart every time. Instead, after an update we file the
+archives it left in `charts/` away under the user cache dir, content-addressed, with a manifest
+keyed by the chart's dependency spec (Chart.yaml, Chart.lock, and the contents of any `file://`
+dependencies). Next time the key matches, `charts/` is restored from the cache and helm is skipped.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from forj.util import user_cache_dir
+
+_FILE_REPOSITORY_RE = re.compile(r"""^\s*-?\s*repository:\s*["']?file://([^"'\s]+)["']?\s*$""", re.MULTILINE)
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def local_dependencies(chart_dir: Path) -> List[Path]:
+    """The directories of a chart's `file://` dependencies"""
+    chart_dir = Path(chart_dir)
+    chart_yaml = (chart_dir / "Chart.yaml").read_text(encoding="utf-8")
+    return [(chart_dir / local).resolve() for local in sorted(_FILE_REPOSITORY_RE.findall(chart_yaml))]
+
+
+def dependency_key(chart_dir: Path) -> Optional[str]:
+    """Digest of everything that decides what `helm dependency update` puts in `charts/`
+
+    None if there's no Chart.lock yet, in which case there's nothing to go on.
+    """
+    chart_dir = Path(chart_dir)
+    chart_yaml, chart_lock = chart_dir / "Chart.yaml", chart_dir / "Chart.lock"
+    if not chart_lock.is_file():
+        return None
+
+    digest = hashlib.sha256()
+    for path in (chart_yaml, chart_lock):
+        digest.update(path.read_bytes() + b"\0")
+
+    # Local dependencies can change without the lock noticing
+    for local_dir in local_dependencies(chart_dir):
+        digest.update(os.path.relpath(local_dir, chart_dir.resolve()).encode() + b"\0")
+        for dirpath, dirnames, filenames in os.walk(local_dir):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = Path(dirpath) / name
+                digest.update(str(path.relative_to(local_dir)).encode() + b"\0" + _hash_file(path).encode())
+    return digest.hexdigest()
+
+
+def _cache_dir() -> Path:
+    return user_cache_dir("helm-dependencies")
+
+
+def _manifest_path(key: str) -> Path:
+    return _cache_dir() / "manifests" / f"{key}.json"
+
+
+def _blob_path(sha: str) -> Path:
+    return _cache_dir() / "blobs" / sha[:2] / sha
+
+
+def restore(chart_dir: Path, key: str) -> Optional[int]:
+    """Make `charts/` match the cached archives for `key`
+
+    Returns how many archives had to be copied in, or None if `key` isn't cached.
+    """
+    manifest_path = _manifest_path(key)
+    if not manifest_path.is_file():
+        return None
+    manifest: Dict[str, str] = json.loads(manifest_path.read_text())
+    if not all(_blob_path(sha).is_file() for sha in manifest.values()):
+        return None
+
+    charts = Path(chart_dir) / "charts"
+    charts.mkdir(exist_ok=True)
+    for stale in charts.glob("*.tgz"):
+        if stale.name not in manifest:
+            stale.unlink()
+
+    copied = 0
+    for name, sha in manifest.items():
+        target = charts / name
+        if target.is_file() and _hash_file(target) == sha:
+            continue
+        shutil.copyfile(_blob_path(sha), target)
+        copied += 1
+    return copied
+
+
+def store(chart_dir: Path, key: str):
+    """File away the archives in `charts/` under `key`"""
+    manifest = {}
+    for archive in sorted((Path(chart_dir) / "charts").glob("*.tgz")):
+        sha = _hash_file(archive)
+        blob = _blob_path(sha)
+        if not blob.is_file():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            _atomic_copy(archive, blob)
+        manifest[archive.name] = sha
+
+    manifest_path = _manifest_path(key)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wt", dir=manifest_path.parent, delete=False) as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(f.name, manifest_path)
+
+
+def _atomic_copy(src: Path, dst: Path):
+    # Other forj processes may be reading the cache, so never let them see half a file
+    with tempfile.NamedTemporaryFile(dir=dst.parent, delete=False) as f:
+        tmp = Path(f.name)
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+__all__ = (
+    "dependency_key",
+    "local_dependencies",
+    "restore",
+    "store",
+)
@@ -3,8 +3,10 @@ from pathlib import Path
 import click
 
 from forj.config import get_config
+from forj.version.util import deduce as deduce_version
 
 from . import helm
+from .multi import discover_charts, run_charts
 
 
 class Helm:
@@ -13,33 +15,47 @@ class Helm:
     Requires a chart_dir, set either in your `forj init` command or with this class.
 
     Args:
-        chart_dir (str): path to your charts. Will override the chart dir (if any) set in your forj init.
+        chart_dirs ([str]): paths to your charts. Will override the chart dir (if any) set in your forj init.
+        charts_root (str): find every chart under this directory instead
 
     Raises:
         ValueError if a chart dir is not set at forj init or with this class.
     """
 
-    def __init__(self, chart_dir: str):
+    def __init__(self, chart_dirs: [str], charts_root: str = None):
         project_config, _ = get_config()
-        self.chart_dir: str = (
-            Path(chart_dir) if chart_dir else Path(project_config.chart_dir)
-        )
-
-        if not self.chart_dir:
+        if charts_root:
+            self.chart_dirs = discover_charts(Path(charts_root))
+        elif chart_dirs:
+            self.chart_dirs = [Path(chart_dir) for chart_dir in chart_dirs]
+        elif project_config.chart_dir:
+            self.chart_dirs = [Path(project_config.chart_dir)]
+        else:
+            self.chart_dirs = []
+
+        if not self.chart_dirs:
             raise ValueError(
                 "must set a chart option in your `forj helm` command or forj init."
             )
+        self.chart_dir: Path = self.chart_dirs[0]
 
 
 @click.group(name="helm")
 @click.option(
     "--chart-dir",
+    "chart_dirs",
     type=str,
+    multiple=True,
+    help="override the chart dir in your forj init. Repeat to work on several charts",
+)
+@click.option(
+    "--charts-root",
+    type=click.Path(exists=True, file_okay=False),
     default=None,
-    help="override the chart dir in your forj init.",
+    help="work on every chart found under this directory",
 )
 @click.pass_context
-def commands(ctx, chart_dir):
+def commands(ctx, chart_dirs, charts_root):
     """Various commands for helm charts.
 
     You must indicate where your charts are located either by:
@@ -47,10 +63,13 @@ def commands(ctx, chart_dir):
     \b
     1) setting the chart_dir during forj init
     2) override the init chart dir in a forj helm command: `forj helm --chart-dir "./my-chart/" lint`
+    3) for monorepos, repeating --chart-dir or using `--charts-root` to find every chart in a tree
 
+    With several charts, package and lint run charts in `file://` dependency order, independent
+    ones concurrently.
     """
 
-    ctx.obj = Helm(chart_dir)
+    ctx.obj = Helm(chart_dirs, charts_root)
 
 
 @commands.command()
@@ -70,29 +89,84 @@ def commands(ctx, chart_dir):
     is_flag=True,
     help="When packaging, don't change the chart app version to the locally deduced value",
 )
+@click.option(
+    "--no-dependency-cache",
+    is_flag=True,
+    help="Always run `helm dependency update`, even if Chart.lock hasn't changed",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="With several charts, how many to work on at once (Default: up to 4)",
+)
 @click.pass_context
-def package(ctx, skip_refresh, skip_auto_version, skip_auto_app_version):
+def package(ctx, skip_refresh, skip_auto_version, skip_auto_app_version, no_dependency_cache, jobs):
     """Package a chart directory into a chart archive"""
 
-    helm.package(
-        ctx.obj.chart_dir,
-        skip_refresh,
-        (not skip_auto_version),
-        (not skip_auto_app_version),
+    package_args = dict(
+        skip_refresh=skip_refresh,
+        auto_version=(not skip_auto_version),
+        auto_app_version=(not skip_auto_app_version),
+        use_dependency_cache=(not no_dependency_cache),
+        # Every chart gets the same version, so only work it out once
+        version=deduce_version() if not (skip_auto_version and skip_auto_app_version) else None,
     )
+    if len(ctx.obj.chart_dirs) == 1:
+        helm.package(ctx.obj.chart_dir, **package_args)
+    else:
+        run_charts(
+            ctx.obj.chart_dirs,
+            lambda chart_dir, prefix: helm.package(chart_dir, prefix=prefix, **package_args),
+            jobs,
+            "package",
+        )
 
 
 @commands.command()
+@click.option(
+    "--chart",
+    "charts",
+    type=click.Path(exists=True, dir_okay=False),
+    multiple=True,
+    help="A packaged chart (.tgz) to push; repeat for several (Default: the latest package of the chart dir)",
+)
+@click.option(
+    "--repo",
+    "repos",
+    type=str,
+    multiple=True,
+    help="A chartmuseum URL to push to; repeat for several (Default: $CHART_REPO)",
+)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="How many uploads to run at once (Default: up to 4)",
+)
 @click.pass_context
-def push(ctx):
+def push(ctx, charts, repos, jobs):
     """Push a helm chart to the chartmuseum"""
 
-    helm.push(ctx.obj.chart_dir)
+    packaged_charts = [Path(c) for c in charts] or [helm.find_packaged_chart(d) for d in ctx.obj.chart_dirs]
+    helm.push(ctx.obj.chart_dir, packaged_charts, list(repos), jobs)
 
 
 @commands.command()
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="With several charts, how many to lint at once (Default: up to 4)",
+)
 @click.pass_context
-def lint(ctx):
+def lint(ctx, jobs):
     """lint a helm chart"""
 
-    helm.lint(ctx.obj.chart_dir)
+    if len(ctx.obj.chart_dirs) == 1:
+        helm.lint(ctx.obj.chart_dir)
+    else:
+        run_charts(ctx.obj.chart_dirs, helm.lint, jobs, "lint")
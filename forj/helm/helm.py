@@ -1,82 +1,188 @@
 import os
-from subprocess import run
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import PIPE, STDOUT, CalledProcessError, Popen
 
 import click
-import requests
 
+from forj import trace
+from forj.util import run_echoed
 from forj.version.util import deduce as deduce_version
 
-"""helm utils"""
+from . import cache as dependency_cache
 
+"""helm utils"""
 
-def dependency_update(chart_dir, skip_refresh):
-    """update helm dependencies"""
+# How hard to try uploading a chart; backoff doubles from this many seconds between retries
+_PUSH_RETRIES = 5
+_PUSH_BACKOFF_FACTOR = 0.5
+
+
+def _run(cmd, fg, prefix=""):
+    """Echo and run a helm command; with a `prefix`, its output is prefixed line by line"""
+    click.secho(f"{prefix}{cmd}", fg=fg)
+    with trace.span(cmd, "helm"):
+        if not prefix:
+            run_echoed(cmd, shell=True, check=True)
+            return
+        with Popen(cmd, shell=True, stdout=PIPE, stderr=STDOUT, text=True) as proc:
+            for line in proc.stdout:
+                click.echo(f"{prefix}{line.rstrip()}")
+    if proc.returncode:
+        raise CalledProcessError(proc.returncode, cmd)
+
+
+def dependency_update(chart_dir, skip_refresh, use_cache=True, prefix=""):
+    """update helm dependencies
+
+    If Chart.yaml/Chart.lock (and any file:// dependencies) are the same as on an earlier update,
+    `charts/` is restored from the shared dependency cache and helm isn't run at all.
+    """
+
+    with trace.span(f"dependency cache {chart_dir}", "helm cache") as span_args:
+        key = dependency_cache.dependency_key(chart_dir) if use_cache else None
+        copied = dependency_cache.restore(chart_dir, key) if key else None
+        span_args["cached"] = copied is not None
+    if copied is not None:
+        click.secho(
+            f"{prefix}Dependencies of {chart_dir} unchanged; restored from cache ({copied} archive(s) copied)",
+            fg="yellow",
+        )
+        return
 
     if skip_refresh:
         cmd = f"helm dependency update {chart_dir} --skip-refresh"
     else:
         cmd = f"helm dependency update {chart_dir}"
-    click.secho(cmd, fg="yellow")
-    run(cmd, shell=True, check=True)
-
-
-def package(chart_dir, skip_refresh, auto_version=True, auto_app_version=False):
-    """Package a chart directory into a chart archive"""
+    _run(cmd, "yellow", prefix)
+
+    if use_cache:
+        # The update may well have rewritten Chart.lock
+        with trace.span(f"dependency cache store {chart_dir}", "helm cache"):
+            key = dependency_cache.dependency_key(chart_dir)
+            if key:
+                dependency_cache.store(chart_dir, key)
+
+
+def package(
+    chart_dir,
+    skip_refresh,
+    auto_version=True,
+    auto_app_version=False,
+    use_dependency_cache=True,
+    version=None,
+    prefix="",
+):
+    """Package a chart directory into a chart archive
+
+    `version` is deduced if it's needed and not given.
+    """
 
     # update dependencies
-    dependency_update(chart_dir=chart_dir, skip_refresh=skip_refresh)
+    dependency_update(chart_dir=chart_dir, skip_refresh=skip_refresh, use_cache=use_dependency_cache, prefix=prefix)
 
     # lint chart dir
-    lint(chart_dir)
+    lint(chart_dir, prefix=prefix)
 
+    if (auto_version or auto_app_version) and not version:
+        version = deduce_version()
     version_args = ""
     if auto_version:
-        version_args += f"--version {deduce_version()} "
+        version_args += f"--version {version} "
     if auto_app_version:
-        version_args += f"--app-version {deduce_version()}"
+        version_args += f"--app-version {version}"
 
     # package chart dir
     cmd = f"helm package {chart_dir} -d {chart_dir.parent} {version_args}"
-    click.secho(cmd, fg="magenta")
-    run(cmd, shell=True, check=True)
+    _run(cmd, "magenta", prefix)
 
 
-def push(chart_dir):
-    """Push a packaged chart to chart museum"""
+def _chartmuseum_session(pool_size: int):
+    """A requests session that retries (with backoff) on connection errors and 5xx responses"""
+    import requests
+    from urllib3.util.retry import Retry
 
-    try:
-        chartmuseum_creds = os.environ["CHARTMUSEUM_CREDS"]
-        chart_repo = os.environ["CHART_REPO"]
-    except KeyError:
-        raise KeyError(
-            "Missing CHART_REPO or CHARTMUSEUM_CREDS environment variable(s)."
-        )
+    retry = Retry(
+        total=_PUSH_RETRIES,
+        backoff_factor=_PUSH_BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        # Uploads are POSTs, which urllib3 won't retry unless told to
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-    chartmuseum_uname, chartmuseum_pwd = chartmuseum_creds.split(":")
 
-    try:
-        packaged_chart = list(chart_dir.parent.glob(f"{chart_dir.name}*.tgz"))[0]
-    except IndexError:
+def find_packaged_chart(chart_dir):
+    """The most recently packaged archive for a chart directory"""
+    packaged = sorted(chart_dir.parent.glob(f"{chart_dir.name}*.tgz"), key=lambda p: p.stat().st_mtime)
+    if not packaged:
         click.secho(
             "Could not find packaged chart. Have you run forj helm package?",
             fg="yellow",
         )
+        raise FileNotFoundError(f"No packaged chart for {chart_dir} in {chart_dir.parent}")
+    return packaged[-1]
 
+
+def _push_one(session, packaged_chart, chart_repo, auth):
     url = f"{chart_repo}/api/charts"
+    # Passing the open file streams it, and lets urllib3 rewind it if the upload is retried
     with open(packaged_chart, "rb") as f:
-        data = f.read()
+        response = session.post(url, data=f, auth=auth, headers={"Content-Type": "application/octet-stream"})
+    return response
 
-    response = requests.post(
-        url,
-        data=data,
-        auth=(chartmuseum_uname, chartmuseum_pwd),
-    )
-    click.secho(response.status_code, fg="green")
 
+def push(chart_dir, packaged_charts=None, chart_repos=None, jobs=None):
+    """Push packaged charts to chart museum(s)
+
+    Pushes the latest package of `chart_dir` unless `packaged_charts` are given, to `CHART_REPO`
+    unless `chart_repos` are given. Every chart goes to every repo, several at once.
+    """
+    try:
+        chartmuseum_creds = os.environ["CHARTMUSEUM_CREDS"]
+        chart_repos = chart_repos or [os.environ["CHART_REPO"]]
+    except KeyError:
+        raise KeyError(
+            "Missing CHART_REPO or CHARTMUSEUM_CREDS environment variable(s)."
+        )
 
-def lint(chart_dir):
+    chartmuseum_uname, chartmuseum_pwd = chartmuseum_creds.split(":", 1)
+    packaged_charts = packaged_charts or [find_packaged_chart(chart_dir)]
+
+    uploads = [(chart, repo) for chart in packaged_charts for repo in chart_repos]
+    workers = jobs or min(len(uploads), 4)
+    session = _chartmuseum_session(workers)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            (chart, repo, pool.submit(_push_one, session, chart, repo, (chartmuseum_uname, chartmuseum_pwd)))
+            for chart, repo in uploads
+        ]
+        for chart, repo, future in futures:
+            try:
+                response = future.result()
+            except Exception as ex:  # pylint: disable=broad-except
+                failed += 1
+                click.secho(f"{chart} -> {repo}: {ex}", fg="red")
+                continue
+            ok = response.status_code < 400
+            failed += not ok
+            click.secho(
+                f"{chart} -> {repo}: {response.status_code}" + ("" if ok else f" {response.text.strip()}"),
+                fg="green" if ok else "red",
+            )
+
+    if failed:
+        raise RuntimeError(f"{failed} of {len(uploads)} chart uploads failed")
+
+
+def lint(chart_dir, prefix=""):
     """lint a helm chart"""
 
     cmd = f"helm lint {chart_dir}"
-    click.secho(cmd, fg="green")
-    run(cmd, shell=True, check=True)
+    _run(cmd, "green", prefix)
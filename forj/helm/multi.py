@@ -0,0 +1,79 @@
+"""Working on many charts at once, for monorepos
+
+Charts are run in dependency order (a chart waits for its `file://` dependencies that are also being
+worked on), with independent charts running side by side.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import click
+
+from .cache import local_dependencies
+
+
+def discover_charts(root: Path) -> List[Path]:
+    """Every chart directory under `root`, not counting vendored subcharts"""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if "Chart.yaml" in filenames:
+            found.append(Path(dirpath))
+        dirnames[:] = sorted(d for d in dirnames if d != "charts" and not d.startswith("."))
+    return found
+
+
+def run_charts(chart_dirs: List[Path], action: Callable, jobs: Optional[int] = None, verb: str = "process"):
+    """Call `action(chart_dir, prefix=...)` for every chart, dependencies first, several at once
+
+    Charts depending on one that failed are skipped. Prints a per-chart timing summary, then raises
+    if anything failed.
+    """
+    charts = {Path(c).resolve(): Path(c) for c in chart_dirs}
+    deps = {c: [d for d in local_dependencies(c) if d in charts and d != c] for c in charts}
+    width = max(len(str(c)) for c in charts.values())
+
+    def timed(chart):
+        started = time.monotonic()
+        try:
+            action(charts[chart], prefix=f"[{str(charts[chart]):<{width}}] ")
+            return "ok", time.monotonic() - started
+        except Exception as ex:  # pylint: disable=broad-except
+            click.secho(f"[{charts[chart]}] {ex}", fg="red")
+            return "failed", time.monotonic() - started
+
+    results: Dict[Path, tuple] = {}
+    pending, running = list(charts), {}
+    with ThreadPoolExecutor(max_workers=jobs or min(len(charts), 4)) as pool:
+        while pending or running:
+            for chart in list(pending):
+                if any(results.get(d, ("ok",))[0] != "ok" for d in deps[chart] if d in results):
+                    results[chart] = ("skipped", 0.0)
+                    pending.remove(chart)
+                elif all(d in results for d in deps[chart]):
+                    running[pool.submit(timed, chart)] = chart
+                    pending.remove(chart)
+            if not running:
+                if pending:
+                    raise ValueError(f"Dependency cycle between charts: {', '.join(str(charts[c]) for c in pending)}")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    click.secho(f"helm {verb} summary:", fg="bright_magenta")
+    for chart, path in charts.items():
+        status, seconds = results[chart]
+        click.secho(f"  {str(path):<{width}}  {status:<7}  {seconds:7.1f}s", fg="green" if status == "ok" else "red")
+
+    failed = [charts[c] for c, (status, _) in results.items() if status != "ok"]
+    if failed:
+        raise RuntimeError(f"helm {verb} failed for {len(failed)} of {len(charts)} charts")
+
+
+__all__ = (
+    "discover_charts",
+    "run_charts",
+)
@@ -0,0 +1,2 @@
+from .commands import commands
+from .pipeline import Step, load_pipeline, run_pipeline
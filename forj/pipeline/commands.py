@@ -0,0 +1,33 @@
+import click
+
+from .pipeline import load_pipeline, run_pipeline
+
+
+@click.command(name="run")
+@click.argument("pipeline", type=str)
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="How many steps to run at once (Default: up to 4)",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Run every step, even those whose inputs haven't changed since they last succeeded",
+)
+def commands(pipeline, jobs, force):
+    """Run a pipeline of forj commands defined in .forjproject
+
+    Steps run in-process as soon as the steps they need have succeeded, several at once, with
+    their output prefixed by step name. Steps with `inputs` are skipped if nothing they depend on
+    has changed since they last succeeded.
+    """
+    try:
+        steps = load_pipeline(pipeline)
+    except (KeyError, ValueError) as ex:
+        raise click.UsageError(ex.args[0])
+    status = run_pipeline(pipeline, steps, jobs=jobs, force=force)
+    if status:
+        raise SystemExit(status)
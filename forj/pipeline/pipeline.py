@@ -0,0 +1,264 @@
+"""`forj run`: a pipeline of forj commands, run in-process as a dependency graph
+
+Pipelines live in `.forjproject`, under `pipelines`:
+
+    "pipelines": {
+        "ci": {
+            "build": {"run": "docker build"},
+            "lint": {"run": "python lint --parallel", "needs": ["build"], "inputs": ["my_project/**/*.py"]},
+            "test": {"run": "docker test", "needs": ["build"]},
+            "package": {"run": "helm package", "inputs": ["chart/**"], "env": ["BRANCH_NAME", "BUILD_NUMBER"]},
+            "push": {"run": "helm push", "needs": ["package", "lint", "test"]}
+        }
+    }
+
+Each step is a forj command line (without the `forj`). A step starts as soon as everything it
+`needs` has succeeded, several run at once, and their output is prefixed by step name. A step with
+`inputs` (globs, relative to the project root) is skipped when those files, its command line, its
+`env` variables and the keys of the steps it needs are all the same as when it last succeeded.
+
+Steps run on threads of this one process, which saves each a fresh forj's start-up but means they
+share what's process-wide:
+
+- the environment, working directory and project config: steps must not change them (no forj
+  command does), and two steps that would build the same image at once should `need` one another
+  (or a common build step)
+- stdout and stderr, swapped for a stand-in that prefixes each whole line with the step's name.
+  Threads a step starts itself aren't the step as far as that's concerned: what they write goes
+  out unprefixed, so commands that work in threads (e.g. `docker build` of several targets) label
+  their lines themselves
+"""
+
+import hashlib
+import io
+import json
+import os
+import shlex
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+
+from forj import trace
+from forj.config import configfile_name, get_config
+from forj.util import project_state_dir
+
+_prefixes = threading.local()
+
+
+@dataclass
+class Step:
+    """One step of a pipeline, as configured"""
+
+    name: str
+    run: str
+    needs: List[str] = field(default_factory=list)
+    inputs: List[str] = field(default_factory=list)
+    env: List[str] = field(default_factory=list)
+
+    @property
+    def args(self) -> List[str]:
+        args = shlex.split(self.run)
+        return args[1:] if args[:1] == ["forj"] else args
+
+
+class _PrefixedOutput(io.TextIOBase):
+    """Stands in for stdout/stderr while steps run, prefixing each line with the writing step's name
+
+    Threads that aren't running a step (e.g. a step's own worker threads) write unprefixed.
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def write(self, text):
+        prefix = getattr(_prefixes, "prefix", None)
+        if prefix is None:
+            with self._lock:
+                self.stream.write(text)
+            return len(text)
+        partial = _prefixes.partial.get(id(self), "")
+        *lines, partial = (partial + text).split("\n")
+        _prefixes.partial[id(self)] = partial
+        if lines:
+            with self._lock:
+                self.stream.write("".join(f"{prefix}{line}\n" for line in lines))
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            self.stream.flush()
+
+    def end_step(self):
+        """Write out whatever's left of the current step's last line"""
+        partial = _prefixes.partial.pop(id(self), "")
+        if partial:
+            with self._lock:
+                self.stream.write(f"{_prefixes.prefix}{partial}\n")
+        self.flush()
+
+
+def load_pipeline(name: str) -> Dict[str, Step]:
+    """The steps of a pipeline from the project config, checked for sense"""
+    project_config, _ = get_config()
+    pipelines = project_config.pipelines or {}
+    if name not in pipelines:
+        known = ", ".join(sorted(pipelines)) or "none"
+        raise KeyError(f"No pipeline {name!r} in {configfile_name} (pipelines: {known})")
+
+    steps = {step: Step(step, **spec) for step, spec in pipelines[name].items()}
+    for step in steps.values():
+        unknown = set(step.needs) - set(steps)
+        if unknown:
+            raise ValueError(f"Step {step.name} needs unknown step(s): {', '.join(sorted(unknown))}")
+    return steps
+
+
+def _hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_key(step: Step, upstream: Dict[str, Optional[str]]) -> Optional[str]:
+    """Digest of everything the step depends on, or None if it has no `inputs` (always runs)"""
+    if not step.inputs:
+        return None
+    digest = hashlib.sha256()
+    digest.update(json.dumps(step.args).encode() + b"\0")
+    for var in sorted(step.env):
+        digest.update(f"{var}={os.getenv(var, '')}".encode() + b"\0")
+    for need in sorted(step.needs):
+        digest.update(f"{need}={upstream.get(need) or ''}".encode() + b"\0")
+    files = sorted({path for pattern in step.inputs for path in Path().glob(pattern) if path.is_file()})
+    for path in files:
+        digest.update(str(path).encode() + b"\0" + _hash_file(path).encode())
+    return digest.hexdigest()
+
+
+def _resolve(steps: Dict[str, Step]) -> Dict[str, click.Command]:
+    """The click command for each step, looked up before any threads get going"""
+    from forj.cli import main  # pylint: disable=import-outside-toplevel
+
+    ctx = click.Context(main)
+    commands = {}
+    for step in steps.values():
+        cmd = main.get_command(ctx, step.args[0]) if step.args else None
+        if cmd is None or step.args[0] == "run":
+            raise ValueError(f"Step {step.name}: {step.run!r} isn't a forj command a pipeline can run")
+        commands[step.name] = cmd
+    return commands
+
+
+def _invoke(step: Step, cmd: click.Command) -> int:
+    try:
+        result = cmd.main(step.args[1:], prog_name=f"forj {step.args[0]}", standalone_mode=False)
+    except SystemExit as ex:
+        return ex.code if isinstance(ex.code, int) else int(ex.code is not None)
+    except click.ClickException as ex:
+        click.secho(ex.format_message(), fg="red")
+        return ex.exit_code
+    # Without standalone mode, click hands back `ctx.exit(code)`s as the result
+    return result if isinstance(result, int) else 0
+
+
+def _save_record(path: Path, recorded: Dict[str, str]):
+    with tempfile.NamedTemporaryFile("wt", dir=path.parent, delete=False) as f:
+        json.dump(recorded, f, indent=1, sort_keys=True)
+    os.replace(f.name, path)
+
+
+def run_pipeline(name: str, steps: Dict[str, Step], jobs: Optional[int] = None, force: bool = False) -> int:
+    """Run a pipeline's steps, dependencies first, several at once; returns an exit status
+
+    Steps needing one that failed are skipped. With `force`, recorded successful runs are ignored.
+    """
+    commands = _resolve(steps)
+    record_path = project_state_dir("pipelines") / f"{name}.json"
+    recorded = json.loads(record_path.read_text()) if record_path.is_file() else {}
+    width = max(len(s) for s in steps)
+    keys: Dict[str, Optional[str]] = {}
+
+    def execute(step):
+        _prefixes.prefix, _prefixes.partial = f"[{step.name:<{width}}] ", {}
+        started = time.monotonic()
+        key = None
+        try:
+            with trace.span(f"step {step.name}", "pipeline step") as span_args:
+                key = input_key(step, keys)
+                span_args["cached"] = bool(key) and not force and recorded.get(step.name) == key
+                if span_args["cached"]:
+                    click.secho("Inputs unchanged since the last successful run; skipping", fg="green")
+                    return "unchanged", key, time.monotonic() - started
+                click.secho(f"forj {shlex.join(step.args)}", fg="bright_magenta")
+                status = _invoke(step, commands[step.name])
+        except Exception as ex:  # pylint: disable=broad-except
+            click.secho(f"{type(ex).__name__}: {ex}", fg="red")
+            status = 1
+        finally:
+            sys.stdout.end_step()
+            sys.stderr.end_step()
+            _prefixes.prefix = None
+        return ("ok" if status == 0 else "failed"), key, time.monotonic() - started
+
+    results: Dict[str, tuple] = {}
+    pending, running = list(steps), {}
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _PrefixedOutput(stdout), _PrefixedOutput(stderr)
+    try:
+        with ThreadPoolExecutor(max_workers=jobs or min(len(steps), 4)) as pool:
+            while pending or running:
+                for step in [steps[s] for s in pending]:
+                    if any(results[n][0] in ("failed", "skipped") for n in step.needs if n in results):
+                        results[step.name] = ("skipped", None, 0.0)
+                        pending.remove(step.name)
+                    elif all(n in results for n in step.needs):
+                        running[pool.submit(execute, step)] = step.name
+                        pending.remove(step.name)
+                if not running:
+                    if pending:
+                        raise ValueError(f"Dependency cycle between steps: {', '.join(pending)}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_name = running.pop(future)
+                    results[step_name] = future.result()
+                    status, keys[step_name], _ = results[step_name]
+                    if status == "ok" and keys[step_name]:
+                        recorded[step_name] = keys[step_name]
+                        _save_record(record_path, recorded)
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+    click.secho(f"forj run {name} summary:", fg="bright_magenta")
+    for step_name in steps:
+        status, _key, seconds = results[step_name]
+        click.secho(
+            f"  {step_name:<{width}}  {status:<9}  {seconds:7.1f}s",
+            fg="red" if status in ("failed", "skipped") else "green",
+        )
+    return int(any(status == "failed" for status, _, _ in results.values()))
+
+
+__all__ = (
+    "Step",
+    "input_key",
+    "load_pipeline",
+    "run_pipeline",
+)
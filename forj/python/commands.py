@@ -2,6 +2,7 @@ import click
 #import docker
 
 from .python import lint as python_lint
+from .python import lint_watch as python_lint_watch
 
 
 @click.group(name="python")
@@ -34,6 +35,60 @@ def commands():
     default=False,
     help='Apply fixes',
 )
-def lint(tools, fix):
+@click.option(
+    '--force-build',
+    is_flag=True,
+    help='Rebuild the dev image even if it is up to date with the build context',
+)
+@click.option(
+    '--parallel',
+    is_flag=True,
+    help='Run the linters concurrently in a single container, with one combined report',
+)
+@click.option(
+    '--jobs',
+    '-j',
+    type=int,
+    default=0,
+    help='With --parallel, how many processes pylint may use (Default: 0, one per CPU)',
+)
+@click.option(
+    '--changed',
+    is_flag=True,
+    help='Only lint files that differ from the merge-base with the main branch (implies --parallel)',
+)
+@click.option(
+    '--base',
+    type=str,
+    default=None,
+    help='With --changed, the branch to diff against (Default: main or master)',
+)
+@click.option(
+    '--cache/--no-cache',
+    default=True,
+    help='With --parallel, reuse earlier findings for files that have not changed (Default: on)',
+)
+@click.option(
+    '--watch',
+    is_flag=True,
+    help='Keep linting files as they change, in a warm dev container, until Ctrl-C (implies --parallel)',
+)
+def lint(tools, fix, force_build, parallel, jobs, changed, base, cache, watch):
     """Lint your local codebase"""
-    python_lint(tools, fix)
+    if watch:
+        if changed:
+            raise click.UsageError("--watch and --changed don't go together")
+        python_lint_watch(tools, fix, force_build=force_build, jobs=jobs, cache=cache)
+        return
+    status = python_lint(
+        tools,
+        fix,
+        force_build=force_build,
+        parallel=parallel,
+        jobs=jobs,
+        changed=changed,
+        base=base,
+        cache=cache,
+    )
+    if status:
+        raise SystemExit(status)
@@ -0,0 +1,217 @@
+"""Run several linters at once and report on them deterministically
+
+This runs *inside* the dev container (piped to `python3 -`), so it may only use the standard library.
+Its one argument is a JSON file saying what to do:
+
+    python3 - .forj/lint-1234.json
+
+    {"linters": [["black", ["python3", "-m", "black", "--diff"]], ...], "paths": ["src"], "cache": ".forj/lint-cache"}
+
+Linters run concurrently, but their reports come out in the order given, with each linter's
+per-file sections sorted, so the output doesn't depend on who finished first. The exit status is
+0 if every linter passed and 1 otherwise.
+
+With a `cache` dir, `paths` must be individual files. Each file's findings are stored under a key
+made of the linter, its version, the lint config and the file's contents, and only files without a
+stored result actually get linted.
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Per-file section headers and the start of trailing summaries in each linter's stdout
+_SECTIONS = {
+    "black": (re.compile(r"^--- (\S+)"), None),
+    "pylint": (re.compile(r"^\*+ Module (\S+)"), re.compile(r"^-{3,}$")),
+}
+# black's one-line-per-file chatter on stderr
+_BLACK_FILE_LINE = re.compile(r"^(?:would reformat|reformatted|error: cannot format) (\S+?):?(?: |$)")
+# pylint message categories and the exit status bit each one sets
+_PYLINT_MESSAGE = re.compile(r":\d+:\d+: ([FEWRC])\d{4}")
+_PYLINT_STATUS = {"F": 1, "E": 2, "W": 4, "R": 8, "C": 16}
+# Config files that can change what a linter reports
+_CONFIG_FILES = ("pyproject.toml", "setup.cfg", "tox.ini", ".pylintrc", "pylintrc")
+
+
+def _split_sections(text, header, trailer):
+    preamble, sections, tail = [], [], []
+    for line in text.splitlines():
+        if tail or (trailer and trailer.match(line)):
+            tail.append(line)
+        elif header.match(line):
+            sections.append([line])
+        elif sections:
+            sections[-1].append(line)
+        else:
+            preamble.append(line)
+    # Blank separators belong between sections, not to whichever happened to come last
+    for section in sections:
+        while len(section) > 1 and not section[-1].strip():
+            section.pop()
+    return preamble, sections, tail
+
+
+def _sort_sections(text, header, trailer):
+    preamble, sections, tail = _split_sections(text, header, trailer)
+    if sections and tail:
+        tail.insert(0, "")
+    sections.sort(key=lambda section: section[0])
+    return "\n".join([*preamble, *(line for section in sections for line in section), *tail])
+
+
+def _sort_file_lines(text):
+    lines = text.splitlines()
+    per_file = sorted(line for line in lines if _BLACK_FILE_LINE.match(line))
+    return "\n".join([*per_file, *(line for line in lines if not _BLACK_FILE_LINE.match(line))])
+
+
+def _module_file(module, files):
+    """Which of `files` pylint means by a dotted module name"""
+    for path in files:
+        dotted = os.path.splitext(os.path.normpath(path))[0].replace(os.sep, ".")
+        if dotted.endswith(".__init__"):
+            dotted = dotted[: -len(".__init__")]
+        if dotted == module or dotted.endswith("." + module):
+            return path
+    return None
+
+
+def _split_by_file(name, proc, files):
+    """Break one linter run's output into per-file results"""
+    results = {path: {"stdout": "", "stderr": "", "returncode": 0} for path in files}
+    header, trailer = _SECTIONS[name]
+    _preamble, sections, _tail = _split_sections(proc.stdout, header, trailer)
+    for section in sections:
+        key = header.match(section[0]).group(1)
+        path = _module_file(key, files) if name == "pylint" else os.path.normpath(key)
+        if path in results:
+            results[path]["stdout"] = "\n".join(section)
+            if name == "pylint":
+                for category in _PYLINT_MESSAGE.findall("\n".join(section)):
+                    results[path]["returncode"] |= _PYLINT_STATUS[category]
+
+    if name == "black":
+        for line in proc.stderr.splitlines():
+            match = _BLACK_FILE_LINE.match(line)
+            path = match and os.path.normpath(match.group(1))
+            if path in results:
+                results[path]["stderr"] = line
+                results[path]["returncode"] = proc.returncode
+    return results
+
+
+def _cacheable(name, returncode):
+    # Usage errors and crashes say nothing about any particular file
+    if name == "pylint":
+        return not returncode & 32
+    return returncode in (0, 1)
+
+
+def _tool_version(name):
+    try:
+        from importlib.metadata import version  # pylint: disable=import-outside-toplevel
+
+        return version(name)
+    except Exception:  # pylint: disable=broad-except
+        return subprocess.run(
+            [sys.executable, "-m", name, "--version"], capture_output=True, text=True, check=False
+        ).stdout.strip()
+
+
+def _config_hash():
+    digest = hashlib.sha256()
+    for name in _CONFIG_FILES:
+        if os.path.isfile(name):
+            with open(name, "rb") as f:
+                digest.update(name.encode() + b"\0" + f.read() + b"\0")
+    return digest.hexdigest()
+
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _run(name, cmd, paths):
+    proc = subprocess.run([*cmd, *paths], capture_output=True, text=True, check=False)
+    stdout, stderr = proc.stdout, proc.stderr
+    if name in _SECTIONS:
+        stdout = _sort_sections(stdout, *_SECTIONS[name])
+    if name == "black":
+        stderr = _sort_file_lines(stderr)
+    return proc.returncode, stdout, stderr, ""
+
+
+def _run_cached(name, cmd, paths, cache_dir, config_hash):
+    prefix = json.dumps([name, _tool_version(name), config_hash, cmd])
+    keys = {path: hashlib.sha256(f"{prefix}\0{_file_hash(path)}".encode()).hexdigest() for path in paths}
+    entries = {path: os.path.join(cache_dir, name, keys[path][:2], keys[path] + ".json") for path in paths}
+
+    results = {}
+    for path, entry in entries.items():
+        if os.path.isfile(entry):
+            with open(entry, "rt", encoding="utf-8") as f:
+                results[path] = json.load(f)
+    hits = len(results)
+
+    misses = [path for path in paths if path not in results]
+    returncode, extra_stderr = 0, ""
+    if misses:
+        proc = subprocess.run([*cmd, *misses], capture_output=True, text=True, check=False)
+        fresh = _split_by_file(name, proc, misses)
+        results.update(fresh)
+        if _cacheable(name, proc.returncode):
+            for path, result in fresh.items():
+                os.makedirs(os.path.dirname(entries[path]), exist_ok=True)
+                with open(entries[path], "wt", encoding="utf-8") as f:
+                    json.dump(result, f)
+        else:
+            returncode, extra_stderr = proc.returncode, proc.stderr
+
+    ordered = [results[path] for path in sorted(paths)]
+    for result in ordered:
+        returncode |= result["returncode"]
+    stdout = "\n".join(result["stdout"] for result in ordered if result["stdout"])
+    stderr = "\n".join(filter(None, [*(result["stderr"] for result in ordered), extra_stderr.rstrip()]))
+    return returncode, stdout, stderr, f"{len(paths)} files, {hits} cached"
+
+
+def main(config):
+    linters, paths, cache_dir = config["linters"], config["paths"], config.get("cache")
+    if not paths:
+        print("===== nothing to lint =====")
+        return 0
+
+    config_hash = _config_hash()
+
+    def run(linter):
+        name, cmd = linter
+        if cache_dir and name in _SECTIONS:
+            return _run_cached(name, cmd, paths, cache_dir, config_hash)
+        return _run(name, cmd, paths)
+
+    with ThreadPoolExecutor(max_workers=len(linters)) as pool:
+        results = list(pool.map(run, linters))
+
+    failed = []
+    for (name, _cmd), (returncode, stdout, stderr, note) in zip(linters, results):
+        status = "ok" if returncode == 0 else f"failed (exit {returncode})"
+        print(f"===== {name}: {status}{f' ({note})' if note else ''} =====")
+        for text in (stdout, stderr):
+            if text.strip():
+                print(text.rstrip())
+        if returncode:
+            failed.append(name)
+
+    print(f"===== {len(linters) - len(failed)}/{len(linters)} linters passed =====")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], encoding="utf-8") as f:
+        sys.exit(main(json.load(f)))
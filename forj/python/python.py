@@ -1,40 +1,215 @@
 
 
+import json
 import os
+import tempfile
 from pathlib import Path
 from subprocess import CalledProcessError, run
-from typing import Collection, Optional
+from typing import Collection, List, Optional, Set, Tuple
 
 import click
 
+from forj import trace
 from forj.config import get_config
 from forj.docker.impl import build as docker_build
+from forj.docker.impl import down as docker_down
+from forj.docker.impl import ensure_warm
+from forj.docker import run_script as docker_run_script
 from forj.docker import shell as docker_shell
+from forj.util import project_state_dir
+from forj.watch import Watcher
 
+# The config files each linter reads, relative to the project root
+_LINTER_CONFIGS = {
+    'black': ('pyproject.toml',),
+    'pylint': ('.pylintrc', 'pylintrc', 'pyproject.toml', 'setup.cfg'),
+}
 
-def lint(tools: [str], fix: bool):
-    # first make sure we have a current dev docker container
-    image = docker_build('dev')
 
+def lint(
+    tools: [str],
+    fix: bool,
+    force_build: bool = False,
+    parallel: bool = False,
+    jobs: int = 0,
+    changed: bool = False,
+    base: Optional[str] = None,
+    cache: bool = True,
+):
+    """Lint the project's python module in the dev container
+
+    With `parallel` or `changed`, every linter runs at once in a single container and the combined
+    exit status is returned. Otherwise each linter gets its own container, one after the other.
+
+    `changed` only lints files that differ from the merge-base with `base` (default: main/master).
+    In the single container mode, per-file results are cached unless `cache` is off or we're fixing.
+    """
     project_config, _ = get_config()
+    src_path = project_config.python_module_path
+
+    paths = None
+    if changed:
+        paths = changed_files(src_path, base)
+        if not paths:
+            click.secho("No changed python files to lint", fg="green")
+            return 0
+
+    # first make sure we have a current dev docker container
+    image = docker_build('dev', force=force_build)
+
+    if parallel or changed:
+        use_cache = cache and not fix
+        if paths is None:
+            paths = python_files(src_path) if use_cache else [src_path]
+        return _lint_parallel(paths, image, tools, fix, jobs, use_cache)
 
     if 'black' in tools:
-        _lint_black(project_config.python_module_path, image, fix)
+        _lint_black(src_path, image, fix)
     if 'pylint' in tools:
-        _lint_pylint(project_config.python_module_path, image, fix)
+        _lint_pylint(src_path, image, fix)
+    return 0
 
 
-def _lint_black(src_path: str, image: str, fix: bool):
-    click.secho(f"Running linter 'black' in image: {image}", fg="bright_magenta")
-    cmd = ['python3', '-m', 'black', src_path]
+def _watch_runs(changed: Optional[Set[Path]], tools: [str], src_path: str) -> List[Tuple[List[str], List[str]]]:
+    """What to lint after some files changed, as [(linters, paths)]
+
+    A linter whose config changed relints everything; the others only the python files that changed.
+    If what changed isn't known (None), everything's relinted.
+    """
+    if changed is None:
+        return [(list(tools), python_files(src_path))]
+    names = {str(path) for path in changed}
+    reconfigured = [tool for tool in tools if names & set(_LINTER_CONFIGS[tool])]
+    others = [tool for tool in tools if tool not in reconfigured]
+    files = sorted(str(path) for path in changed if path.suffix == '.py' and path.is_file())
+    runs = []
+    if reconfigured:
+        runs.append((reconfigured, python_files(src_path)))
+    if others and files:
+        runs.append((others, files))
+    return runs
+
+
+def lint_watch(tools: [str], fix: bool, force_build: bool = False, jobs: int = 0, cache: bool = True):
+    """Lint the project's python module, then whatever changes in it, until interrupted
+
+    Works like `lint(parallel=True)`, but in the dev image's warm container (started if need be, and
+    removed after), so each round is an exec into it rather than a build check and a `docker run`.
+    """
+    project_config, _ = get_config()
+    src_path = project_config.python_module_path
+    use_cache = cache and not fix
+    configs = sorted({config for tool in tools for config in _LINTER_CONFIGS[tool]})
+
+    image, started = ensure_warm('dev', force=force_build)
+    try:
+        # Watching from before the first run, so changes made during it aren't missed
+        with Watcher(
+            [src_path, *configs], include=lambda path: path.suffix == '.py' or str(path) in configs
+        ) as watcher:
+            _lint_parallel(python_files(src_path) if use_cache else [src_path], image, tools, fix, jobs, use_cache)
+            click.secho(
+                f"Watching {src_path}{' (polling)' if watcher.polling else ''}; Ctrl-C to stop",
+                fg="bright_magenta",
+            )
+            for changed in watcher.batches():
+                for linters, paths in _watch_runs(changed, tools, src_path):
+                    _lint_parallel(paths, image, linters, fix, jobs, use_cache)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if started:
+            docker_down('dev')
+    return 0
+
+
+def _git(*args: str) -> str:
+    return run(["git", *args], capture_output=True, text=True, check=True).stdout
+
+
+def _main_branch() -> str:
+    for candidate in ("main", "master", "origin/main", "origin/master"):
+        found = run(["git", "rev-parse", "--verify", "--quiet", candidate], capture_output=True, check=False)
+        if found.returncode == 0:
+            return candidate
+    raise click.ClickException("Can't find a main or master branch to diff against; pass --base")
+
+
+def changed_files(src_path: str, base: Optional[str] = None) -> [str]:
+    """Python files under `src_path` that differ from the merge-base with `base`
+
+    Includes uncommitted and untracked files, but not deleted ones. Paths are relative to the project root.
+    """
+    merge_base = _git("merge-base", "HEAD", base or _main_branch()).strip()
+    files = _git("diff", "--name-only", "--relative", "--diff-filter=d", merge_base, "--", src_path).splitlines()
+    files += _git("ls-files", "--others", "--exclude-standard", "--", src_path).splitlines()
+    return sorted({f for f in files if f.endswith(".py")})
+
+
+def python_files(src_path: str) -> [str]:
+    """Every python file under `src_path`"""
+    path = Path(src_path)
+    if path.is_file():
+        return [str(path)]
+    return sorted(str(p) for p in path.rglob("*.py"))
+
+
+def _black_cmd(fix: bool):
+    cmd = ['python3', '-m', 'black']
     if not fix:
         cmd += ['--diff']
-    docker_shell(image, cmd, workdir='/app')
+    return cmd
+
+
+def _pylint_cmd(jobs: Optional[int] = None, score: bool = True):
+    cmd = ['python3', '-m', 'pylint']
+    if jobs is not None:
+        cmd += [f'--jobs={jobs}']
+    if not score:
+        cmd += ['--score=n']
+    return cmd
 
 
+@trace.traced("black", "lint")
+def _lint_black(src_path: str, image: str, fix: bool):
+    click.secho(f"Running linter 'black' in image: {image}", fg="bright_magenta")
+    docker_shell(image, [*_black_cmd(fix), src_path], workdir='/app')
+
+
+@trace.traced("pylint", "lint")
 def _lint_pylint(src_path: str, image: str, fix: bool):
     click.secho(f"Running linter 'pylint' in image: {image}", fg="bright_magenta")
     if fix:
         click.secho(f"Oops pylint doesn't actually do fixing", fg="bright_yellow")
-    cmd = ['python3', '-m', 'pylint', src_path]
-    docker_shell(image, cmd, workdir='/app')
+    docker_shell(image, [*_pylint_cmd(), src_path], workdir='/app')
+
+
+@trace.traced("linters in parallel", "lint")
+def _lint_parallel(paths: [str], image: str, tools: [str], fix: bool, jobs: int, cache: bool):
+    linters = []
+    if 'black' in tools:
+        linters.append(['black', _black_cmd(fix)])
+    if 'pylint' in tools:
+        # pylint's --jobs=0 means "one process per CPU". A score over some of the files is meaningless
+        linters.append(['pylint', _pylint_cmd(jobs, score=not cache)])
+
+    click.secho(
+        f"Running linters {', '.join(name for name, _ in linters)} in parallel in image: {image}",
+        fg="bright_magenta",
+    )
+    config = {
+        "linters": linters,
+        "paths": paths,
+        "cache": str(project_state_dir("lint-cache")) if cache else None,
+    }
+    script = (Path(__file__).parent / "lint_driver.py").read_text(encoding="utf-8")
+    # A file rather than an argument: a project's worth of paths can be more than one argument may hold.
+    # The project is mounted at /app, the container's workdir, so the relative path works there too
+    with tempfile.NamedTemporaryFile(
+        "w", dir=project_state_dir(), prefix="lint-", suffix=".json", delete=False
+    ) as config_file:
+        json.dump(config, config_file)
+    try:
+        return docker_run_script(image, script, [os.path.relpath(config_file.name)], workdir='/app')
+    finally:
+        os.unlink(config_file.name)
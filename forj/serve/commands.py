@@ -0,0 +1,35 @@
+import click
+
+from forj.client import send, socket_path
+
+
+@click.command(name="serve")
+@click.option(
+    "--socket",
+    "path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="The Unix socket to listen on (Default: $XDG_RUNTIME_DIR/forj/serve.sock, or the user cache dir)",
+)
+@click.option(
+    "--idle-timeout",
+    type=float,
+    default=3600,
+    help="Exit after this many seconds without a command; 0 to never (Default: 3600)",
+)
+@click.option("--stop", is_flag=True, help="Stop the running server instead")
+def commands(path, idle_timeout, stop):
+    """Run a background server that keeps forj warm for the CLI
+
+    While it's up, `forj` commands are handed to it over a Unix socket rather than starting from
+    scratch: imports, the docker client's connections and the project config are already there.
+    Without a server (or with FORJ_NO_DAEMON set), commands run in-process as usual.
+    """
+    if stop:
+        if send({"stop": True}, path) is None:
+            click.secho(f"No forj serve running on {path or socket_path()}", fg="yellow")
+        return
+
+    from .server import serve  # pylint: disable=import-outside-toplevel
+
+    serve(path, idle_timeout or None)
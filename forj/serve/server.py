@@ -0,0 +1,270 @@
+"""`forj serve`: a long-lived forj that runs commands for the CLI (see `forj.client`)
+
+Everything a fresh process pays for on each command is paid once here: the imports (docker SDK
+included), the docker client and its connection pool, and the parsed project config, which is kept
+per configfile for as long as the file's mtime/inode/size don't change.
+
+Commands run one at a time, since the working directory, environment and stdout they use are
+process-wide. Each runs in the client's working directory with the client's environment, its
+output streamed back to the client as it's written. If the client goes away mid-command (say it
+was Ctrl-C'd), the command is interrupted as it would have been in-process: KeyboardInterrupt in
+its thread, SIGTERM to the processes it started.
+"""
+
+import contextlib
+import ctypes
+import importlib
+import io
+import json
+import os
+import select
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import List, Optional
+
+import click
+
+from forj.client import socket_path
+from forj.config import config
+
+
+class _Stream(io.TextIOBase):
+    """Stands in for stdout/stderr while a command runs, sending what's written to the client"""
+
+    def __init__(self, wfile, kind: str, tty: bool, lock: threading.Lock):
+        super().__init__()
+        self.wfile = wfile
+        self.kind = kind
+        self.tty = tty
+        self.lock = lock
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        # So click keeps its colors when the client's terminal would
+        return self.tty
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def write(self, text):
+        if not isinstance(text, str):
+            # Also how click tells us apart from a binary stream
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if text:
+            with self.lock:
+                self.wfile.write(json.dumps({self.kind: text}).encode() + b"\n")
+                self.wfile.flush()
+        return len(text)
+
+
+def _child_pids() -> List[int]:
+    """Our child processes (Linux only: elsewhere, none)"""
+    pids = []
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            # The command name may have spaces or parentheses in it; the ppid comes after it
+            ppid = int(stat.read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == os.getpid():
+            pids.append(int(stat.parent.name))
+    return pids
+
+
+class _HangupWatch:
+    """Interrupts the command running in this thread if the client hangs up before it's done"""
+
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+        self.thread_id = threading.get_ident()
+        self.lock = threading.Lock()
+        self.done = False
+
+    def __enter__(self):
+        threading.Thread(target=self._watch, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.done = True
+            # Too late to interrupt anything: take back an interrupt that hasn't landed yet
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(self.thread_id), None)
+
+    def _watch(self):
+        while not self.done:
+            ready, _, _ = select.select([self.connection], [], [], 0.5)
+            if not ready:
+                continue
+            try:
+                if self.connection.recv(4096):
+                    # Clients don't send anything after the request; ignore it
+                    continue
+            except OSError:
+                pass
+            with self.lock:
+                if self.done:
+                    return
+                # KeyboardInterrupt, as Ctrl-C would raise in-process
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(self.thread_id), ctypes.py_object(KeyboardInterrupt)
+                )
+                # ...and whatever the command is waiting on (docker, pytest, ...) goes too
+                for pid in _child_pids():
+                    try:
+                        os.kill(pid, signal.SIGTERM)
+                    except OSError:
+                        pass
+            return
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        self.server.touch()
+        if request.get("stop"):
+            self.wfile.write(json.dumps({"exit": 0}).encode() + b"\n")
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        with self.server.command_lock:
+            status = self.server.run_command(request, self.wfile, self.connection)
+        try:
+            self.wfile.write(json.dumps({"exit": status}).encode() + b"\n")
+        except OSError:
+            pass
+        self.server.touch()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves forj commands on a Unix socket until stopped, or idle for `idle_timeout` seconds"""
+
+    daemon_threads = True
+
+    def __init__(self, path: Path, idle_timeout: Optional[float] = None):
+        self.path = Path(path)
+        self.idle_timeout = idle_timeout
+        self.command_lock = threading.Lock()
+        self.last_active = time.monotonic()
+        # {configfile: (stat key, Project)}
+        self.projects = {}
+        super().__init__(str(self.path), _Handler)
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def warm_up(self):
+        """Import the heavy stuff and connect to docker before anyone's waiting"""
+        # pylint: disable=import-outside-toplevel
+        for module in (
+            "forj.cli",
+            "forj.docker.commands",
+            "forj.helm.commands",
+            "forj.python.commands",
+            "forj.version.commands",
+        ):
+            importlib.import_module(module)
+        from forj.docker.impl import get_docker_client
+
+        try:
+            get_docker_client().ping()
+        except Exception as ex:  # pylint: disable=broad-except
+            click.secho(f"No docker daemon to keep a connection to ({ex}); carrying on", fg="yellow")
+
+    def _warm_config(self):
+        """Hand `get_config` this project's parsed config, if it hasn't changed since we last saw it"""
+        config._project = None  # pylint: disable=protected-access
+        try:
+            path = config.find_project_config()
+            stat_key = config._stat_key(path)  # pylint: disable=protected-access
+        except OSError:
+            return
+        known = self.projects.get(path)
+        if known and known[0] == stat_key:
+            config._project = known[1]  # pylint: disable=protected-access
+        else:
+            try:
+                self.projects[path] = (stat_key, config.get_config()[0])
+            except TypeError:
+                # Let the command itself complain
+                config._project = None  # pylint: disable=protected-access
+
+    def run_command(self, request: dict, wfile, connection: Optional[socket.socket] = None) -> int:
+        """Run a client's command line here, its output going to `wfile`
+
+        With the client's `connection`, the command is interrupted if the client hangs up.
+        """
+        from forj.cli import main  # pylint: disable=import-outside-toplevel
+
+        lock = threading.Lock()
+        saved = sys.stdout, sys.stderr, dict(os.environ), os.getcwd()
+        sys.stdout = _Stream(wfile, "out", request.get("tty", False), lock)
+        sys.stderr = _Stream(wfile, "err", request.get("tty", False), lock)
+        try:
+            os.environ.clear()
+            os.environ.update(request["env"])
+            os.chdir(request["cwd"])
+            self._warm_config()
+            with _HangupWatch(connection) if connection else contextlib.nullcontext():
+                main.main(request["argv"], prog_name="forj", standalone_mode=True)
+            return 0
+        except SystemExit as ex:
+            return ex.code if isinstance(ex.code, int) else int(ex.code is not None)
+        except KeyboardInterrupt:
+            return 130
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            return 1
+        finally:
+            sys.stdout, sys.stderr, environ, cwd = saved
+            os.environ.clear()
+            os.environ.update(environ)
+            os.chdir(cwd)
+
+    def service_actions(self):
+        if self.idle_timeout and time.monotonic() - self.last_active > self.idle_timeout:
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+
+def serve(path: Optional[Path] = None, idle_timeout: Optional[float] = None):
+    """Serve forj commands on `path` (default: `forj.client.socket_path()`) until stopped"""
+    path = Path(path or socket_path())
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if path.exists():
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+            raise RuntimeError(f"forj serve is already running on {path}")
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Left behind by a server that didn't get to clean up
+            path.unlink()
+        finally:
+            probe.close()
+
+    # Anyone who can connect can run commands as us: the socket is ours alone from the moment it exists
+    old_umask = os.umask(0o077)
+    try:
+        server = Server(path, idle_timeout)
+    finally:
+        os.umask(old_umask)
+
+    with server:
+        server.warm_up()
+        click.secho(f"forj serve listening on {path}", fg="green")
+        try:
+            server.serve_forever(poll_interval=1)
+        finally:
+            path.unlink(missing_ok=True)
+
+
+__all__ = (
+    "Server",
+    "serve",
+)
@@ -0,0 +1,2 @@
+from .commands import commands
+from .stats import load, record, report
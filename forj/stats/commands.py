@@ -0,0 +1,29 @@
+import click
+
+from .stats import report
+
+
+@click.command(name="stats")
+@click.option(
+    "--since",
+    "window",
+    type=str,
+    default="7d",
+    help="How far back to look, like 12h, 7d or 2w (Default: 7d)",
+)
+@click.option(
+    "--command",
+    type=str,
+    default=None,
+    help='Only runs of commands starting with this, e.g. "forj docker build"',
+)
+def commands(window, command):
+    """Report how long forj commands and their phases have been taking
+
+    Every forj run in this project is timed and recorded under .forj/stats.jsonl; this shows
+    p50/p95/max per command and per phase (with cache hits, where a phase has a cache).
+    """
+    try:
+        report(window, command)
+    except ValueError as ex:
+        raise click.BadParameter(str(ex), param_hint="--since")
@@ -0,0 +1,165 @@
+"""A history of how long forj commands take, for spotting when the build tooling gets slower
+
+Every `forj` run appends one line to `.forj/stats.jsonl`: when, which command, how long, its exit
+status, and the phases it went through (the spans `forj.trace` recorded), including any cache-hit
+flags they carry. Lines are only ever appended, so concurrent runs can't lose each other's records;
+once the file grows past `MAX_STATS_BYTES` it's rotated to `stats.jsonl.1`, replacing the previous
+one, so the history keeps roughly the last two files' worth of runs.
+"""
+
+import json
+import math
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+import click
+
+from forj.util import project_state_dir
+
+stats_file_name = "stats.jsonl"
+MAX_STATS_BYTES = 4 * 1024 * 1024
+
+_DURATION_RE = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def _stats_file():
+    return project_state_dir() / stats_file_name
+
+
+def _rotated_file():
+    return project_state_dir() / f"{stats_file_name}.1"
+
+
+def record(tracer, status: int):
+    """Append a finished run, as recorded by `tracer`, to the project's stats"""
+    phases = []
+    root = None
+    for name, phase, started, finished, _tid, args in tracer.spans:
+        entry = {"name": name, "phase": phase, "seconds": round(finished - started, 6)}
+        if "cached" in args:
+            entry["cached"] = bool(args["cached"])
+        if phase == "forj" and name == tracer.name:
+            root = entry
+        else:
+            phases.append(entry)
+    line = json.dumps(
+        {
+            "at": round(time.time(), 3),
+            "command": tracer.name,
+            "seconds": root["seconds"] if root else None,
+            "status": status,
+            "phases": phases,
+        }
+    )
+    # One write of one line, in append mode, so runs side by side don't interleave
+    fd = os.open(_stats_file(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (line + "\n").encode())
+        if os.fstat(fd).st_size > MAX_STATS_BYTES:
+            _rotate(fd)
+    finally:
+        os.close(fd)
+
+
+def _rotate(fd: int):
+    path = _stats_file()
+    try:
+        # Unless another run has already rotated the file this line went to
+        if os.stat(path).st_ino == os.fstat(fd).st_ino:
+            os.replace(path, _rotated_file())
+    except FileNotFoundError:
+        pass
+
+
+def load(since: Optional[float] = None) -> List[dict]:
+    """Every recorded run, or those since the `since` timestamp"""
+    runs = []
+    # Oldest first
+    for path in (_rotated_file(), _stats_file()):
+        if not path.is_file():
+            continue
+        with open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves half a line behind
+                    continue
+                if since is None or run["at"] >= since:
+                    runs.append(run)
+    return runs
+
+
+def parse_window(window: str) -> float:
+    """Seconds in a window like `30m`, `12h`, `7d` or `2w`"""
+    match = _DURATION_RE.match(window.strip())
+    if not match:
+        raise ValueError(f"Can't make sense of time window {window!r} (try e.g. 12h, 7d, 2w)")
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """The nearest-rank `q`th percentile of some values"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def _rows(groups: dict):
+    for key, entries in sorted(groups.items()):
+        seconds = [e["seconds"] for e in entries]
+        flagged = [e["cached"] for e in entries if "cached" in e]
+        hits = f"{sum(flagged)}/{len(flagged)}" if flagged else "-"
+        yield key, len(entries), hits, percentile(seconds, 50), percentile(seconds, 95), max(seconds)
+
+
+def _print_table(title: str, rows: Iterable[tuple], extra: str):
+    rows = list(rows)
+    if not rows:
+        return
+    click.secho(title, fg="bright_magenta")
+    width = max(len(row[0]) for row in rows)
+    click.secho(f"  {'':<{width}}  {'runs':>5}  {extra:>7}  {'p50':>8}  {'p95':>8}  {'max':>8}", fg="magenta")
+    for key, count, other, p50, p95, longest in rows:
+        click.echo(f"  {key:<{width}}  {count:5d}  {other:>7}  {p50:7.2f}s  {p95:7.2f}s  {longest:7.2f}s")
+
+
+def report(window: str = "7d", command: Optional[str] = None):
+    """Print p50/p95/max per command and per phase over the last `window`"""
+    runs = [
+        run
+        for run in load(since=time.time() - parse_window(window))
+        if not command or run["command"].startswith(command)
+    ]
+    click.secho(f"forj stats: {len(runs)} run(s) in the last {window}", fg="bright_magenta")
+    if not runs:
+        return
+
+    commands, phases = defaultdict(list), defaultdict(list)
+    for run in runs:
+        if run["seconds"] is not None:
+            commands[run["command"]].append(run)
+        for phase in run["phases"]:
+            phases[phase["phase"]].append(phase)
+
+    def failures(rows):
+        for key, count, _hits, *times in rows:
+            failed = sum(run["status"] != 0 for run in commands[key])
+            yield (key, count, str(failed), *times)
+
+    _print_table("Commands:", failures(_rows(commands)), "failed")
+    _print_table("Phases:", _rows(phases), "cached")
+
+
+__all__ = (
+    "MAX_STATS_BYTES",
+    "load",
+    "parse_window",
+    "percentile",
+    "record",
+    "report",
+    "stats_file_name",
+)
@@ -0,0 +1,159 @@
+"""Timing spans, for seeing where forj's wall clock time goes
+
+Commands wrap their phases in `span(name, phase)`. Unless recording was started that costs next to
+nothing. `forj` always records (the spans go into the project's stats, see `forj.stats`), and with
+`--trace FILE` (or `FORJ_TRACE=FILE`) they're also written out as Chrome trace-event JSON (open it in
+Perfetto or chrome://tracing) and summarized per phase on exit.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import click
+
+trace_env_var = "FORJ_TRACE"
+
+_tracer = None
+
+
+class Tracer:
+    """Collects finished spans from any thread"""
+
+    def __init__(self, path: Optional[Path] = None, name: str = "forj"):
+        self.path = Path(path) if path else None
+        self.name = name
+        self.started = time.monotonic()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, phase: str, started: float, finished: float, **args):
+        """Add a span that's already over; times are `time.monotonic()` seconds"""
+        with self._lock:
+            self.spans.append((name, phase, started, finished, threading.get_native_id(), args))
+
+    def events(self):
+        pid = os.getpid()
+        events = [
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.name}},
+        ]
+        for name, phase, started, finished, tid, args in self.spans:
+            events.append(
+                {
+                    "name": name,
+                    "cat": phase,
+                    "ph": "X",
+                    "ts": round((started - self.started) * 1e6),
+                    "dur": round((finished - started) * 1e6),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        return events
+
+    def write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "wt", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+
+    def phases(self):
+        """`{phase: (count, total seconds, longest seconds)}`"""
+        totals = defaultdict(lambda: [0, 0.0, 0.0])
+        for _name, phase, started, finished, _tid, _args in self.spans:
+            total = totals[phase]
+            total[0] += 1
+            total[1] += finished - started
+            total[2] = max(total[2], finished - started)
+        return {phase: tuple(total) for phase, total in totals.items()}
+
+    def print_summary(self):
+        click.secho(f"Trace summary (written to {self.path}):", fg="bright_magenta", err=True)
+        phases = sorted(self.phases().items(), key=lambda item: -item[1][1])
+        width = max((len(phase) for phase, _ in phases), default=0)
+        for phase, (count, total, longest) in phases:
+            click.secho(
+                f"  {phase:<{width}}  {count:4d}x  {total:8.2f}s total  {longest:8.2f}s longest",
+                fg="magenta",
+                err=True,
+            )
+
+
+def start(path=None, name: str = "forj") -> Tracer:
+    """Start recording spans, to be written to `path` (if any) by `finish`"""
+    global _tracer
+    _tracer = Tracer(path, name)
+    # Any forj we run would write its own trace over ours
+    os.environ.pop(trace_env_var, None)
+    return _tracer
+
+
+def finish(**args) -> Optional[Tracer]:
+    """Stop recording and close the root span (with `args`); write the trace and summarize, if asked to"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer:
+        tracer.record(tracer.name, "forj", tracer.started, time.monotonic(), **args)
+        if tracer.path:
+            tracer.write()
+            tracer.print_summary()
+    return tracer
+
+
+def active() -> Optional[Tracer]:
+    return _tracer
+
+
+def record(name: str, phase: str, started: float, finished: float, **args):
+    """Add a span that's already over, if tracing"""
+    if _tracer:
+        _tracer.record(name, phase, started, finished, **args)
+
+
+@contextmanager
+def span(name: str, phase: str, **args):
+    """Time the body as a span called `name` under `phase`, if tracing
+
+    Yields the span's `args`, so the body can add to them (e.g. whether a cache was hit).
+    """
+    tracer = _tracer
+    if not tracer:
+        yield args
+        return
+    started = time.monotonic()
+    try:
+        yield args
+    finally:
+        tracer.record(name, phase, started, time.monotonic(), **args)
+
+
+def traced(name: str, phase: str):
+    """Decorate a function so each call is a span"""
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, phase):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+__all__ = (
+    "Tracer",
+    "active",
+    "finish",
+    "record",
+    "span",
+    "start",
+    "trace_env_var",
+    "traced",
+)
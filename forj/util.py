@@ -1,5 +1,108 @@
-from .config import find_project_config
+import os
+import subprocess
+import sys
+from importlib import import_module
+from pathlib import Path
+
+import click
+
+from .config import find_project_config, state_dir_name
 
 
 def find_project_root():
     return find_project_config().parent
+
+
+def project_state_dir(*parts: str) -> Path:
+    """A directory for forj's own state under the project root, created if need be
+
+    Relative to the working directory, which `forj` has already moved to the project root.
+    """
+    path = state_dir_name.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    gitignore = state_dir_name / ".gitignore"
+    if not gitignore.exists():
+        gitignore.write_text("*\n")
+    return path
+
+
+def user_cache_dir(*parts: str) -> Path:
+    """A directory in the user's cache (`$XDG_CACHE_HOME/forj`), shared between projects"""
+    root = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "forj"
+    path = root.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def run_echoed(cmd, check: bool = False, input=None, **kwargs) -> subprocess.CompletedProcess:
+    """`subprocess.run` for commands whose output is meant for the user
+
+    Normally the command just inherits our stdout. If `sys.stdout` has been swapped out (say, to
+    prefix each line, like `forj run` does), the output is piped through it instead.
+    """
+    kwargs.pop("text", None)
+    if sys.stdout is sys.__stdout__:
+        return subprocess.run(cmd, check=check, input=input, text=True, **kwargs)
+
+    stdin = subprocess.PIPE if input is not None else None
+    with subprocess.Popen(
+        cmd, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, **kwargs
+    ) as proc:
+        if input is not None:
+            proc.stdin.write(input)
+            proc.stdin.close()
+        for line in proc.stdout:
+            sys.stdout.write(line)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return subprocess.CompletedProcess(cmd, proc.returncode)
+
+
+class LazyGroup(click.Group):
+    """A click group that imports its subcommands only when they're needed
+
+    Subcommands are registered as `{name: (import_path, short_help)}` where
+    `import_path` looks like `"package.module:attribute"`. The short help is
+    what `--help` shows for the group, so listing commands imports nothing;
+    a subcommand's module is imported when it's invoked or its own help is rendered.
+    """
+
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        return sorted({*super().list_commands(ctx), *self.lazy_subcommands})
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands and cmd_name not in self.commands:
+            self.add_command(self._load(cmd_name), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        rows = []
+        for name in self.list_commands(ctx):
+            if name in self.commands:
+                cmd = self.commands[name]
+                if cmd.hidden:
+                    continue
+                rows.append((name, cmd))
+            else:
+                rows.append((name, self.lazy_subcommands[name][1]))
+
+        if rows:
+            limit = formatter.width - 6 - max(len(name) for name, _ in rows)
+            rows = [
+                (name, cmd if isinstance(cmd, str) else cmd.get_short_help_str(limit))
+                for name, cmd in rows
+            ]
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+    def _load(self, cmd_name):
+        import_path, _short_help = self.lazy_subcommands[cmd_name]
+        module_name, attr = import_path.split(":")
+        cmd = getattr(import_module(module_name), attr)
+        if not isinstance(cmd, click.Command):
+            raise ValueError(f"Lazy subcommand {cmd_name} ({import_path}) is not a click command")
+        return cmd
@@ -1,4 +1,6 @@
-import bumpversion.cli
+import json
+import time
+
 import click
 
 from .util import deduce, set_version
@@ -18,7 +20,19 @@ def commands():
     is_flag=True,
     help="Return a python package compatible version string",
 )
-def get(is_python_package):
+@click.option(
+    "--json",
+    "as_json",
+    is_flag=True,
+    help="Return every version variant, and the docker image name, as JSON",
+)
+@click.option(
+    "--target",
+    type=str,
+    default="dev",
+    help='With --json, the Dockerfile target to name the image for (Default: "dev")',
+)
+def get(is_python_package, as_json, target):
     """Get the deduced project version based on context
 
     On a user's machine, this will always be "VERSION-local(d)"
@@ -27,8 +41,29 @@ def get(is_python_package):
     In a develop pipeline, it will contain `-dev`
     In a main pipeline, it will be the raw version
     In all other pipelines, it will be a `-PR` version
+
+    With --json, everything a pipeline usually asks for comes back in one go.
     """
-    click.echo(deduce(is_python_package=is_python_package))
+    if not as_json:
+        click.echo(deduce(is_python_package=is_python_package))
+        return
+
+    # Only pay for the docker side of things when asked
+    from forj.docker.impl import get_docker_image
+
+    image, tag = get_docker_image(target)
+    version = deduce()
+    click.echo(
+        json.dumps(
+            {
+                "version": version,
+                "python": deduce(is_python_package=True),
+                "chart": version,
+                "docker_tag": tag,
+                "image": f"{image}:{tag}",
+            }
+        )
+    )
 
 
 @commands.command(
@@ -38,6 +73,8 @@ def get(is_python_package):
 @click.argument("args", nargs=-1, type=click.UNPROCESSED)
 def bump(args):
     """Passthrough alias for `bump2version`"""
+    import bumpversion.cli
+
     args = [*args, "--serialize", "{major}.{minor}.{patch}-dev.{dev}"]
     bumpversion.cli.main(args)
 
@@ -48,12 +85,25 @@ def bump(args):
 )
 def dev(debug: bool):
     """Bumps the dev version (for use by CI)"""
+    import bumpversion.cli
+
     args = ["dev"]
     if debug:
         args += ["--dry-run", "--verbose", "--allow-dirty"]
     bumpversion.cli.main(args)
 
 
+def _set_version(new_version: str, debug: bool):
+    started = time.monotonic()
+    changed = set_version(new_version, debug=debug)
+    click.secho(
+        f"Set version {new_version} in {len(changed)} file(s) in {time.monotonic() - started:.2f}s",
+        fg="green",
+    )
+    for path in changed:
+        click.secho(f"  {path}", fg="green")
+
+
 @commands.command(hidden=True)
 @click.option(
     "--debug", "-d", is_flag=True, help="Debug mode; be verbose and make no changes"
@@ -68,7 +118,7 @@ def dev(debug: bool):
 def release(debug: bool, is_python_package: bool):
     """Removes the `-dev` field from the current version (for use by CI)"""
     new_version = deduce(is_python_package=is_python_package)
-    set_version(new_version, debug=debug)
+    _set_version(new_version, debug)
 
 
 @commands.command(name="set")
@@ -78,4 +128,4 @@ def release(debug: bool, is_python_package: bool):
 )
 def set_(new_version: str, debug: bool):
     """Set the version to something specific, in case of oopsie"""
-    set_version(new_version, debug=debug)
+    _set_version(new_version, debug)
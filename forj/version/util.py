@@ -1,11 +1,17 @@
 """some versioning utils"""
 
+import copy
+import io
 import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 from pathlib import Path
-from typing import Optional
+from subprocess import run
+from typing import List, Optional
 
-from bumpversion.vcs import Git
+from forj import trace
 
 
 def _deduce_python_helper():
@@ -67,6 +73,7 @@ def _deduce_helper():
         return ver + "-local"
 
 
+@trace.traced("deduce version", "version")
 def deduce(is_python_package: Optional[bool] = None):
     """Deduce the current version
 
@@ -81,21 +88,78 @@ def deduce(is_python_package: Optional[bool] = None):
 
 
 def from_file(filename: Optional[Path] = None) -> str:
-    cfg = read_bumpversioncfg(filename)
+    cfg = _cached_bumpversioncfg(filename)
     return cfg.get("bumpversion", "current_version")
 
 
+# Parsed bumpversion configs by path, along with the (mtime, size, inode) they were parsed at
+_bumpversioncfg_cache = {}
+
+
 def read_bumpversioncfg(filename: Optional[Path] = None) -> ConfigParser:
-    """Parse a bumpversion config file"""
-    filename = filename or Path(".bumpversion.cfg")
+    """Parse a bumpversion config file
+
+    The parse is kept for the life of the process and only redone once the file changes on disk.
+    Each caller gets a copy of its own, free to change it.
+    """
+    return copy.deepcopy(_cached_bumpversioncfg(filename))
+
+
+def _cached_bumpversioncfg(filename: Optional[Path] = None) -> ConfigParser:
+    """The cached parse itself, for reading only"""
+    filename = Path(filename or ".bumpversion.cfg").resolve()
+    st = filename.stat()
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    cached = _bumpversioncfg_cache.get(filename)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
     b2v_config = ConfigParser()
     with open(filename, "rt", encoding="utf-8") as f:
         b2v_config.read_file(f)
+    _bumpversioncfg_cache[filename] = (stamp, b2v_config)
     return b2v_config
 
 
-def set_version(new_version: str, debug=True):
-    """Set a specific version in case of oopsie"""
+def _atomic_write(path: Path, text: str, newline: Optional[str] = None):
+    """Replace a file's contents such that a crash leaves either the old or the new file, never half of one"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wt", encoding="utf-8", newline=newline) as f:
+            f.write(text)
+        if path.exists():
+            shutil.copymode(path, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _rewrite_version(path: Path, search: str, replace: str) -> bool:
+    """Swap the version in one file; returns whether it actually contained the old version"""
+    with open(path, "rt") as f:
+        file_contents_before = f.read()
+        newline = f.newlines
+
+    if search not in file_contents_before:
+        return False
+
+    # Mixed line endings come back as a tuple; leave those to the platform default
+    newline = newline if isinstance(newline, str) else None
+    _atomic_write(path, file_contents_before.replace(search, replace), newline)
+    return True
+
+
+@trace.traced("set version", "version")
+def set_version(new_version: str, debug=True) -> List[Path]:
+    """Set a specific version in case of oopsie
+
+    Version-bearing files are rewritten concurrently, each one atomically, and only the ones that
+    actually mention the current version are touched. Returns the files that changed.
+    """
+    from bumpversion.vcs import Git
+
     b2v_config_file = Path(".bumpversion.cfg")
 
     if not debug:
@@ -112,33 +176,32 @@ def set_version(new_version: str, debug=True):
 
     context = {"current_version": current_version, "new_version": new_version}
 
+    rewrites = []
     for section, path in files:
         opts = b2v_config[section]
         search = opts.get("search", "{current_version}").format(**context)
         replace = opts.get("replace", "{new_version}").format(**context)
+        rewrites.append((path, search, replace))
 
-        with open(path, "rt") as f:
-            file_contents_before = f.read()
-            newline = f.newlines
-
-        file_contents_after = file_contents_before.replace(search, replace)
-
-        with open(path, "wt", encoding="utf-8", newline=newline) as f:
-            f.write(file_contents_after)
-
-        if not debug:
-            Git.add_path(str(path))
+    with ThreadPoolExecutor(max_workers=min(len(rewrites), 8) or 1) as pool:
+        results = list(pool.map(lambda rewrite: _rewrite_version(*rewrite), rewrites))
+    changed = [path for (path, _, _), did_change in zip(rewrites, results) if did_change]
 
     # Finally modify the bumpversion file
     b2v_config.set("bumpversion", "current_version", new_version)
-    with open(b2v_config_file, "wt", encoding="utf-8") as f:
-        b2v_config.write(f)
+    buffer = io.StringIO()
+    b2v_config.write(buffer)
+    _atomic_write(b2v_config_file, buffer.getvalue())
+    changed.append(b2v_config_file)
 
     if not debug:
-        Git.add_path(str(b2v_config_file))
+        # One `git add` for the lot rather than one per file
+        run(["git", "add", "--update", "--", *(str(path) for path in changed)], check=True, capture_output=True)
         Git.commit(f"Bump version: {current_version} → {new_version}", context)
         Git.tag(sign=False, name=f"v{new_version}", message=f"Release v{new_version}")
 
+    return changed
+
 
 __all__ = (
     "deduce",
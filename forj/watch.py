@@ -0,0 +1,234 @@
+"""Watching the project for changes, for `--watch` modes
+
+Uses inotify (through ctypes, so no dependencies) where there is one, and otherwise falls back to
+polling mtimes. Changes come out in batches: a batch starts with the first change and ends once
+things have been quiet for the debounce period, so an editor's save-everything or a `git checkout`
+is one batch rather than dozens. If inotify's queue overflows, which changes were made is lost;
+the batch says so (see `Watcher.batches()`), and it's for the caller to assume anything changed.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional, Set
+
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+# How often the polling fallback looks, in seconds
+POLL_INTERVAL = 0.5
+
+
+def _ignored(name: str) -> bool:
+    return name.startswith(".") or name == "__pycache__"
+
+
+def _walk_dirs(root: Path) -> Iterator[Path]:
+    for dirpath, dirnames, _filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not _ignored(d))
+        yield Path(dirpath)
+
+
+class _Inotify:
+    def __init__(self, dirs: Iterable[Path], files: Iterable[Path]):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watched: Dict[int, Path] = {}
+        # Directories watched for everything in them, and those only for the sake of particular files
+        self.roots = list(dirs)
+        self.deep: Set[Path] = set()
+        self.only: Dict[Path, Set[str]] = {}
+        # Set when events were dropped, until the watcher's dealt with it
+        self.overflowed = False
+        for root in self.roots:
+            for path in _walk_dirs(root):
+                self._watch(path, deep=True)
+        for path in files:
+            self.only.setdefault(path.parent, set()).add(path.name)
+            self._watch(path.parent)
+
+    def _watch(self, path: Path, deep: bool = False):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd >= 0:
+            self.watched[wd] = path
+            if deep:
+                self.deep.add(path)
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + _EVENT.size : offset + _EVENT.size + length].rstrip(b"\0"))
+            offset += _EVENT.size + length
+            if mask & _IN_Q_OVERFLOW:
+                # Events were dropped, new directories' among them maybe: make sure they're watched
+                self.overflowed = True
+                for root in self.roots:
+                    for path in _walk_dirs(root):
+                        self._watch(path, deep=True)
+                continue
+            parent = self.watched.get(wd)
+            if parent is None:
+                continue
+            path = parent / name
+            if name in self.only.get(parent, ()) and not mask & _IN_ISDIR:
+                # Asked for by name, hidden or not
+                changed.add(path)
+                continue
+            if parent not in self.deep or _ignored(name):
+                continue
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    # A new directory (maybe with files in it already): watch it, and count what's in it
+                    for new_dir in _walk_dirs(path):
+                        self._watch(new_dir, deep=True)
+                        changed.update(p for p in new_dir.iterdir() if p.is_file())
+                continue
+            changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Poller:
+    # Snapshots miss nothing
+    overflowed = False
+
+    def __init__(self, dirs: Iterable[Path], files: Iterable[Path]):
+        self.dirs = list(dirs)
+        self.files = list(files)
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, tuple]:
+        snapshot = {}
+        for root in self.dirs:
+            for path in _walk_dirs(root):
+                try:
+                    entries = list(os.scandir(path))
+                except FileNotFoundError:
+                    # Deleted since os.walk listed it
+                    continue
+                for entry in entries:
+                    if _ignored(entry.name):
+                        continue
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            snapshot[path / entry.name] = (stat.st_mtime_ns, stat.st_size)
+                    except FileNotFoundError:
+                        # Deleted since scandir listed it
+                        pass
+        for path in self.files:
+            try:
+                stat = path.stat()
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                pass
+        return snapshot
+
+    def read(self, timeout: Optional[float]) -> Set[Path]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            time.sleep(POLL_INTERVAL if deadline is None else max(0, min(POLL_INTERVAL, deadline - time.monotonic())))
+            old, self.snapshot = self.snapshot, self._scan()
+            changed = {path for path in old.keys() | self.snapshot.keys() if old.get(path) != self.snapshot.get(path)}
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+class Watcher:
+    """Watch directories (recursively) and single files for changes
+
+    Use as a context manager and iterate over `batches()`. Only paths `include` likes are reported.
+    Hidden files and directories, and `__pycache__`, are skipped unless named themselves. A file
+    needn't exist yet; creating it counts as a change.
+    """
+
+    def __init__(
+        self,
+        paths: Iterable,
+        debounce: float = 0.3,
+        include: Optional[Callable[[Path], bool]] = None,
+        poll: bool = False,
+    ):
+        paths = [Path(p) for p in paths]
+        self.dirs = [p for p in paths if p.is_dir()]
+        self.files = [p for p in paths if not p.is_dir()]
+        self.debounce = debounce
+        self.include = include or (lambda path: True)
+        self.backend = None
+        if not poll and sys.platform.startswith("linux"):
+            try:
+                self.backend = _Inotify(self.dirs, self.files)
+            except (OSError, AttributeError):
+                # No inotify (or no libc to find it in): polling it is
+                pass
+        if self.backend is None:
+            self.backend = _Poller(self.dirs, self.files)
+
+    @property
+    def polling(self) -> bool:
+        return isinstance(self.backend, _Poller)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.backend.close()
+
+    def _read(self, timeout: Optional[float]) -> Set[Path]:
+        return {path for path in self.backend.read(timeout) if self.include(path)}
+
+    def batches(self) -> Iterator[Optional[Set[Path]]]:
+        """Sets of changed paths, forever
+
+        None instead of a set means changes were lost (inotify's queue overflowed): anything may
+        have changed.
+        """
+        while True:
+            # Waking up now and then lets KeyboardInterrupt land even when it's raised from another
+            # thread, as `forj serve` does when the client goes away
+            changed = self._read(1.0)
+            if not changed and not self.backend.overflowed:
+                continue
+            while True:
+                more = self._read(self.debounce)
+                if not more:
+                    break
+                changed |= more
+            if self.backend.overflowed:
+                self.backend.overflowed = False
+                yield None
+            else:
+                yield changed
+
+
+__all__ = (
+    "POLL_INTERVAL",
+    "Watcher",
+)
@@ -37,6 +37,6 @@ setup(
         "Programming Language :: Python :: 3.10",
     ],
     entry_points={
-        "console_scripts": {"forj=forj.cli:main"},
+        "console_scripts": {"forj=forj.client:main"},
     },
 )
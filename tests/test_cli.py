@@ -0,0 +1,104 @@
+"""Startup cost regression tests for the forj CLI
+
+These run forj in a fresh interpreter, since the whole point is what gets imported on the way in.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import click
+import pytest
+
+from forj.cli import main
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that are expensive to import and shouldn't be needed for cheap commands
+HEAVY_MODULES = {"docker", "requests", "bumpversion"}
+
+# Wall clock budget for a cold `forj` invocation, interpreter startup included
+STARTUP_BUDGET_SECONDS = 2.0
+
+_PROBE = """
+import sys
+from forj.cli import main
+try:
+    main(sys.argv[1:], prog_name="forj")
+finally:
+    sys.stderr.write("\\nFORJ_MODULES=" + ",".join(sorted({m.split(".")[0] for m in sys.modules})) + "\\n")
+"""
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / ".forjproject").write_text(
+        json.dumps(
+            {
+                "name": "my-project",
+                "chart_dir": None,
+                "docker_path": None,
+                "python_module_path": "my_project",
+            }
+        )
+    )
+    (tmp_path / ".bumpversion.cfg").write_text("[bumpversion]\ncurrent_version = 1.2.3-dev.4\n")
+    return tmp_path
+
+
+def _run_forj(args, cwd):
+    env = {k: v for k, v in os.environ.items() if k not in {"BRANCH_NAME", "BUILD_NUMBER"}}
+    env["PYTHONPATH"] = str(REPO_ROOT)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE, *args],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    elapsed = time.perf_counter() - start
+    modules = set(proc.stderr.rsplit("FORJ_MODULES=", 1)[-1].strip().split(","))
+    return proc, modules, elapsed
+
+
+@pytest.mark.parametrize(
+    "args,expected_output",
+    [
+        (["--help"], "Manage your project's version"),
+        (["version", "get"], "1.2.3-dev.4-local"),
+        (["version", "get", "--json"], '"image": "docker.elliotrivers.rip/my-project:1.2.3-dev.4-locald"'),
+    ],
+)
+def test_cheap_commands_stay_cheap(project, args, expected_output):
+    proc, modules, elapsed = _run_forj(args, project)
+
+    assert proc.returncode == 0, proc.stderr
+    assert expected_output in proc.stdout
+    assert not HEAVY_MODULES & modules
+    assert elapsed < STARTUP_BUDGET_SECONDS
+
+
+def test_lazy_help_matches_commands():
+    """The short help baked into the CLI shouldn't drift from the subcommands' docstrings"""
+    for name, (_import_path, short_help) in main.lazy_subcommands.items():
+        cmd = main.get_command(click.Context(main), name)
+        assert cmd.get_short_help_str(limit=1000) == short_help
+
+
+def test_trace_is_written_and_summarized(project, tmp_path):
+    trace_file = tmp_path / "out" / "trace.json"
+    proc, _modules, _elapsed = _run_forj(["--trace", str(trace_file), "version", "get"], project)
+
+    assert proc.returncode == 0, proc.stderr
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    spans = {e["name"]: e for e in events if e["ph"] == "X"}
+    assert {"forj version get", "project root", "deduce version"} <= set(spans)
+    # Everything nests inside the root span
+    root = spans["forj version get"]
+    assert all(root["ts"] <= e["ts"] and e["ts"] + e["dur"] <= root["ts"] + root["dur"] for e in spans.values())
+    assert "Trace summary" in proc.stderr and "version" in proc.stderr
@@ -0,0 +1,69 @@
+"""Finding the project config, and the resolution cache that saves doing it every time"""
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from forj.config import config
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.delenv(config.root_env_var, raising=False)
+    monkeypatch.setattr(config, "_resolved", {})
+
+    root = tmp_path / "project"
+    (root / "src" / "pkg").mkdir(parents=True)
+    configfile = root / ".forjproject"
+    configfile.write_text(
+        json.dumps({"name": "my-project", "chart_dir": None, "docker_path": None, "python_module_path": "src"})
+    )
+    monkeypatch.chdir(root / "src" / "pkg")
+    return root
+
+
+def test_resolution_is_cached(project, monkeypatch):
+    assert config.find_project_config() == project / ".forjproject"
+
+    # Second time around, neither walks the tree nor parses the file
+    monkeypatch.setattr(config, "_resolved", {})
+    monkeypatch.setattr(Path, "is_file", lambda self: pytest.fail("walked the tree"))
+    monkeypatch.setattr(json, "load", lambda f: pytest.fail("parsed the configfile"))
+    assert config.find_project_config() == project / ".forjproject"
+    assert config._resolved[project / ".forjproject"]["name"] == "my-project"
+
+
+def test_changed_config_invalidates_cache(project, monkeypatch):
+    config.find_project_config()
+    configfile = project / ".forjproject"
+    configfile.write_text(configfile.read_text().replace("my-project", "renamed"))
+    stat = configfile.stat()
+    os.utime(configfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    monkeypatch.setattr(config, "_resolved", {})
+    path = config.find_project_config()
+    assert config._resolved[path]["name"] == "renamed"
+
+
+def test_project_root_override(project, tmp_path, monkeypatch):
+    monkeypatch.setenv(config.root_env_var, str(project))
+    assert config.find_project_config() == project / ".forjproject"
+
+    # Trusted as far as it goes: a root without a configfile isn't looked past
+    (project / "src" / ".forjproject").write_text("{}")
+    monkeypatch.setenv(config.root_env_var, str(project / "src" / "pkg"))
+    with pytest.raises(FileNotFoundError, match=config.root_env_var):
+        config.find_project_config()
+
+
+def test_project_root_override_only_counts_inside_it(project, tmp_path, monkeypatch):
+    # e.g. inherited by a script that went off to another project
+    other = tmp_path / "other"
+    (other / "sub").mkdir(parents=True)
+    (other / ".forjproject").write_text(project.joinpath(".forjproject").read_text())
+    monkeypatch.setenv(config.root_env_var, str(project))
+    monkeypatch.chdir(other / "sub")
+    assert config.find_project_config() == other / ".forjproject"
@@ -0,0 +1,39 @@
+from forj.docker.buildlog import BuildLog
+
+CHUNKS = [
+    {"stream": "Step 1/3 : FROM python:3.10-slim AS base\n"},
+    {"stream": " ---> 0123456789ab\n"},
+    {"stream": "Step 2/3 : RUN apt-get update\n ---> Using cache\n ---> 1111"},
+    {"stream": "22222222\n"},
+    {"stream": "Step 3/3 : COPY . .\n"},
+    {"stream": " ---> 3333\n"},
+    {"aux": {"ID": "sha256:4444"}},
+    {"stream": "Successfully built 4444\n"},
+]
+
+
+def test_steps_are_timed_and_cache_hits_tracked(tmp_path):
+    with BuildLog(tmp_path / "build.log", echo=False) as build_log:
+        for chunk in CHUNKS:
+            build_log.feed(chunk)
+
+    assert build_log.error is None
+    assert build_log.image_id == "sha256:4444"
+    assert [(s.number, s.instruction, s.cached) for s in build_log.steps] == [
+        ("1/3", "FROM python:3.10-slim AS base", False),
+        ("2/3", "RUN apt-get update", True),
+        ("3/3", "COPY . .", False),
+    ]
+    assert all(s.finished is not None for s in build_log.steps)
+    assert " ---> 111122222222" in (tmp_path / "build.log").read_text().splitlines()
+
+
+def test_only_the_tail_is_kept_in_memory(tmp_path):
+    with BuildLog(tmp_path / "build.log", tail_lines=5, echo=False) as build_log:
+        for i in range(1000):
+            build_log.feed({"stream": f"line {i}\n"})
+        build_log.feed({"error": "The command '/bin/sh -c false' returned a non-zero code: 1"})
+
+    assert build_log.error.startswith("The command")
+    assert list(build_log.tail)[:4] == ["line 996", "line 997", "line 998", "line 999"]
+    assert len((tmp_path / "build.log").read_text().splitlines()) == 1001
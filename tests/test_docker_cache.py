@@ -0,0 +1,155 @@
+"""Registry layer cache for builds, with a fake docker client standing in for daemon and registry"""
+
+import json
+from types import SimpleNamespace
+
+import docker
+import pytest
+
+from forj.config import config
+from forj.docker import impl
+
+IMAGE = "docker.elliotrivers.rip/my-project"
+
+
+class _FakeDocker:
+    def __init__(self, registry):
+        self.registry = set(registry)
+        self.local = set()
+        self.labels = {}
+        self.builds = []
+        self.pulls = []
+        self.images = SimpleNamespace(get=self._get)
+        self.api = SimpleNamespace(pull=self._pull, build=self._build)
+
+    def _get(self, ref):
+        if ref not in self.local:
+            raise docker.errors.ImageNotFound(f"No such image: {ref}")
+        return SimpleNamespace(labels=self.labels.get(ref, {}), id="sha256:3333")
+
+    def _pull(self, repository, tag):
+        self.pulls.append(f"{repository}:{tag}")
+        if f"{repository}:{tag}" not in self.registry:
+            raise docker.errors.NotFound(f"manifest for {repository}:{tag} not found")
+        self.local.add(f"{repository}:{tag}")
+
+    def _build(self, fileobj, cache_from, **kwargs):
+        for _ in fileobj:
+            pass
+        self.builds.append(dict(kwargs, cache_from=cache_from))
+        self.local.add(kwargs["tag"])
+        self.labels[kwargs["tag"]] = kwargs["labels"]
+        yield {"stream": "Step 1/2 : FROM python:3.10-slim\n"}
+        yield {"stream": " ---> Using cache\n" if cache_from else " ---> 1111\n"}
+        yield {"stream": "Step 2/2 : COPY . .\n"}
+        yield {"stream": " ---> Using cache\n" if cache_from else " ---> 2222\n"}
+        yield {"aux": {"ID": "sha256:3333"}}
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    def setup(docker_cache=None, registry=()):
+        (tmp_path / ".forjproject").write_text(
+            json.dumps(
+                {
+                    "name": "my-project",
+                    "chart_dir": None,
+                    "docker_path": None,
+                    "python_module_path": "my_project",
+                    "docker_cache": docker_cache or {},
+                }
+            )
+        )
+        (tmp_path / ".bumpversion.cfg").write_text("[bumpversion]\ncurrent_version = 1.2.3\n")
+        (tmp_path / "Dockerfile").write_text("FROM python:3.10-slim AS dev\nCOPY . .\n")
+        fake = _FakeDocker(registry)
+        monkeypatch.setattr(docker, "from_env", lambda: fake)
+        monkeypatch.setattr(impl, "_docker_clients", {})
+        return fake
+
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv(config.root_env_var, str(tmp_path))
+    monkeypatch.delenv("BRANCH_NAME", raising=False)
+    monkeypatch.setattr(config, "_project", None)
+    monkeypatch.chdir(tmp_path)
+    return setup
+
+
+def test_auto_cache_pulls_earlier_pushes(project, capsys):
+    fake = project(registry=[f"{IMAGE}:latest"])
+
+    impl.build("dev", cache_from=["auto"], cache_to="inline")
+
+    (build,) = fake.builds
+    fingerprint = build["labels"]["forj.fingerprint"]
+    assert fake.pulls == [f"{IMAGE}:ctx-{fingerprint[:12]}", f"{IMAGE}:1.2.3-locald", f"{IMAGE}:latest"]
+    assert build["cache_from"] == [f"{IMAGE}:latest"]
+    assert build["buildargs"]["BUILDKIT_INLINE_CACHE"] == "1"
+    out = capsys.readouterr().out
+    assert f"Layer cache from: {IMAGE}:latest" in out
+    assert "2/2 cached (100%)" in out
+
+
+def test_cache_settings_come_from_the_project(project):
+    fake = project(docker_cache={"from": ["main", "other.registry/base:1"]}, registry=[f"{IMAGE}:main"])
+
+    impl.build("dev")
+
+    assert fake.pulls == [f"{IMAGE}:main", "other.registry/base:1"]
+    assert fake.builds[0]["cache_from"] == [f"{IMAGE}:main"]
+    assert "BUILDKIT_INLINE_CACHE" not in fake.builds[0]["buildargs"]
+
+
+def test_no_cache_no_pulls(project):
+    fake = project()
+    impl.build("dev")
+    assert (fake.pulls, fake.builds[0]["cache_from"]) == ([], None)
+
+
+def test_content_tag_push_is_what_auto_cache_pulls(project, monkeypatch):
+    fake = project()
+    impl.build("dev")
+    pushed = []
+
+    def push_tags(docker_client, image, source_tag, tags, jobs):
+        pushed.extend(tags)
+        return {tag: ("pushed", 0.0, None) for tag in tags}
+
+    monkeypatch.setattr(impl, "push_tags", push_tags)
+    impl.push("dev", content_tag=True)
+
+    fingerprint = fake.builds[0]["labels"]["forj.fingerprint"]
+    assert pushed == ["1.2.3-locald", impl.context_tag(fingerprint)]
+    assert impl.cache_from_images("dev", fingerprint, ["auto"])[0] == f"{IMAGE}:{pushed[1]}"
+
+
+def test_every_target_gets_its_own_tag(project, tmp_path):
+    fake = project()
+    (tmp_path / "Dockerfile").write_text("FROM python:3.10-slim AS dev\nFROM dev AS test\nFROM dev AS prod\n")
+
+    built = impl.build_many(["dev", "test", "prod"])
+
+    # The default (last) stage gets the bare version
+    assert built == [f"{IMAGE}:1.2.3-locald", f"{IMAGE}:1.2.3-local-test", f"{IMAGE}:1.2.3-local"]
+    assert sorted(build["tag"] for build in fake.builds) == sorted(built)
+    assert impl.cache_from_images("test", "f" * 64, ["auto"])[1] == f"{IMAGE}:1.2.3-local-test"
+
+
+def test_a_build_that_raises_fails_only_its_target(project, tmp_path, capsys):
+    fake = project()
+    (tmp_path / "Dockerfile").write_text("FROM python:3.10-slim AS dev\nFROM dev AS prod\n")
+    build = fake.api.build
+
+    def flaky_build(fileobj, cache_from, **kwargs):
+        if kwargs["target"] == "dev":
+            raise docker.errors.APIError("daemon went away")
+        return build(fileobj, cache_from, **kwargs)
+
+    fake.api.build = flaky_build
+
+    with pytest.raises(docker.errors.BuildError, match="1 of 2 targets failed"):
+        impl.build_many(["dev", "prod"])
+    out = capsys.readouterr().out
+    assert "[dev] APIError: daemon went away" in out
+    assert "Build summary:" in out
+    assert "prod  built" in out
@@ -0,0 +1,156 @@
+import io
+import os
+import queue
+import tarfile
+import threading
+
+import pytest
+
+from forj.docker.context import (
+    DockerIgnore,
+    context_sizes,
+    default_target,
+    dockerfile_targets,
+    fingerprint,
+    stream_context,
+)
+
+
+@pytest.fixture
+def context(tmp_path):
+    (tmp_path / "Dockerfile").write_text("FROM scratch AS dev\nCOPY . .\n")
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "main.py").write_text("print('hi')\n")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "big.bin").write_bytes(b"\0" * 1024)
+    (tmp_path / ".dockerignore").write_text("# comment\ndata\n**/*.pyc\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "patterns,path,excluded",
+    [
+        (["data"], "data", True),
+        (["data"], "data/nested/file", True),
+        (["data"], "app/data", False),
+        (["/data/"], "data/file", True),
+        (["*.md"], "README.md", True),
+        (["*.md"], "docs/README.md", False),
+        (["**/*.md"], "docs/deep/README.md", True),
+        (["**/*.md"], "README.md", True),
+        (["docs/**"], "docs/a/b", True),
+        (["file?.txt"], "file1.txt", True),
+        (["file?.txt"], "file10.txt", False),
+        (["file[0-9].txt"], "file7.txt", True),
+        (["*.md", "!README.md"], "README.md", False),
+        (["*.md", "!README.md"], "CHANGELOG.md", True),
+        (["!README.md", "*.md"], "README.md", True),
+    ],
+)
+def test_dockerignore_matching(patterns, path, excluded):
+    assert DockerIgnore(patterns).excluded(path) is excluded
+
+
+def test_walk_applies_dockerignore(context):
+    (context / "app" / "cached.pyc").write_bytes(b"")
+    assert list(DockerIgnore.from_file(context).walk(context)) == [
+        "app",
+        ".dockerignore",
+        "Dockerfile",
+        "app/main.py",
+    ]
+
+
+def test_dockerfile_is_always_sent(context):
+    (context / ".dockerignore").write_text("Dockerfile\n.dockerignore\n")
+    assert {"Dockerfile", ".dockerignore"} <= set(DockerIgnore.from_file(context).walk(context))
+
+
+def test_fingerprint_tracks_context_contents(context):
+    before = fingerprint(context, target="dev")
+    assert fingerprint(context, target="dev") == before
+
+    # Ignored files don't matter
+    (context / "data" / "big.bin").write_bytes(b"\1" * 1024)
+    assert fingerprint(context, target="dev") == before
+
+    # But build inputs do
+    assert fingerprint(context, target="prod") != before
+    assert fingerprint(context, target="dev", buildargs={"a": "b"}) != before
+    (context / "app" / "main.py").write_text("print('bye')\n")
+    assert fingerprint(context, target="dev") != before
+
+
+def test_stream_context_is_a_gzipped_tar_of_the_context(context):
+    (context / "app" / "run.sh").write_text("#!/bin/sh\n")
+    (context / "app" / "run.sh").chmod(0o755)
+
+    data = b"".join(stream_context(context))
+
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        members = {m.name: m for m in tar.getmembers()}
+        assert set(members) == {".dockerignore", "Dockerfile", "app", "app/main.py", "app/run.sh"}
+        assert members["app"].isdir()
+        assert members["app/run.sh"].mode & 0o111
+        assert tar.extractfile("app/main.py").read() == b"print('hi')\n"
+
+
+def test_stream_context_can_be_abandoned(context):
+    for i in range(50):
+        (context / "app" / f"blob{i}").write_bytes(os.urandom(256 * 1024))
+
+    stream = stream_context(context, compresslevel=0)
+    next(stream)
+    # Closing early must not leave the producer thread blocked on a full queue
+    stream.close()
+
+
+def test_stream_context_can_be_abandoned_once_it_is_all_queued(context, monkeypatch):
+    (context / "app" / "blob").write_bytes(os.urandom(3 << 20))
+    chunk_count = len(list(stream_context(context, compresslevel=0)))
+    assert chunk_count > 1
+
+    finishing = threading.Event()
+
+    class OneChunkQueue(queue.Queue):
+        def __init__(self, maxsize=0):
+            super().__init__(maxsize=1)
+
+        def put(self, item, block=True, timeout=None):
+            if item is None:
+                finishing.set()
+            super().put(item, block, timeout)
+
+    monkeypatch.setattr(queue, "Queue", OneChunkQueue)
+    stream = stream_context(context, compresslevel=0)
+    for _ in range(chunk_count - 1):
+        next(stream)
+    # The last chunk fills the queue, leaving no room for the end marker
+    assert finishing.wait(5)
+
+    closer = threading.Thread(target=stream.close, daemon=True)
+    closer.start()
+    closer.join(5)
+    assert not closer.is_alive()
+
+
+def test_context_sizes(context):
+    total, count, sizes = context_sizes(context)
+    assert count == 3
+    assert total == sum(sizes.values())
+    assert set(sizes) == {".dockerignore", "Dockerfile", "app"}
+
+
+def test_dockerfile_targets(tmp_path):
+    (tmp_path / "Dockerfile").write_text(
+        "FROM python:3.10-slim AS base\n"
+        "FROM base as dev\n"
+        "FROM --platform=linux/amd64 base AS prod\n"
+        "FROM scratch\n"
+    )
+    assert dockerfile_targets(tmp_path) == ["base", "dev", "prod"]
+    # The last stage is unnamed, so no target is what a plain build builds
+    assert default_target(tmp_path) is None
+    (tmp_path / "Dockerfile").write_text("FROM python:3.10-slim AS base\nFROM base AS prod\n")
+    assert default_target(tmp_path) == "prod"
+    assert default_target(tmp_path / "nowhere") is None
@@ -0,0 +1,171 @@
+"""`forj docker inspect-layers`, on `docker save` tarballs made up for the occasion"""
+
+import io
+import json
+import tarfile
+from types import SimpleNamespace
+
+import click
+import docker
+import pytest
+
+from forj.config import config
+from forj.docker import impl
+from forj.docker.layers import find_waste, instruction, parse_size, previous_tag, read_saved_image
+
+REPOSITORY = "docker.elliotrivers.rip/my-project"
+
+HISTORY = [
+    {"created_by": "/bin/sh -c #(nop) ADD file:123 in / "},
+    {"created_by": '/bin/sh -c #(nop)  CMD ["bash"]', "empty_layer": True},
+    {"created_by": "RUN /bin/sh -c apt-get update # buildkit"},
+    {"created_by": "WORKDIR /app", "empty_layer": True},
+    {"created_by": "|1 environment=development /bin/sh -c pip install -r requirements.txt"},
+    {"created_by": "/bin/sh -c rm -rf /tmp/build /app/old.txt"},
+]
+
+LAYERS = [
+    {"bin/bash": 1000, "app/old.txt": 50},
+    {"var/lib/apt/lists/deb.debian.org_main": 3000, "var/lib/apt/lists/lock": 0},
+    {"usr/lib/python3/site.py": 200, "tmp/build/wheel.whl": 700, "root/.cache/pip/http/abc": 400},
+    {"tmp/.wh.build": 0, "app/.wh.old.txt": 0},
+]
+
+
+def _tar(members) -> bytes:
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode="w") as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return out.getvalue()
+
+
+def saved_image(layers=LAYERS, history=HISTORY) -> bytes:
+    """What `docker save` would produce, in the classic layout"""
+    members = []
+    layer_names = []
+    for index, files in enumerate(layers):
+        name = f"layer{index}/layer.tar"
+        members.append((name, _tar((path, b"x" * size) for path, size in files.items())))
+        layer_names.append(name)
+    members.append(("config.json", json.dumps({"history": history}).encode()))
+    members.append(("manifest.json", json.dumps([{"Config": "config.json", "Layers": layer_names}]).encode()))
+    return _tar(members)
+
+
+def _chunks(data: bytes, size: int = 1000):
+    return (data[i : i + size] for i in range(0, len(data), size))
+
+
+def test_layers_are_matched_with_their_instructions():
+    _config, layers = read_saved_image(_chunks(saved_image()))
+
+    assert [layer.instruction for layer in layers] == [
+        "ADD file:123 in /",
+        "RUN apt-get update",
+        "RUN pip install -r requirements.txt",
+        "RUN rm -rf /tmp/build /app/old.txt",
+    ]
+    assert [layer.size for layer in layers] == [1050, 3000, 1300, 0]
+    assert layers[3].deleted == ["tmp/build", "app/old.txt"]
+
+
+def test_waste_is_found():
+    _config, layers = read_saved_image(_chunks(saved_image()))
+    waste = find_waste(layers)
+
+    assert [(w.layer.index, w.kind, w.size, w.by and w.by.index) for w in waste] == [
+        (1, "package manager cache", 3000, None),
+        (2, "deleted or replaced later", 700, 3),
+        (2, "package manager cache", 400, None),
+        (0, "deleted or replaced later", 50, 3),
+    ]
+    assert waste[1].examples == [("tmp/build/wheel.whl", 700)]
+
+
+def test_helpers():
+    assert instruction("COPY . . # buildkit") == "COPY . ."
+    assert previous_tag("1.10.0d", ["1.9.2d", "1.9.10d", "1.10.0d", "1.11.0d", "1.9.9"]) == "1.9.10d"
+    assert previous_tag("1.0.0", ["1.0.0"]) is None
+    pre_releases = ["1.2.3-dev.3-locald", "1.2.3-dev.10-locald", "1.2.3-locald", "1.2.2-dev.9-locald", "1.2.3-dev.3"]
+    assert previous_tag("1.2.3-dev.4-locald", pre_releases) == "1.2.3-dev.3-locald"
+    assert parse_size("800MiB") == 800 << 20
+    assert parse_size("1.5G") == 3 << 29
+    assert parse_size("500MB") == 500_000_000
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+class _FakeImage:
+    def __init__(self, size, layers=LAYERS, tag=None):
+        self.data = saved_image(layers)
+        self.attrs = {"Size": size, "RootFS": {"Layers": ["sha256:x"] * len(layers)}}
+        self.tags = [f"{REPOSITORY}:{tag}"] if tag else []
+
+    def save(self, chunk_size, named):
+        return _chunks(self.data, chunk_size)
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    (tmp_path / ".forjproject").write_text(
+        json.dumps({"name": "my-project", "chart_dir": None, "docker_path": None, "python_module_path": "my_project"})
+    )
+    (tmp_path / ".bumpversion.cfg").write_text("[bumpversion]\ncurrent_version = 1.2.3\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "_project", None)
+    monkeypatch.setenv("BRANCH_NAME", "master")
+    monkeypatch.setenv("BUILD_NUMBER", "")
+
+    local = {}
+
+    def get(ref):
+        if ref not in local:
+            raise docker.errors.ImageNotFound(ref)
+        return local[ref]
+
+    def pull(repository, tag):
+        raise docker.errors.NotFound(f"{repository}:{tag}")
+
+    client = SimpleNamespace(images=SimpleNamespace(get=get, pull=pull, list=lambda name: list(local.values())))
+    monkeypatch.setattr(impl, "get_docker_client", lambda: client)
+    return local
+
+
+def _tag():
+    return impl.get_docker_image("dev")[1]
+
+
+def test_inspect_layers_compares_and_gates(images, capsys):
+    tag = _tag()
+    images[f"{REPOSITORY}:{tag}"] = _FakeImage(6000, tag=tag)
+    images[f"{REPOSITORY}:1.2.2d"] = _FakeImage(5000, LAYERS[:2], tag="1.2.2d")
+    images[f"{REPOSITORY}:1.2.1d"] = _FakeImage(100, tag="1.2.1d")
+
+    assert impl.inspect_layers("dev") == 0
+    out = capsys.readouterr().out
+    assert "RUN apt-get update" in out
+    assert "Wasted space: 4.1 KiB" in out
+    assert f"Compared with {REPOSITORY}:1.2.2d: +1000 B (+20.0%), 2 -> 4 layers" in out
+
+    assert impl.inspect_layers("dev", max_size=parse_size("10K"), max_growth=25, max_waste=parse_size("5K")) == 0
+    assert impl.inspect_layers("dev", max_growth=10) == 1
+    assert "FAILED: image grew 20.0%, more than the 10% allowed" in capsys.readouterr().out
+    assert impl.inspect_layers("dev", max_waste=1000, against="1.2.1d") == 1
+    assert "FAILED: 4.1 KiB wasted, over the 1000 B limit" in capsys.readouterr().out
+
+
+def test_inspect_layers_needs_the_image(images):
+    with pytest.raises(click.ClickException, match="No image"):
+        impl.inspect_layers("dev")
+
+
+def test_max_growth_needs_a_baseline(images, capsys):
+    tag = _tag()
+    images[f"{REPOSITORY}:{tag}"] = _FakeImage(6000, tag=tag)
+
+    assert impl.inspect_layers("dev") == 0
+    assert impl.inspect_layers("dev", max_growth=10) == 1
+    assert "FAILED: no earlier image to check --max-growth against" in capsys.readouterr().out
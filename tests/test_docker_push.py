@@ -0,0 +1,94 @@
+"""Multi-tag pushes, with a fake docker client standing in for the daemon and registry"""
+
+import threading
+
+from forj.docker.push import push_tags
+
+
+class _FakeRegistry:
+    """Plays the daemon: uploads layers the registry doesn't have yet, then stores the manifest"""
+
+    def __init__(self, layers, fail_tags=(), no_digest_tags=()):
+        self.layers = layers
+        self.fail_tags = set(fail_tags)
+        # Tags whose push stream just ends, the way it does when the daemon's connection drops
+        self.no_digest_tags = set(no_digest_tags)
+        self.blobs, self.manifests, self.tagged = set(), {}, []
+        self.lock = threading.Lock()
+
+    def tag(self, source, repository, tag):
+        self.tagged.append((source, f"{repository}:{tag}"))
+
+    def push(self, repository, tag, stream, decode):
+        assert stream and decode
+        yield {"status": f"The push refers to repository [{repository}]"}
+        for layer in self.layers:
+            yield {"status": "Preparing", "id": layer, "progressDetail": {}}
+        for layer in self.layers:
+            with self.lock:
+                exists = layer in self.blobs
+            if exists:
+                yield {"status": "Layer already exists", "id": layer, "progressDetail": {}}
+                continue
+            for current in (0, 400, 800, 1000):
+                yield {"status": "Pushing", "id": layer, "progressDetail": {"current": current, "total": 1000}}
+            with self.lock:
+                self.blobs.add(layer)
+            yield {"status": "Pushed", "id": layer, "progressDetail": {}}
+        if tag in self.fail_tags:
+            yield {"errorDetail": {"message": "denied: requested access to the resource is denied"}, "error": "denied"}
+            return
+        if tag in self.no_digest_tags:
+            return
+        self.manifests[tag] = "sha256:" + "ab" * 32
+        yield {"status": f"{tag}: digest: sha256:{'ab' * 32} size: 1234"}
+        yield {"progressDetail": {}, "aux": {"Tag": tag, "Digest": "sha256:" + "ab" * 32, "Size": 1234}}
+
+
+class _FakeClient:
+    def __init__(self, registry):
+        self.api = registry
+
+
+def test_sibling_tags_reuse_uploaded_layers(capsys):
+    registry = _FakeRegistry(["aaa", "bbb"])
+    results = push_tags(_FakeClient(registry), "reg/app", "1.2.3", ["1.2.3", "ctx-0123", "latest"])
+
+    assert {tag: status for tag, (status, _, _) in results.items()} == {
+        "1.2.3": "pushed",
+        "ctx-0123": "pushed",
+        "latest": "pushed",
+    }
+    assert registry.tagged == [("reg/app:1.2.3", "reg/app:ctx-0123"), ("reg/app:1.2.3", "reg/app:latest")]
+    assert sorted(registry.manifests) == ["1.2.3", "ctx-0123", "latest"]
+    assert results["1.2.3"][2].uploaded == ["aaa", "bbb"]
+    assert results["latest"][2].existing == ["aaa", "bbb"]
+
+    out = capsys.readouterr().out
+    assert "aaa: Pushing 75% of 1000 bytes" in out
+    # Siblings don't repeat the per-layer chatter for layers the first tag already took care of
+    assert "Layer already exists" not in out
+
+
+def test_error_events_fail_the_push(capsys):
+    registry = _FakeRegistry(["aaa"], fail_tags=["1.2.3"])
+    results = push_tags(_FakeClient(registry), "reg/app", "1.2.3", ["1.2.3", "latest"])
+
+    status, _, progress = results["1.2.3"]
+    assert (status, progress.error) == ("failed", "denied")
+    assert results["latest"][0] == "skipped"
+    assert "denied" in capsys.readouterr().out
+
+
+def test_push_without_digest_fails():
+    registry = _FakeRegistry(["aaa"], no_digest_tags=["ctx-0123"])
+    results = push_tags(_FakeClient(registry), "reg/app", "1.2.3", ["1.2.3", "ctx-0123", "latest"])
+
+    assert {tag: status for tag, (status, _, _) in results.items()} == {
+        "1.2.3": "pushed",
+        "ctx-0123": "failed",
+        "latest": "pushed",
+    }
+    progress = results["ctx-0123"][2]
+    assert progress.digest is None
+    assert progress.error == "Push finished without the registry reporting a digest"
@@ -0,0 +1,74 @@
+"""pytest's cache outliving test containers, for `forj docker test --failed-first/--last-failed`"""
+
+import importlib
+import json
+from types import SimpleNamespace
+
+import pytest
+from click.testing import CliRunner
+
+from forj.cli import main
+from forj.config import config
+from forj.docker import docker
+
+# The module, not the click group `forj.docker` exports under the same name
+docker_commands = importlib.import_module("forj.docker.commands")
+
+IMAGE = "docker.elliotrivers.rip/my-project:1.2.3d"
+
+
+@pytest.fixture
+def commands_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ran = []
+    monkeypatch.setattr(docker, "run_echoed", lambda cmd, **kw: ran.append(cmd))
+    return ran
+
+
+def test_fresh_containers_mount_the_cache(tmp_path, monkeypatch, commands_run):
+    monkeypatch.setattr(docker, "warm_container", lambda image: None)
+
+    docker.test(IMAGE, "not integration", ["--lf"])
+
+    assert (tmp_path / ".forj" / "pytest-cache").is_dir()
+    assert commands_run == [
+        f"docker run --rm --network host --env-file .env.example -v {tmp_path}/.forj/pytest-cache:/forj-pytest-cache "
+        f'{IMAGE} scripts/run-tests.sh "not integration" --override-ini=cache_dir=/forj-pytest-cache --lf'
+    ]
+
+
+def test_warm_containers_find_the_cache_in_the_project(monkeypatch, commands_run):
+    warm = SimpleNamespace(exec_cmd=lambda: ["docker", "exec", "abc", "pipenv", "run"])
+    monkeypatch.setattr(docker, "warm_container", lambda image: warm)
+
+    docker.test(IMAGE, "not integration", ["--ff", "tests/test_a.py"])
+
+    assert commands_run == [
+        'docker exec abc pipenv run scripts/run-tests.sh "not integration" '
+        "--override-ini=cache_dir=/app/.forj/pytest-cache --ff tests/test_a.py"
+    ]
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / ".forjproject").write_text(
+        json.dumps({"name": "my-project", "chart_dir": None, "docker_path": None, "python_module_path": "my_project"})
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "_project", None)
+    monkeypatch.setattr(docker_commands, "build_impl", lambda target, force: IMAGE)
+    tested = []
+    monkeypatch.setattr(docker_commands, "test_impl", lambda image, mark_expr, **kw: tested.append(kw["args"]) or 0)
+    return tested
+
+
+def test_failed_first_and_last_failed_go_to_pytest(project):
+    runner = CliRunner()
+    assert runner.invoke(main, ["docker", "test", "--failed-first"]).exit_code == 0
+    assert runner.invoke(main, ["docker", "test", "--last-failed"]).exit_code == 0
+    assert runner.invoke(main, ["docker", "test"]).exit_code == 0
+    assert project == [["--ff"], ["--lf"], []]
+
+    result = runner.invoke(main, ["docker", "test", "--last-failed", "--shards", "2"])
+    assert result.exit_code == 2
+    assert "--shards doesn't go with" in result.output
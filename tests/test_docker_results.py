@@ -0,0 +1,101 @@
+"""Skipping `forj docker test` runs identical to one that already passed"""
+
+import os
+import threading
+from subprocess import CalledProcessError
+from types import SimpleNamespace
+
+import pytest
+
+from forj.docker import impl, results
+
+IMAGE = "docker.elliotrivers.rip/my-project:1.2.3d"
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    """Fakes the image's ID and the test run itself, recording the mark expressions run"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    state = SimpleNamespace(image_id="sha256:aaaa", status=0, ran=[])
+    monkeypatch.setattr(
+        impl,
+        "get_docker_client",
+        lambda: SimpleNamespace(images=SimpleNamespace(get=lambda ref: SimpleNamespace(id=state.image_id))),
+    )
+
+    def docker_test(image, mark_expr, args=()):
+        state.ran.append(" ".join([mark_expr, *args]))
+        if state.status:
+            raise CalledProcessError(state.status, "scripts/run-tests.sh")
+
+    monkeypatch.setattr(impl, "docker_test", docker_test)
+    return state
+
+
+def test_identical_passing_run_is_skipped(tmp_path, fake, capsys):
+    (tmp_path / ".env.example").write_text("A=1\n")
+
+    assert impl.test(IMAGE, "not integration") == 0
+    assert impl.test(IMAGE, "not integration") == 0
+    assert fake.ran == ["not integration"]
+    assert "Test cache hit" in capsys.readouterr().out
+
+    # Anything that identifies the run changing means running again
+    assert impl.test(IMAGE, "integration") == 0
+    (tmp_path / ".env.example").write_text("A=2\n")
+    assert impl.test(IMAGE, "not integration") == 0
+    fake.image_id = "sha256:bbbb"
+    assert impl.test(IMAGE, "not integration") == 0
+    assert impl.test(IMAGE, "not integration", cache=False) == 0
+    assert impl.test(IMAGE, "not integration", junitxml="report.xml") == 0
+    assert fake.ran == ["not integration", "integration"] + ["not integration"] * 4
+
+    # Extra pytest args depend on pytest's own cache, so they're neither skipped nor recorded
+    fake.image_id = "sha256:cccc"
+    assert impl.test(IMAGE, "not integration", args=["--lf"]) == 0
+    assert impl.test(IMAGE, "not integration", args=["--lf"]) == 0
+    assert impl.test(IMAGE, "not integration") == 0
+    assert fake.ran[-3:] == ["not integration --lf", "not integration --lf", "not integration"]
+
+
+def test_failed_runs_run_again(fake, capsys):
+    fake.status = 1
+
+    assert impl.test(IMAGE, "not integration") == 1
+    assert impl.test(IMAGE, "not integration") == 1
+    assert len(fake.ran) == 2
+    assert "failed on this image last time (exit status 1)" in capsys.readouterr().out
+
+    fake.status = 0
+    assert impl.test(IMAGE, "not integration") == 0
+    assert impl.test(IMAGE, "not integration") == 0
+    assert len(fake.ran) == 3
+
+
+def test_results_are_kept_for_recent_images(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(results, "MAX_IMAGES", 3)
+    for n, image_id in enumerate(["sha256:0", "sha256:1", "sha256:2", "sha256:3"]):
+        results.record(image_id, "key", 0, 1.0)
+        # Ages go by mtime, which can be coarse
+        os.utime(tmp_path / "cache" / "forj" / "test-results" / f"{n}.json", (n, n))
+    results.record("sha256:1", "other", 1, 1.5, mark_expr="not integration")
+
+    assert results.lookup("sha256:0", "key") is None
+    assert results.lookup("sha256:2", "key")["passed"]
+    assert results.lookup("sha256:1", "key")["passed"]
+    recorded = results.lookup("sha256:1", "other")
+    assert (recorded["passed"], recorded["status"], recorded["seconds"]) == (False, 1, 1.5)
+    assert recorded["mark_expr"] == "not integration"
+
+
+def test_concurrent_records_all_stick(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    threads = [threading.Thread(target=results.record, args=("sha256:a", str(n), 0, 1.0)) for n in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(results.lookup("sha256:a", str(n)) for n in range(20))
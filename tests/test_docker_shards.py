@@ -0,0 +1,102 @@
+import io
+import json
+
+import pytest
+
+from forj.docker import shards
+from forj.docker.shards import Shard, merge_reports, plan, record_durations
+
+
+def test_plan_balances_by_recorded_duration():
+    durations = {"t.py::slow": 10.0, "t.py::mid": 6.0, "t.py::a": 2.0, "t.py::b": 2.0}
+    shards = plan([*durations, "t.py::new"], durations, 2)
+
+    assert [sorted(shard.tests) for shard in shards] == [
+        ["t.py::a", "t.py::slow"],
+        ["t.py::b", "t.py::mid", "t.py::new"],
+    ]
+    # The unknown test is assumed to take the median (4s)
+    assert [shard.predicted for shard in shards] == [12.0, 12.0]
+
+
+def test_plan_never_makes_empty_shards():
+    assert len(plan(["t.py::a"], {}, 8)) == 1
+
+
+def test_reports_merge_and_durations_are_recorded(tmp_path):
+    for i, (name, time) in enumerate([("test_a", "1.5"), ("test_b", "0.25")]):
+        (tmp_path / f"shard-{i}.xml").write_text(
+            f'<testsuites><testsuite name="pytest" tests="1" failures="{i}" errors="0" skipped="0" time="{time}">'
+            f'<testcase classname="tests.test_x.TestX" name="{name}" time="{time}"/>'
+            "</testsuite></testsuites>"
+        )
+
+    merged = merge_reports(
+        [tmp_path / "shard-0.xml", tmp_path / "shard-1.xml", tmp_path / "missing.xml"],
+        tmp_path / "out" / "junit.xml",
+    )
+    assert (merged.get("tests"), merged.get("failures"), merged.get("time")) == ("2", "1", "1.750")
+    assert (tmp_path / "out" / "junit.xml").is_file()
+
+    durations_file = tmp_path / "durations.json"
+    record_durations(merged, ["tests/test_x.py::TestX::test_a", "tests/test_x.py::TestX::test_b"], durations_file)
+    assert json.loads(durations_file.read_text()) == {
+        "tests/test_x.py::TestX::test_a": 1.5,
+        "tests/test_x.py::TestX::test_b": 0.25,
+    }
+
+
+class _FakePopen:
+    """A shard's container: prints a line and exits with `returncode`"""
+
+    returncode = 0
+    ran = []
+
+    def __init__(self, cmd, **kwargs):
+        self.ran.append(cmd)
+        self.stdout = io.StringIO("1 passed\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def test_shard_test_ids_go_in_a_file(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(_FakePopen, "ran", [])
+    monkeypatch.setattr(shards, "Popen", _FakePopen)
+    shard = Shard(1, ["tests/test_a.py::test_x[a b]", "tests/test_a.py::test_y"])
+
+    shards._run_shard("image", "not integration", shard, 2, tmp_path)
+
+    (cmd,) = _FakePopen.ran
+    assert cmd[-3:] == [
+        "not integration",
+        "--junitxml=/forj-test-results/shard-1.xml",
+        "@/forj-test-results/shard-1.args",
+    ]
+    assert (tmp_path / "shard-1.args").read_text() == "tests/test_a.py::test_x[a b]\ntests/test_a.py::test_y\n"
+    assert shard.returncode == 0
+    assert "[shard 2/2] 1 passed" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("returncode, expected", [(-9, 137), (2, 2)])
+def test_shard_exit_statuses_are_failures(tmp_path, monkeypatch, returncode, expected):
+    monkeypatch.setattr(_FakePopen, "returncode", returncode)
+    monkeypatch.setattr(shards, "Popen", _FakePopen)
+    shard = Shard(0, ["t.py::a"])
+    shards._run_shard("image", "", shard, 1, tmp_path)
+    assert shard.returncode == expected
+
+
+def test_shard_that_cant_start_fails(tmp_path, monkeypatch, capsys):
+    def no_docker(cmd, **kwargs):
+        raise FileNotFoundError(2, "No such file or directory", "docker")
+
+    monkeypatch.setattr(shards, "Popen", no_docker)
+    shard = Shard(0, ["t.py::a"])
+    shards._run_shard("image", "", shard, 1, tmp_path)
+
+    assert shard.returncode == 1
+    assert "[shard 1/1] Couldn't run the shard" in capsys.readouterr().out
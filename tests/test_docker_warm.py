@@ -0,0 +1,121 @@
+"""Warm containers (`forj docker up/down`), with the docker CLI faked out"""
+
+import json
+from subprocess import CompletedProcess
+
+import pytest
+
+from forj.docker import docker
+
+IMAGE = "docker.elliotrivers.rip/my-project:1.2.3d"
+
+
+class _FakeDockerCli:
+    """Answers the docker commands `up`, `down` and `warm_container` run, and remembers them"""
+
+    def __init__(self):
+        self.ran = []
+        # The image's fingerprint label and entrypoint
+        self.fingerprint = "f1"
+        self.entrypoint = ["pipenv", "run"]
+        # The containers there are: {id: labels}, and their names
+        self.containers = {}
+        self.names = {}
+
+    def __call__(self, cmd, **kwargs):
+        self.ran.append(cmd)
+        if cmd[:2] == ["docker", "inspect"]:
+            fmt = cmd[3]
+            out = json.dumps(self.entrypoint) if "Entrypoint" in fmt else self.fingerprint
+        elif cmd[:2] == ["docker", "ps"]:
+            # Every filter is label=key=value
+            filters = {cmd[i + 1][len("label=") :] for i, arg in enumerate(cmd) if arg == "--filter"}
+            matching = {
+                cid: labels
+                for cid, labels in self.containers.items()
+                if filters <= {f"{key}={value}" for key, value in labels.items()}
+            }
+            if "-aq" in cmd:
+                out = "\n".join(matching)
+            else:
+                label_names = (docker.PROJECT_LABEL, docker.FINGERPRINT_LABEL, docker.ENTRYPOINT_LABEL)
+                out = "\n".join(
+                    "\t".join([cid, self.names[cid], *(labels[name] for name in label_names)])
+                    for cid, labels in matching.items()
+                )
+        elif cmd[:3] == ["docker", "run", "-d"]:
+            labels = dict(cmd[i + 1].split("=", 1) for i, arg in enumerate(cmd) if arg == "--label")
+            cid = f"c{len(self.ran)}"
+            self.containers[cid] = labels
+            self.names[cid] = cmd[cmd.index("--name") + 1]
+            out = cid + "\n"
+        elif cmd[:3] == ["docker", "rm", "-f"]:
+            for cid in [cid for cid, name in self.names.items() if cid in cmd[3:] or name in cmd[3:]]:
+                del self.containers[cid], self.names[cid]
+            out = ""
+        else:
+            raise AssertionError(f"Unexpected command {cmd}")
+        return CompletedProcess(cmd, 0, stdout=out)
+
+
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fake = _FakeDockerCli()
+    monkeypatch.setattr(docker, "run", fake)
+    return fake
+
+
+def test_up_labels_the_container(cli):
+    warm = docker.up(IMAGE, "my-project-dev", "my-project")
+
+    assert cli.ran[2] == ["docker", "rm", "-f", "my-project-dev"]
+    assert cli.containers[warm.id] == {
+        docker.PROJECT_LABEL: "my-project",
+        docker.WARM_IMAGE_LABEL: IMAGE,
+        docker.FINGERPRINT_LABEL: "f1",
+        docker.ENTRYPOINT_LABEL: '["pipenv","run"]',
+    }
+    assert (warm.fingerprint, warm.entrypoint) == ("f1", ["pipenv", "run"])
+
+
+def test_warm_container_is_found_by_image_and_recreated_when_it_changes(cli, capsys):
+    assert docker.warm_container(IMAGE) is None
+    first = docker.up(IMAGE, "my-project-dev", "my-project")
+
+    found = docker.warm_container(IMAGE)
+    assert (found.id, found.project, found.entrypoint) == (first.id, "my-project", ["pipenv", "run"])
+    assert f"label={docker.WARM_IMAGE_LABEL}={IMAGE}" in cli.ran[-2]
+
+    # A rebuilt image has a new fingerprint: the container's replaced by one from the new image
+    cli.fingerprint = "f2"
+    recreated = docker.warm_container(IMAGE)
+    assert recreated.id != first.id
+    assert list(cli.containers) == [recreated.id]
+    assert cli.containers[recreated.id][docker.FINGERPRINT_LABEL] == "f2"
+    assert "changed; recreating warm container my-project-dev" in capsys.readouterr().out
+
+
+def test_down_removes_only_the_projects_containers(cli):
+    mine = docker.up(IMAGE, "my-project-dev", "my-project")
+    other = docker.up("other:1", "other-dev", "other")
+
+    assert docker.down("my-project", "some-other-image:1") == []
+    assert docker.down("my-project") == [mine.id]
+    assert ["docker", "ps", "-aq", "--filter", f"label={docker.PROJECT_LABEL}=my-project"] in cli.ran
+    assert list(cli.containers) == [other.id]
+
+
+def test_commands_go_to_the_warm_container(tmp_path, monkeypatch):
+    # `test` keeps pytest's cache under the project's .forj
+    monkeypatch.chdir(tmp_path)
+    warm = docker.WarmContainer("c1", "my-project-dev", "my-project", IMAGE, "f1", ["/entry point.sh"])
+    monkeypatch.setattr(docker, "warm_container", lambda image: warm)
+    ran = []
+    monkeypatch.setattr(docker, "run_echoed", lambda cmd, **kwargs: ran.append(cmd))
+
+    docker.shell(IMAGE, ["ls", "-l"], workdir="/app/my dir")
+    docker.test(IMAGE, "not integration")
+
+    assert ran[0] == "docker exec --workdir '/app/my dir' c1 '/entry point.sh' ls -l"
+    assert ran[1].startswith("docker exec c1 '/entry point.sh' scripts/run-tests.sh \"not integration\" ")
@@ -0,0 +1,88 @@
+"""The helm dependency cache, with a fake `helm` and a file-based chart repo standing in"""
+
+import os
+import sys
+import textwrap
+
+import pytest
+
+from forj.helm import helm
+
+# Packs every file:// dependency into charts/ like `helm dependency update` would, and logs the call
+_FAKE_HELM = textwrap.dedent(
+    """\
+    #!{python}
+    import re, sys, tarfile
+    from pathlib import Path
+
+    chart = Path(sys.argv[3])
+    with open({log!r}, "a") as log:
+        log.write(" ".join(sys.argv[1:]) + "\\n")
+    (chart / "charts").mkdir(exist_ok=True)
+    for dep in re.findall(r"repository: file://(\\S+)", (chart / "Chart.yaml").read_text()):
+        src = (chart / dep).resolve()
+        with tarfile.open(chart / "charts" / f"{{src.name}}-0.1.0.tgz", "w:gz") as tar:
+            tar.add(src, arcname=src.name)
+    (chart / "Chart.lock").write_text("dependencies: []\\ndigest: sha256:abc\\n")
+    """
+)
+
+
+@pytest.fixture
+def chart(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_helm = bin_dir / "helm"
+    fake_helm.write_text(_FAKE_HELM.format(python=sys.executable, log=str(tmp_path / "helm.log")))
+    fake_helm.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    repo = tmp_path / "repo" / "common"
+    repo.mkdir(parents=True)
+    (repo / "Chart.yaml").write_text("name: common\nversion: 0.1.0\n")
+
+    chart_dir = tmp_path / "app"
+    chart_dir.mkdir()
+    (chart_dir / "Chart.yaml").write_text(
+        "name: app\nversion: 1.0.0\ndependencies:\n  - name: common\n    repository: file://../repo/common\n"
+    )
+    return chart_dir, repo
+
+
+def _helm_calls(chart_dir):
+    log = chart_dir.parent / "helm.log"
+    return len(log.read_text().splitlines()) if log.exists() else 0
+
+
+def test_unchanged_dependencies_are_restored_from_cache(chart):
+    chart_dir, _repo = chart
+
+    # No Chart.lock yet: helm has to run, and then the result is cached
+    helm.dependency_update(chart_dir, skip_refresh=False)
+    assert _helm_calls(chart_dir) == 1
+    archive = (chart_dir / "charts" / "common-0.1.0.tgz").read_bytes()
+
+    (chart_dir / "charts" / "common-0.1.0.tgz").unlink()
+    helm.dependency_update(chart_dir, skip_refresh=False)
+    assert _helm_calls(chart_dir) == 1
+    assert (chart_dir / "charts" / "common-0.1.0.tgz").read_bytes() == archive
+
+
+def test_changed_local_dependency_runs_helm(chart):
+    chart_dir, repo = chart
+    helm.dependency_update(chart_dir, skip_refresh=False)
+    helm.dependency_update(chart_dir, skip_refresh=False)
+    assert _helm_calls(chart_dir) == 1
+
+    (repo / "values.yaml").write_text("replicas: 2\n")
+    helm.dependency_update(chart_dir, skip_refresh=False)
+    assert _helm_calls(chart_dir) == 2
+
+
+def test_cache_can_be_bypassed(chart):
+    chart_dir, _repo = chart
+    helm.dependency_update(chart_dir, skip_refresh=False)
+    helm.dependency_update(chart_dir, skip_refresh=False, use_cache=False)
+    assert _helm_calls(chart_dir) == 2
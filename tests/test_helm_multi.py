@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from forj.helm.multi import discover_charts, run_charts
+
+
+@pytest.fixture
+def monorepo(tmp_path):
+    """app depends on lib; tool stands alone; lib vendors a subchart that isn't ours"""
+    for name, deps in (("app", ["lib"]), ("lib", []), ("tool", [])):
+        chart = tmp_path / "charts-src" / name
+        chart.mkdir(parents=True)
+        lines = [f"name: {name}", "version: 0.1.0", "dependencies:"]
+        lines += [f"  - name: {dep}\n    repository: file://../{dep}" for dep in deps]
+        (chart / "Chart.yaml").write_text("\n".join(lines) + "\n")
+    vendored = tmp_path / "charts-src" / "lib" / "charts" / "vendored"
+    vendored.mkdir(parents=True)
+    (vendored / "Chart.yaml").write_text("name: vendored\n")
+    return tmp_path / "charts-src"
+
+
+def test_discover_skips_vendored_subcharts(monorepo):
+    assert [c.name for c in discover_charts(monorepo)] == ["app", "lib", "tool"]
+
+
+def test_dependencies_run_first(monorepo):
+    finished, lock = [], threading.Lock()
+
+    def action(chart_dir, prefix):
+        with lock:
+            if chart_dir.name == "app":
+                assert "lib" in finished
+            finished.append(chart_dir.name)
+
+    run_charts(discover_charts(monorepo), action, jobs=3)
+    assert sorted(finished) == ["app", "lib", "tool"]
+
+
+def test_dependents_of_failures_are_skipped(monorepo, capsys):
+    ran = []
+
+    def action(chart_dir, prefix):
+        ran.append(chart_dir.name)
+        if chart_dir.name == "lib":
+            raise RuntimeError("lint failed")
+
+    with pytest.raises(RuntimeError, match="2 of 3 charts"):
+        run_charts(discover_charts(monorepo), action)
+    assert sorted(ran) == ["lib", "tool"]
+    assert "skipped" in capsys.readouterr().out
@@ -0,0 +1,87 @@
+"""`forj helm push` against a stand-in chartmuseum running in a thread"""
+
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from forj.helm import helm
+
+
+class _ChartMuseum(BaseHTTPRequestHandler):
+    def do_POST(self):  # pylint: disable=invalid-name
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.requests.append((self.path, self.headers["Authorization"], body))
+            flaky = server.failures > 0
+            server.failures -= flaky
+        self.send_response(503 if flaky else 201)
+        self.end_headers()
+        self.wfile.write(b'{"saved": true}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def chartmuseum():
+    servers = []
+
+    def start(failures=0):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _ChartMuseum)
+        server.requests, server.failures, server.lock = [], failures, threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def chart(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHARTMUSEUM_CREDS", "user:pa:ss")
+    chart_dir = tmp_path / "my-chart"
+    chart_dir.mkdir()
+    packaged = tmp_path / "my-chart-1.2.3.tgz"
+    packaged.write_bytes(b"not really a tarball" * 1000)
+    return chart_dir, packaged
+
+
+def test_push_retries_server_errors(chartmuseum, chart, monkeypatch):
+    chart_dir, packaged = chart
+    server, url = chartmuseum(failures=2)
+    monkeypatch.setenv("CHART_REPO", url)
+    monkeypatch.setattr(helm, "_PUSH_BACKOFF_FACTOR", 0.01)
+
+    helm.push(chart_dir)
+
+    assert len(server.requests) == 3
+    expected_auth = "Basic " + base64.b64encode(b"user:pa:ss").decode()
+    for path, auth, body in server.requests:
+        # Every attempt sends the whole file, not whatever was left after the last one
+        assert (path, auth, body) == ("/api/charts", expected_auth, packaged.read_bytes())
+
+
+def test_push_many_charts_to_many_repos(chartmuseum, chart):
+    chart_dir, packaged = chart
+    other = packaged.with_name("other-chart-0.1.0.tgz")
+    other.write_bytes(b"another one")
+    servers = [chartmuseum(), chartmuseum()]
+
+    helm.push(chart_dir, [packaged, other], [url for _, url in servers])
+
+    for server, _ in servers:
+        assert sorted(body for _, _, body in server.requests) == sorted([packaged.read_bytes(), b"another one"])
+
+
+def test_push_without_a_package(chart, monkeypatch):
+    chart_dir, packaged = chart
+    packaged.unlink()
+    monkeypatch.setenv("CHART_REPO", "http://127.0.0.1:1")
+
+    with pytest.raises(FileNotFoundError):
+        helm.push(chart_dir)
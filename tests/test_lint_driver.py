@@ -0,0 +1,102 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from forj.python import lint_driver, python
+
+
+def _echo(text, returncode=0):
+    return [sys.executable, "-c", f"import sys; sys.stdout.write({text!r}); sys.exit({returncode})"]
+
+
+# Stands in for pylint: one C0114 per file it's given, and a log of which files it was given
+_FAKE_PYLINT = """
+import sys
+with open("invocations.log", "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\\n")
+for path in sys.argv[1:]:
+    module = path[:-3].replace("/", ".")
+    print(f"************* Module {module}\\n{path}:1:0: C0114: Missing module docstring (missing-module-docstring)")
+sys.exit(16)
+"""
+
+
+def test_report_is_ordered_and_sections_sorted(capsys):
+    pylint_out = (
+        "************* Module pkg.b\nb.py:1:0: C0114\n"
+        "************* Module pkg.a\na.py:1:0: C0114\n"
+        "\n------\nYour code has been rated at 5.00/10\n"
+    )
+    status = lint_driver.main(
+        {
+            "linters": [
+                ["black", _echo("--- z.py\n+++ z.py\n--- a.py\n+++ a.py\n")],
+                ["pylint", _echo(pylint_out, returncode=16)],
+            ],
+            "paths": ["pkg"],
+        }
+    )
+
+    assert status == 1
+    assert capsys.readouterr().out.splitlines() == [
+        "===== black: ok =====",
+        "--- a.py",
+        "+++ a.py",
+        "--- z.py",
+        "+++ z.py",
+        "===== pylint: failed (exit 16) =====",
+        "************* Module pkg.a",
+        "a.py:1:0: C0114",
+        "************* Module pkg.b",
+        "b.py:1:0: C0114",
+        "",
+        "------",
+        "Your code has been rated at 5.00/10",
+        "===== 1/2 linters passed =====",
+    ]
+
+
+def test_unchanged_files_reuse_cached_findings(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "a.py").write_text("a = 1\n")
+    (tmp_path / "pkg" / "b.py").write_text("b = 1\n")
+    config = {
+        "linters": [["pylint", [sys.executable, "-c", _FAKE_PYLINT]]],
+        "paths": ["pkg/a.py", "pkg/b.py"],
+        "cache": ".forj/lint-cache",
+    }
+
+    assert lint_driver.main(config) == 1
+    first = capsys.readouterr().out
+    (tmp_path / "pkg" / "b.py").write_text("b = 2\n")
+    assert lint_driver.main(config) == 1
+    second = capsys.readouterr().out
+
+    assert (tmp_path / "invocations.log").read_text().splitlines() == ["pkg/a.py pkg/b.py", "pkg/b.py"]
+    assert "(2 files, 0 cached)" in first
+    assert "(2 files, 1 cached)" in second
+    assert first.splitlines()[1:] == second.splitlines()[1:]
+
+
+def test_nothing_to_lint():
+    assert lint_driver.main({"linters": [["black", ["false"]]], "paths": []}) == 0
+
+
+def test_config_goes_to_the_container_as_a_file(tmp_path, monkeypatch):
+    """As the container gets it: the driver piped in, a path to the config under .forj as its argument"""
+    monkeypatch.chdir(tmp_path)
+    paths = [f"pkg/module_{n}.py" for n in range(20000)]
+
+    def run_script(image, script, args, workdir):
+        (config_path,) = args
+        assert config_path.startswith(".forj/lint-") and config_path.endswith(".json")
+        assert json.loads(Path(config_path).read_text())["paths"] == paths
+        return subprocess.run([sys.executable, "-", config_path], input=script, text=True, check=False).returncode
+
+    monkeypatch.setattr(python, "docker_run_script", run_script)
+    monkeypatch.setattr(python, "_black_cmd", lambda fix: ["true"])
+    assert python._lint_parallel(paths, "image", ["black"], fix=False, jobs=0, cache=False) == 0
+    # Cleaned up after
+    assert not list((tmp_path / ".forj").glob("lint-*.json"))
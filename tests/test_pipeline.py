@@ -0,0 +1,113 @@
+"""`forj run` pipelines, using cheap forj commands as steps"""
+
+import json
+import threading
+import time
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from forj.cli import main
+from forj.config import config
+from forj.pipeline import pipeline
+
+PIPELINES = {
+    "ci": {
+        "version": {"run": "version get", "inputs": ["notes/*.txt"]},
+        "python": {"run": "forj version get --python", "needs": ["version"]},
+        "json": {"run": "version get --json", "needs": ["version"], "inputs": ["notes/*.txt"]},
+    },
+    "broken": {
+        "bad": {"run": "version get --no-such-option"},
+        "after": {"run": "version get", "needs": ["bad"]},
+        "independent": {"run": "version get"},
+    },
+}
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / ".forjproject").write_text(
+        json.dumps(
+            {
+                "name": "my-project",
+                "chart_dir": None,
+                "docker_path": None,
+                "python_module_path": "my_project",
+                "pipelines": PIPELINES,
+            }
+        )
+    )
+    (tmp_path / ".bumpversion.cfg").write_text("[bumpversion]\ncurrent_version = 1.2.3\n")
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "a.txt").write_text("one\n")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv(config.root_env_var, str(tmp_path))
+    monkeypatch.delenv("BRANCH_NAME", raising=False)
+    monkeypatch.setattr(config, "_project", None)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def _summary(output):
+    lines = output.split("summary:\n", 1)[1].splitlines()
+    return dict(line.split()[:2] for line in lines)
+
+
+def test_steps_run_prefixed_and_unchanged_ones_are_skipped(project):
+    result = CliRunner().invoke(main, ["run", "ci"])
+    assert result.exit_code == 0, result.output
+    assert _summary(result.output) == {"version": "ok", "python": "ok", "json": "ok"}
+    assert "[version] 1.2.3-local" in result.output
+    assert "[python ] forj version get --python" in result.output
+
+    result = CliRunner().invoke(main, ["run", "ci"])
+    assert _summary(result.output) == {"version": "unchanged", "python": "ok", "json": "unchanged"}
+
+    (project / "notes" / "b.txt").write_text("two\n")
+    result = CliRunner().invoke(main, ["run", "ci"])
+    assert _summary(result.output) == {"version": "ok", "python": "ok", "json": "ok"}
+
+    result = CliRunner().invoke(main, ["run", "ci", "--force"])
+    assert _summary(result.output) == {"version": "ok", "python": "ok", "json": "ok"}
+
+
+def test_failures_skip_dependents(project):
+    result = CliRunner().invoke(main, ["run", "broken"])
+    assert result.exit_code == 1
+    assert _summary(result.output) == {"bad": "failed", "after": "skipped", "independent": "ok"}
+    assert "[bad        ] No such option '--no-such-option'" in result.output
+
+
+def test_unknown_pipeline(project):
+    result = CliRunner().invoke(main, ["run", "nope"])
+    assert result.exit_code == 2
+    assert "pipelines: broken, ci" in result.output
+
+
+def test_concurrent_steps_output_whole_prefixed_lines(project, monkeypatch, capsys):
+    both_running = threading.Barrier(2, timeout=10)
+
+    def chatty(name):
+        @click.command()
+        def command():
+            both_running.wait()
+            for n in range(20):
+                # Each line in pieces, so the other step gets a chance to write in the middle of it
+                click.echo(f"{name} line", nl=False)
+                time.sleep(0.001)
+                click.echo(f" {n}")
+
+        return command
+
+    steps = {name: pipeline.Step(name, "chatty") for name in ("a", "b")}
+    monkeypatch.setattr(pipeline, "_resolve", lambda steps: {name: chatty(name) for name in steps})
+
+    assert pipeline.run_pipeline("par", steps, jobs=2) == 0
+    lines = capsys.readouterr().out.split("forj run par summary:", 1)[0].splitlines()
+    for name in ("a", "b"):
+        assert [line for line in lines if line.startswith(f"[{name}] {name} line")] == [
+            f"[{name}] {name} line {n}" for n in range(20)
+        ]
+    assert all(line.startswith(("[a] ", "[b] ")) for line in lines)
@@ -0,0 +1,146 @@
+"""`forj serve` and the thin client in front of it, with the server in its own process"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import docker
+import pytest
+
+import forj.cli
+from forj import client
+from forj.docker import impl
+from forj.serve.server import Server
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    root = tmp_path / "project"
+    root.mkdir()
+    (root / ".forjproject").write_text(
+        json.dumps({"name": "my-project", "chart_dir": None, "docker_path": None, "python_module_path": "my_project"})
+    )
+    (root / ".bumpversion.cfg").write_text("[bumpversion]\ncurrent_version = 1.2.3-dev.4\n")
+    for var in ("BRANCH_NAME", "BUILD_NUMBER", "FORJ_PROJECT_ROOT"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.chdir(root)
+    return root
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = tmp_path / "forj.sock"
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT), XDG_CACHE_HOME=str(tmp_path / "cache"))
+    proc = subprocess.Popen(
+        [sys.executable, "-c", "import sys; from forj.serve.server import serve; serve(sys.argv[1], 60)", str(path)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(path))
+            break
+        except OSError:
+            time.sleep(0.05)
+        finally:
+            probe.close()
+    yield path
+    client.send({"stop": True}, path)
+    proc.wait(timeout=10)
+
+
+def test_commands_run_on_the_server(project, server, capsys, monkeypatch):
+    assert client.run(["version", "get"], server) == 0
+    assert capsys.readouterr().out == "1.2.3-dev.4-local\n"
+
+    # The client's environment goes along with the command
+    monkeypatch.setenv("BRANCH_NAME", "main")
+    monkeypatch.setenv("BUILD_NUMBER", "7")
+    assert client.run(["version", "get"], server) == 0
+    assert capsys.readouterr().out == "1.2.3\n"
+
+    assert client.run(["version", "get", "--no-such-option"], server) == 2
+    assert "No such option" in capsys.readouterr().err
+
+
+def test_config_changes_are_picked_up(project, server, capsys):
+    assert client.run(["version", "get", "--json"], server) == 0
+    assert json.loads(capsys.readouterr().out)["image"].endswith("/my-project:1.2.3-dev.4-locald")
+
+    configfile = project / ".forjproject"
+    configfile.write_text(configfile.read_text().replace("my-project", "renamed"))
+    stat = configfile.stat()
+    os.utime(configfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert client.run(["version", "get", "--json"], server) == 0
+    assert json.loads(capsys.readouterr().out)["image"].endswith("/renamed:1.2.3-dev.4-locald")
+
+
+def test_no_server_means_in_process(project, tmp_path, monkeypatch):
+    assert client.run(["version", "get"], tmp_path / "nobody-home.sock") is None
+    assert client._wants_daemon(["docker", "build"])
+    assert not client._wants_daemon(["--trace", "t.json", "docker", "shell"])
+    assert not client._wants_daemon(["docker", "test", "--watch"])
+    monkeypatch.setenv(client.no_daemon_env_var, "1")
+    assert not client._wants_daemon(["docker", "build"])
+
+
+def test_hanging_up_interrupts_the_command(project, tmp_path, monkeypatch):
+    started = threading.Event()
+    seen = {}
+
+    def hang(argv, **kwargs):
+        seen["child"] = subprocess.Popen(["sleep", "60"])
+        started.set()
+        try:
+            while True:
+                time.sleep(0.05)
+        except KeyboardInterrupt:
+            seen["interrupted"] = True
+            raise
+
+    monkeypatch.setattr(forj.cli, "main", SimpleNamespace(main=hang))
+    with Server(tmp_path / "forj.sock") as server:
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.1}, daemon=True).start()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(str(server.path))
+        request = {"argv": ["docker", "test"], "cwd": str(project), "env": dict(os.environ)}
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        assert started.wait(10)
+        sock.close()
+
+        assert seen["child"].wait(timeout=10) == -15
+        # The next command doesn't have to wait for this one
+        assert server.command_lock.acquire(timeout=10)
+        server.command_lock.release()
+        assert seen["interrupted"]
+        server.shutdown()
+
+
+def test_docker_client_follows_the_docker_environment(monkeypatch):
+    monkeypatch.setattr(impl, "_docker_clients", {})
+    monkeypatch.setattr(docker, "from_env", lambda: SimpleNamespace(host=os.getenv("DOCKER_HOST")))
+    monkeypatch.delenv("DOCKER_HOST", raising=False)
+    local = impl.get_docker_client()
+    assert impl.get_docker_client() is local
+
+    # As when the server runs a command for a client pointed at another daemon
+    monkeypatch.setenv("DOCKER_HOST", "ssh://builder")
+    assert impl.get_docker_client().host == "ssh://builder"
+    monkeypatch.delenv("DOCKER_HOST")
+    assert impl.get_docker_client() is local
+
+
+def test_socket_is_private(server):
+    assert server.stat().st_mode & 0o077 == 0
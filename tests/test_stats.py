@@ -0,0 +1,72 @@
+"""Recording every run's timings, and `forj stats` reporting on them"""
+
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from forj.cli import main
+from forj.config import config
+from forj.stats import stats
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / ".forjproject").write_text(
+        json.dumps({"name": "my-project", "chart_dir": None, "docker_path": None, "python_module_path": "my_project"})
+    )
+    (tmp_path / ".bumpversion.cfg").write_text("[bumpversion]\ncurrent_version = 1.2.3\n")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv(config.root_env_var, str(tmp_path))
+    monkeypatch.delenv("BRANCH_NAME", raising=False)
+    monkeypatch.setattr(config, "_project", None)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_runs_are_recorded_and_reported(project):
+    runner = CliRunner()
+    for _ in range(3):
+        assert runner.invoke(main, ["version", "get"]).exit_code == 0
+    assert runner.invoke(main, ["stats", "--since", "soon"]).exit_code == 2
+
+    runs = stats.load()
+    assert [(run["command"], run["status"]) for run in runs] == [("forj version get", 0)] * 3 + [("forj stats", 2)]
+    assert {"config", "version"} <= {phase["phase"] for phase in runs[0]["phases"]}
+
+    result = runner.invoke(main, ["stats", "--command", "forj version"])
+    assert result.exit_code == 0, result.output
+    assert "3 run(s) in the last 7d" in result.output
+    assert "forj version get" in result.output and "Phases:" in result.output
+
+
+def test_half_written_lines_are_skipped(project):
+    stats_file = project / ".forj" / stats.stats_file_name
+    stats_file.parent.mkdir()
+    stats_file.write_text('{"at": 1, "command": "forj x", "seconds": 1, "status": 0, "phases": []}\n{"at": 2, "comm')
+    assert [run["command"] for run in stats.load(since=0)] == ["forj x"]
+    assert stats.load(since=1.5) == []
+
+
+def test_the_file_is_rotated_once_it_is_too_big(project, monkeypatch):
+    monkeypatch.setattr(stats, "MAX_STATS_BYTES", 1000)
+    runner = CliRunner()
+    for _ in range(30):
+        assert runner.invoke(main, ["version", "get"]).exit_code == 0
+
+    stats_dir = project / ".forj"
+    assert (stats_dir / "stats.jsonl.1").is_file()
+    assert all(path.stat().st_size <= 2000 for path in stats_dir.glob("stats.jsonl*"))
+    # Only the older runs are gone, and those left are in order
+    runs = stats.load()
+    assert 0 < len(runs) < 30
+    assert [run["at"] for run in runs] == sorted(run["at"] for run in runs)
+
+
+def test_percentiles():
+    values = [float(v) for v in range(1, 101)]
+    assert (stats.percentile(values, 50), stats.percentile(values, 95)) == (50.0, 95.0)
+    assert stats.percentile([3.0], 95) == 3.0
+    assert stats.parse_window("12h") == 12 * 3600
+    with pytest.raises(ValueError):
+        stats.parse_window("a while")
@@ -0,0 +1,31 @@
+"""Span recording and Chrome trace output"""
+
+import json
+import threading
+
+from forj import trace
+
+
+def test_spans_are_recorded_only_while_tracing(tmp_path):
+    with trace.span("ignored", "nothing"):
+        pass
+
+    tracer = trace.start(tmp_path / "trace.json", "forj test")
+    try:
+        with trace.span("outer", "phase a"):
+            with trace.span("inner", "phase b", detail=1):
+                pass
+            worker = threading.Thread(target=trace.traced("threaded", "phase b")(lambda: None))
+            worker.start()
+            worker.join()
+    finally:
+        trace.finish()
+    assert trace.active() is None
+
+    assert sorted(name for name, *_ in tracer.spans) == ["forj test", "inner", "outer", "threaded"]
+    assert tracer.phases()["phase b"][0] == 2
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    inner = next(e for e in events if e["name"] == "inner")
+    assert (inner["cat"], inner["args"]) == ("phase b", {"detail": 1})
+    assert len({e["tid"] for e in events if e["ph"] == "X"}) == 2
@@ -0,0 +1,55 @@
+import os
+from configparser import ConfigParser
+
+from forj.version.util import from_file, read_bumpversioncfg, set_version
+
+
+def test_bumpversioncfg_is_parsed_once_until_it_changes(tmp_path, monkeypatch):
+    cfg = tmp_path / ".bumpversion.cfg"
+    cfg.write_text("[bumpversion]\ncurrent_version = 1.2.3\n")
+    parses = []
+    read_file = ConfigParser.read_file
+    monkeypatch.setattr(ConfigParser, "read_file", lambda self, f: parses.append(f) or read_file(self, f))
+
+    first = read_bumpversioncfg(cfg)
+    assert from_file(cfg) == "1.2.3"
+    assert len(parses) == 1
+
+    # Callers get copies: changing one changes nothing for anyone else
+    first.set("bumpversion", "current_version", "9.9.9")
+    assert read_bumpversioncfg(cfg).get("bumpversion", "current_version") == "1.2.3"
+    assert from_file(cfg) == "1.2.3"
+    assert len(parses) == 1
+
+    mtime = cfg.stat().st_mtime_ns
+    cfg.write_text("[bumpversion]\ncurrent_version = 1.2.4\n")
+    # Same size and inode, so make sure the mtime moves regardless of timestamp granularity
+    os.utime(cfg, ns=(mtime + 1_000_000, mtime + 1_000_000))
+    assert from_file(cfg) == "1.2.4"
+    assert len(parses) == 2
+
+
+def test_set_version_rewrites_only_files_with_the_version(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".bumpversion.cfg").write_text(
+        "[bumpversion]\ncurrent_version = 1.2.3\n\n"
+        "[bumpversion:file:VERSION]\n\n"
+        "[bumpversion:file:setup.py]\nsearch = version=\"{current_version}\"\nreplace = version=\"{new_version}\"\n\n"
+        "[bumpversion:file:README.md]\n"
+    )
+    (tmp_path / "VERSION").write_text("1.2.3\n")
+    (tmp_path / "setup.py").write_bytes(b'setup(\r\n    version="1.2.3",\r\n)\r\n')
+    (tmp_path / "setup.py").chmod(0o750)
+    (tmp_path / "README.md").write_text("No version in here\n")
+    readme_mtime = (tmp_path / "README.md").stat().st_mtime_ns
+
+    changed = set_version("1.3.0", debug=True)
+
+    assert [str(p) for p in changed] == ["VERSION", "setup.py", ".bumpversion.cfg"]
+    assert (tmp_path / "VERSION").read_text() == "1.3.0\n"
+    # Line endings and permissions survive the rewrite
+    assert (tmp_path / "setup.py").read_bytes() == b'setup(\r\n    version="1.3.0",\r\n)\r\n'
+    assert (tmp_path / "setup.py").stat().st_mode & 0o777 == 0o750
+    assert (tmp_path / "README.md").stat().st_mtime_ns == readme_mtime
+    assert from_file() == "1.3.0"
+    assert not list(tmp_path.glob("*.tmp")) and not list(tmp_path.glob(".*.tmp"))
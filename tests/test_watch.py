@@ -0,0 +1,135 @@
+"""Watching files for `--watch`, and working out what to rerun when they change"""
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from forj import watch
+from forj.docker.impl import affected_tests
+from forj.python.python import _watch_runs
+
+
+@pytest.fixture(params=["inotify", "poll"])
+def poll(request, monkeypatch):
+    monkeypatch.setattr(watch, "POLL_INTERVAL", 0.05)
+    return request.param == "poll"
+
+
+def _later(*actions):
+    def run():
+        for action in actions:
+            time.sleep(0.05)
+            action()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_watcher_batches_a_burst_of_changes(tmp_path, monkeypatch, poll):
+    monkeypatch.chdir(tmp_path)
+    Path("src/pkg").mkdir(parents=True)
+    Path("src/pkg/a.py").write_text("a = 1\n")
+    Path("src/.hidden").mkdir()
+
+    with watch.Watcher(["src", ".pylintrc"], debounce=0.3, poll=poll) as watcher:
+        assert watcher.polling == poll
+        thread = _later(
+            lambda: Path("src/pkg/a.py").write_text("a = 2\n"),
+            lambda: Path("src/pkg/b.py").write_text("b = 1\n"),
+            lambda: Path("src/.hidden/c.py").write_text("c = 1\n"),
+            lambda: Path(".pylintrc").write_text("[MASTER]\n"),
+            lambda: Path("unwatched.py").write_text(""),
+        )
+        batch = next(watcher.batches())
+        thread.join()
+
+    assert batch == {Path("src/pkg/a.py"), Path("src/pkg/b.py"), Path(".pylintrc")}
+
+
+def test_watcher_follows_new_directories(tmp_path, monkeypatch, poll):
+    monkeypatch.chdir(tmp_path)
+    Path("src").mkdir()
+
+    with watch.Watcher(["src"], debounce=0.3, poll=poll, include=lambda p: p.suffix == ".py") as watcher:
+        batches = watcher.batches()
+        thread = _later(lambda: Path("src/new").mkdir(), lambda: Path("src/new/x.txt").write_text(""))
+        thread.join()
+        thread = _later(lambda: Path("src/new/x.py").write_text(""))
+        batch = next(batches)
+        thread.join()
+
+    assert batch == {Path("src/new/x.py")}
+
+
+def test_lost_changes_are_a_batch_of_their_own(tmp_path, monkeypatch):
+    with watch.Watcher([tmp_path], debounce=0.05) as watcher:
+
+        def overflow(timeout):
+            # As when inotify's queue overflows
+            watcher.backend.overflowed = True
+            return set()
+
+        monkeypatch.setattr(watcher.backend, "read", overflow)
+        assert next(watcher.batches()) is None
+        assert not watcher.backend.overflowed
+
+
+def test_poller_skips_what_vanishes_mid_scan(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Path("src").mkdir()
+    Path("src/a.py").write_text("")
+    walk_dirs = watch._walk_dirs
+    monkeypatch.setattr(watch, "_walk_dirs", lambda root: [*walk_dirs(root), Path("src/gone")])
+
+    with watch.Watcher(["src"], poll=True) as watcher:
+        assert set(watcher.backend.snapshot) == {Path("src/a.py")}
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    files = {
+        "my_project/__init__.py": "",
+        "my_project/core.py": "",
+        "my_project/api.py": "from my_project.core import thing\n",
+        "my_project/lonely.py": "",
+        "tests/conftest.py": "",
+        "tests/helpers.py": "from my_project import api\n",
+        "tests/test_core.py": "import my_project.core\n",
+        "tests/test_api.py": "from tests.helpers import client\n",
+        "tests/test_other.py": "import os\n",
+    }
+    for name, text in files.items():
+        Path(name).parent.mkdir(parents=True, exist_ok=True)
+        Path(name).write_text(text)
+
+
+def test_affected_tests_follow_imports(tree):
+    assert affected_tests({Path("my_project/core.py")}, "my_project", ["tests"]) == [
+        "tests/test_api.py",
+        "tests/test_core.py",
+    ]
+    assert affected_tests({Path("my_project/api.py")}, "my_project", ["tests"]) == ["tests/test_api.py"]
+    assert affected_tests({Path("tests/test_other.py")}, "my_project", ["tests"]) == ["tests/test_other.py"]
+
+
+def test_affected_tests_falls_back_to_everything(tree):
+    assert affected_tests({Path("tests/conftest.py")}, "my_project", ["tests"]) is None
+    assert affected_tests({Path("my_project/lonely.py")}, "my_project", ["tests"]) is None
+
+
+def test_lint_reruns_everything_only_for_reconfigured_linters(tree):
+    assert _watch_runs({Path("my_project/api.py"), Path("my_project/gone.py")}, ["black", "pylint"], "my_project") == [
+        (["black", "pylint"], ["my_project/api.py"])
+    ]
+    assert _watch_runs({Path(".pylintrc"), Path("my_project/api.py")}, ["black", "pylint"], "my_project") == [
+        (["pylint"], ["my_project/__init__.py", "my_project/api.py", "my_project/core.py", "my_project/lonely.py"]),
+        (["black"], ["my_project/api.py"]),
+    ]
+
+    # Changes were lost: everything, with every linter
+    everything = ["my_project/__init__.py", "my_project/api.py", "my_project/core.py", "my_project/lonely.py"]
+    assert _watch_runs(None, ["black", "pylint"], "my_project") == [(["black", "pylint"], everything)]